@@ -0,0 +1,219 @@
+#генератор нагрузки для эхо-сервера:
+"""Нагрузочный тест эхо-сервера.
+
+Открывает заданное число подключений, в течение заданного времени
+отправляет по каждому сообщения конвейером и печатает JSON с пропускной
+способностью и перцентилями задержки. Примеры запуска из корня репозитория:
+
+    python -m bench.loadgen --backend all --connections 64 --duration 5
+    python -m bench.loadgen --host 127.0.0.1 --port 33333 --framing length
+    python -m bench.loadgen --backend selector --processes 4 --connections 256
+    python -m bench.loadgen --backend all --transport all
+    python -m bench.loadgen --host unix:/tmp/echo.sock --framing length
+
+С --transport all каждый режим замеряется и через TCP, и через Unix-сокет,
+а в строке Unix-сокета поле speedup_vs_tcp показывает, во сколько раз
+он обслуживает больше сообщений в секунду, чем TCP.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import deque
+
+import server
+from framing import FRAMINGS, READ_SIZE, make_framer
+from serverlog import configure_logging
+from transport import UNIX_PREFIX, open_connection
+
+CONNECTIONS = 16   # Число одновременных подключений
+SIZE = 128         # Размер одного сообщения, байт
+DEPTH = 8          # Сколько запросов одно подключение держит без ответа
+DURATION = 3.0     # Длительность замера, секунд
+TRANSPORTS = ("tcp", "unix")
+
+
+def percentile(sorted_values, p):
+    """Перцентиль p (0..100) по уже отсортированному списку, метод ближайшего ранга."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))  # Округление вверх
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies, messages, nbytes, elapsed, errors=0, **params):
+    """Собирает итог замера в словарь, пригодный для сохранения в JSON."""
+    latencies = sorted(latencies)
+    result = dict(params)
+    result.update({
+        "messages": messages,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "msgs_per_sec": round(messages / elapsed, 1) if elapsed else 0.0,
+        "mb_per_sec": round(nbytes / elapsed / 1e6, 3) if elapsed else 0.0,
+        "latency_ms": {
+            name: round(percentile(latencies, p) * 1000, 3)
+            for name, p in (("p50", 50), ("p95", 95), ("p99", 99))
+        },
+    })
+    result["latency_ms"]["max"] = round(latencies[-1] * 1000, 3) if latencies else 0.0
+    return result
+
+
+async def _drive_connection(host, port, payload, depth, framing, deadline, stats):
+    """Нагружает одно подключение до наступления deadline."""
+    framer = make_framer(framing)
+    frame = framer.encode(payload)
+    reader, writer = await open_connection(host, port)
+    sent_at = deque()  # Время отправки запросов, ожидающих ответа
+    window = asyncio.Semaphore(depth)
+
+    async def write():
+        loop = asyncio.get_running_loop()
+        while loop.time() < deadline:
+            await window.acquire()
+            sent_at.append(time.perf_counter())
+            writer.write(frame)
+            if window.locked():
+                await writer.drain()
+        # Сервер ответит на оставшиеся запросы и закроет подключение
+        writer.write_eof()
+
+    writing = asyncio.ensure_future(write())
+    try:
+        while True:
+            chunk = await reader.read(READ_SIZE)
+            if not chunk:
+                if sent_at:
+                    raise ConnectionError("Сервер закрыл соединение")
+                break
+            now = time.perf_counter()
+            for reply in framer.feed(chunk):
+                stats["latencies"].append(now - sent_at.popleft())
+                stats["bytes"] += len(frame) + len(reply)
+                window.release()
+    except (OSError, IndexError):
+        stats["errors"] += 1
+    finally:
+        writing.cancel()
+        writer.close()
+
+
+async def _run(host, port, connections, size, depth, duration, framing):
+    stats = {"latencies": [], "bytes": 0, "errors": 0}
+    payload = b"x" * size
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    deadline = start + duration
+    await asyncio.gather(*(
+        _drive_connection(host, port, payload, depth, framing, deadline, stats)
+        for _ in range(connections)
+    ))
+    elapsed = loop.time() - start
+    return summarize(stats["latencies"], len(stats["latencies"]), stats["bytes"],
+                     elapsed, stats["errors"], connections=connections, size=size,
+                     depth=depth, framing=framing)
+
+
+def run_benchmark(host="127.0.0.1", port=server.PORT, connections=CONNECTIONS,
+                  size=SIZE, depth=DEPTH, duration=DURATION, framing="length"):
+    """Запускает замер против работающего сервера и возвращает итог."""
+    if framing == "raw" and depth > 1:
+        raise ValueError("Без разметки сообщений конвейер невозможен, используйте --depth 1")
+    return asyncio.run(_run(host, port, connections, size, depth, duration, framing))
+
+
+def _serve(backend, framing, processes, host, conn):
+    # Сервер работает в отдельном процессе, чтобы не делить GIL с нагрузкой
+    configure_logging(quiet=True)
+    kwargs = dict(host=host, port=0, backlog=1024, timeout=None,
+                  framing=framing, workers=256)
+    if processes > 1:
+        srv = server.Supervisor(backend, processes, **kwargs)
+        srv.start()
+    else:
+        srv = server.make_server(backend, **kwargs)
+    conn.send(srv.server_address)
+    srv.serve_forever()
+
+
+@contextlib.contextmanager
+def spawn_server(backend, framing, processes=1, transport="tcp"):
+    """Запускает сервер с выбранным режимом в дочернем процессе; возвращает (host, port)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        if transport == "unix":
+            host = UNIX_PREFIX + os.path.join(tmp, "bench.sock")
+        else:
+            host = "127.0.0.1"
+        parent, child = multiprocessing.Pipe()
+        # Не daemon: у супервизора свои дочерние процессы, terminate() остановит их через SIGTERM
+        process = multiprocessing.Process(target=_serve,
+                                          args=(backend, framing, processes, host, child))
+        process.start()
+        try:
+            address = parent.recv()
+            yield host, address[1] if isinstance(address, tuple) else None
+        finally:
+            process.terminate()
+            process.join()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест эхо-сервера")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="адрес IPv4 или IPv6 либо unix:/path.sock для Unix-сокета")
+    parser.add_argument("--port", type=int, default=server.PORT)
+    parser.add_argument("--backend", choices=server.BACKENDS + ("all",),
+                        help="запустить сервер с этим режимом (all - по очереди все); "
+                             "без параметра нагружается уже работающий --host:--port")
+    parser.add_argument("--connections", type=int, default=CONNECTIONS)
+    parser.add_argument("--size", type=int, default=SIZE, help="размер сообщения, байт")
+    parser.add_argument("--depth", type=int, default=DEPTH,
+                        help="число запросов без ответа на одно подключение")
+    parser.add_argument("--duration", type=float, default=DURATION, help="секунд")
+    parser.add_argument("--framing", choices=FRAMINGS, default="length")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="число процессов запускаемого сервера (см. server.py --processes)")
+    parser.add_argument("--transport", choices=TRANSPORTS + ("all",), default="tcp",
+                        help="как подключаться к запускаемому серверу (all - TCP и Unix-сокет)")
+    parser.add_argument("--output", help="файл для JSON с результатами (по умолчанию stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = dict(connections=args.connections, size=args.size, depth=args.depth,
+                  duration=args.duration, framing=args.framing)
+    results = []
+    if args.backend is None:
+        results.append(run_benchmark(args.host, args.port, **params))
+    else:
+        backends = server.BACKENDS if args.backend == "all" else (args.backend,)
+        transports = TRANSPORTS if args.transport == "all" else (args.transport,)
+        for backend in backends:
+            baseline = None
+            for transport in transports:
+                with spawn_server(backend, args.framing, args.processes, transport) as address:
+                    result = run_benchmark(*address, **params)
+                result = dict(backend=backend, processes=args.processes, transport=transport,
+                              **result)
+                if transport == "tcp":
+                    baseline = result["msgs_per_sec"]
+                elif baseline:
+                    result["speedup_vs_tcp"] = round(result["msgs_per_sec"] / baseline, 2)
+                results.append(result)
+
+    report = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
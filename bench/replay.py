@@ -0,0 +1,176 @@
+#воспроизведение записанного трафика:
+"""Воспроизводит запись трафика (server.py --capture) против любого сервера.
+
+Каждое записанное подключение открывается заново в тот же момент от
+первой записи, и его сообщения отправляются по порядку с теми же
+паузами. Скорость задает --speed: 1 - как в записи, N - в N раз быстрее,
+max - без пауз (все подключения открываются сразу, а сообщения идут
+конвейером). Итог печатается в том же JSON, что у bench.loadgen:
+
+    python server.py --framing length --capture traffic.cap
+    python -m bench.replay traffic.cap --port 33333 --speed 4
+
+В режиме raw границы ответов не видны, поэтому задержка не замеряется,
+а подключение ждет, пока сервер ответит на все и закроет его.
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+
+import server
+from bench.loadgen import summarize
+from capture import CLOSE, MESSAGE, read_capture
+from framing import READ_SIZE, make_framer
+from transport import open_connection
+
+
+def parse_speed(value):
+    """Скорость воспроизведения из командной строки: число больше 0 или max (None)."""
+    if value == "max":
+        return None
+    try:
+        speed = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается число или max: {value}") from None
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("скорость должна быть больше 0")
+    return speed
+
+
+class _Session:
+    """Одно записанное подключение: когда открыто, что прислало и когда закрыто."""
+
+    __slots__ = ("start", "messages", "end")
+
+    def __init__(self, start):
+        self.start = start
+        self.messages = []  # (время, сообщение)
+        self.end = None
+
+
+def sessions(records):
+    """Группирует записи по подключениям в порядке их открытия."""
+    result = {}
+    for record in records:
+        # Запись об открытии могла потеряться, если диск не успевал
+        session = result.setdefault(record.connection, _Session(record.time))
+        if record.kind == MESSAGE:
+            session.messages.append((record.time, record.data))
+        elif record.kind == CLOSE:
+            session.end = record.time
+    return list(result.values())
+
+
+async def _sleep_until(when):
+    delay = when - asyncio.get_running_loop().time()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+async def _replay_session(host, port, session, framing, at, stats):
+    """Воспроизводит одно подключение; at(t) - момент цикла событий для времени записи t."""
+    await _sleep_until(at(session.start))
+    framer = make_framer(framing)
+    sent_at = deque()  # Время отправки запросов, ожидающих ответа
+    try:
+        reader, writer = await open_connection(host, port)
+    except OSError:
+        stats["errors"] += 1
+        return
+
+    async def write():
+        for when, payload in session.messages:
+            await _sleep_until(at(when))
+            frame = framer.encode(payload)
+            sent_at.append(time.perf_counter())
+            writer.write(frame)
+            stats["bytes"] += len(frame)
+            await writer.drain()
+        if session.end is not None:
+            await _sleep_until(at(session.end))
+        # Сервер ответит на оставшиеся запросы и закроет подключение
+        writer.write_eof()
+
+    writing = asyncio.ensure_future(write())
+    try:
+        while True:
+            chunk = await reader.read(READ_SIZE)
+            if not chunk:
+                if framing != "raw" and sent_at:
+                    raise ConnectionError("Сервер закрыл соединение")
+                break
+            stats["bytes"] += len(chunk)
+            if framing == "raw":
+                continue
+            now = time.perf_counter()
+            for _ in framer.feed(chunk):
+                stats["latencies"].append(now - sent_at.popleft())
+        await writing
+        stats["messages"] += len(session.messages)
+    except (OSError, IndexError):
+        stats["errors"] += 1
+    finally:
+        writing.cancel()
+        writer.close()
+
+
+async def _run(host, port, framing, captured, speed, origin=0.0):
+    """origin - время первой записи: с него начинается воспроизведение."""
+    stats = {"latencies": [], "messages": 0, "bytes": 0, "errors": 0}
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    if speed is None:
+        def at(t):
+            return start
+    else:
+        def at(t):
+            return start + (t - origin) / speed
+    await asyncio.gather(*(_replay_session(host, port, session, framing, at, stats)
+                           for session in captured))
+    return stats, loop.time() - start
+
+
+def run_replay(path, host="127.0.0.1", port=server.PORT, speed=1.0):
+    """Воспроизводит запись path против работающего сервера и возвращает итог.
+
+    speed - во сколько раз быстрее записи, None - без пауз.
+    """
+    framing, records = read_capture(path)
+    captured = sessions(records)
+    origin = records[0].time if records else 0.0
+    stats, elapsed = asyncio.run(_run(host, port, framing, captured, speed, origin))
+    result = summarize(stats["latencies"], stats["messages"], stats["bytes"], elapsed,
+                       stats["errors"], capture=str(path), framing=framing,
+                       speed="max" if speed is None else speed, connections=len(captured))
+    result["captured_seconds"] = round(records[-1].time - origin, 3) if records else 0.0
+    return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Воспроизведение записанного трафика")
+    parser.add_argument("capture", help="файл записи (server.py --capture)")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="адрес IPv4 или IPv6 либо unix:/path.sock для Unix-сокета")
+    parser.add_argument("--port", type=int, default=server.PORT)
+    parser.add_argument("--speed", type=parse_speed, default=1.0,
+                        help="во сколько раз быстрее записи (1 - как записано); "
+                             "max - без пауз")
+    parser.add_argument("--output", help="файл для JSON с результатом (по умолчанию stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    result = run_replay(args.capture, args.host, args.port, args.speed)
+    report = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
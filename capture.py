@@ -0,0 +1,165 @@
+#запись трафика сервера:
+"""Запись входящих сообщений сервера для воспроизведения (см. bench/replay.py).
+
+Файл записи начинается заголовком (MAGIC, версия, режим разбиения
+сообщений), за которым идут записи: вид (OPEN, MESSAGE, CLOSE), номер
+подключения, время от начала записи в микросекундах, длина данных и
+сами данные. Сообщения пишутся уже разобранными и без сжатия.
+
+Сервер не ждет диска: записи копятся в памяти не больше max_buffer байт
+и сбрасываются в файл отдельным потоком. Если диск не успевает или
+запись в файл не удалась, записи отбрасываются и считаются в dropped.
+"""
+import itertools
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from serverlog import logger
+
+MAGIC = b"ECAP"
+VERSION = 1
+OPEN, MESSAGE, CLOSE = range(3)
+
+BUFFER_BYTES = 4 * 1024 * 1024  # Сколько записей держать в памяти до сброса на диск, байт
+FLUSH_INTERVAL = 0.5            # Как часто сбрасывать записи на диск, секунд
+
+_HEADER = struct.Struct("!4sB8s")  # MAGIC, версия, режим разбиения
+_RECORD = struct.Struct("!BIQI")   # Вид, подключение, микросекунды, длина данных
+
+Record = namedtuple("Record", "kind connection time data")
+
+
+class CaptureError(ValueError):
+    """Файл не является записью трафика или записан другой версией."""
+
+
+class CaptureWriter:
+    """Пишет трафик сервера в файл; методы можно вызывать из любых потоков."""
+
+    def __init__(self, path, framing="raw", max_buffer=BUFFER_BYTES,
+                 flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.records = 0   # Записано (или ждет записи)
+        self.dropped = 0   # Отброшено: буфер переполнен или файл не пишется
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(MAGIC, VERSION, framing.encode("ascii")))
+        self._started = time.perf_counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._chunks = []  # Записи, ждущие сброса на диск
+        self._size = 0
+        self._pending = 0  # Сколько записей в _chunks
+        self._failed = False  # Запись в файл не удалась: новые записи отбрасываются
+        self._closed = False
+        self._thread = threading.Thread(target=self._flush_loop, name="capture", daemon=True)
+        self._thread.start()
+
+    def opened(self):
+        """Учитывает новое подключение и возвращает его номер в записи."""
+        connection = next(self._ids)
+        self._append(OPEN, connection)
+        return connection
+
+    def message(self, connection, data, at=None):
+        """Записывает сообщение; at - когда оно пришло (time.perf_counter(), по умолчанию сейчас)."""
+        self._append(MESSAGE, connection, bytes(data), at)
+
+    def closed(self, connection):
+        self._append(CLOSE, connection)
+
+    def close(self):
+        """Дописывает буфер на диск и закрывает файл."""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        self._thread.join()  # Поток мог уже завершиться из-за ошибки записи
+        if self._file.closed:
+            return
+        try:
+            self._file.close()
+        except OSError:
+            pass  # Ошибку записи уже сообщил _flush_loop
+        if self.dropped:
+            logger.warning("Запись трафика в %s: потеряно %d записей из %d",
+                           self.path, self.dropped, self.records + self.dropped)
+
+    def _append(self, kind, connection, data=b"", at=None):
+        if at is None:
+            at = time.perf_counter()
+        micros = max(0, int((at - self._started) * 1e6))
+        header = _RECORD.pack(kind, connection, micros, len(data))
+        size = len(header) + len(data)
+        with self._lock:
+            if self._closed:
+                return
+            if self._failed or self._size + size > self.max_buffer:
+                self.dropped += 1  # Сервер не ждет диска
+                return
+            self._chunks.append(header)
+            if data:
+                self._chunks.append(data)
+            self._size += size
+            self._pending += 1
+            self.records += 1
+            if self._size >= self.max_buffer // 2:
+                self._wakeup.notify()
+
+    def _flush_loop(self):
+        while True:
+            with self._lock:
+                if not self._closed and self._size < self.max_buffer // 2:
+                    self._wakeup.wait(self.flush_interval)
+                chunks, self._chunks = self._chunks, []
+                pending, self._pending = self._pending, 0
+                self._size = 0
+                closed = self._closed
+            if chunks:
+                try:
+                    self._file.writelines(chunks)
+                    self._file.flush()
+                except OSError as e:
+                    logger.warning("Запись трафика в %s остановлена: %s", self.path, e)
+                    with self._lock:
+                        self._failed = True
+                        # Несохраненные записи тоже потеряны
+                        lost = pending + self._pending
+                        self.records -= lost
+                        self.dropped += lost
+                        self._chunks = []
+                        self._pending = self._size = 0
+                    return
+            if closed:
+                return
+
+
+def read_capture(path):
+    """Читает запись трафика; возвращает режим разбиения и список Record.
+
+    Время записей - секунды от начала записи. Оборванная в конце запись
+    (сервер упал, не дописав файл) пропускается.
+    """
+    with open(path, "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise CaptureError(f"{path}: не запись трафика")
+        magic, version, framing = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise CaptureError(f"{path}: не запись трафика")
+        if version != VERSION:
+            raise CaptureError(f"{path}: неизвестная версия записи {version}")
+        records = []
+        while True:
+            head = f.read(_RECORD.size)
+            if len(head) < _RECORD.size:
+                break
+            kind, connection, micros, size = _RECORD.unpack(head)
+            data = f.read(size)
+            if len(data) < size:
+                break
+            records.append(Record(kind, connection, micros / 1e6, data))
+    return framing.rstrip(b"\0").decode("ascii"), records
@@ -1,26 +1,52 @@
 #код клиента:
+import argparse
+import asyncio
+import json
+import mmap
+import queue
+import selectors
 import socket
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
 
-HOST = "127.0.0.1"  # Адрес сервера
+import compression as _compression
+import transport
+from framing import FRAMINGS, MAX_FRAME_SIZE, READ_SIZE, make_framer
+
+HOST = "127.0.0.1"  # Адрес сервера: IPv4, IPv6 или unix:/path.sock (см. transport)
 PORT = 33333        # Порт сервера
 
-def start_client():
+BUFFER_SIZE = 1024  # Размер порции данных для recv
+CONCURRENCY = 1000  # Сколько подключений run_clients держит одновременно
+IN_FLIGHT = 64      # Сколько запросов send_many отправляет, не дожидаясь ответов
+POOL_SIZE = 8       # Число постоянных подключений в ConnectionPool
+IDLE_CHECK = 1.0    # Через сколько секунд простоя подключение проверяется перед выдачей
+BATCH_SIZE = 1000   # Сколько сообщений send_bulk отправляет через подключение за раз
+
+def start_client(host=HOST, port=PORT):
     # Создаем сокет
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+    family, address = transport.resolve(host, port)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
         try:
             # Устанавливаем соединение с сервером
-            sock.connect((HOST, PORT))
-            print(f"Установлено соединение с сервером {HOST}:{PORT}")
+            sock.connect(address)
+            print(f"Установлено соединение с сервером {transport.format_address(address)}")
 
             # Вводим сообщение с клавиатуры
             message = input("Введите сообщение для отправки серверу: ")
             print(f"Отправка данных серверу: {message}")
 
-            # Отправляем данные серверу
+            # Отправляем данные серверу и сообщаем, что больше данных не будет,
+            # иначе на пустое сообщение сервер никогда не ответит
             sock.sendall(message.encode('utf-8'))
+            sock.shutdown(socket.SHUT_WR)
 
             # Получаем ответ от сервера
-            data = sock.recv(1024)
+            data = sock.recv(BUFFER_SIZE)
             print(f"Получено от сервера: {data.decode('utf-8')}")
 
         except socket.error as e:
@@ -29,5 +55,679 @@ def start_client():
         finally:
             print("Соединение с сервером закрыто")
 
+
+class Client:
+    """Клиент с постоянным подключением к серверу.
+
+    Режим разбиения сообщений (framing) должен совпадать с режимом сервера.
+    compression - алгоритмы сжатия, которые клиент предложит серверу при
+    подключении (например, "zlib" или ("lzma", "zlib")); только для length.
+    Пример:
+
+        with Client(port=33333, framing="length", compression="zlib") as client:
+            reply = client.request(b"hello")
+    """
+
+    def __init__(self, host=HOST, port=PORT, framing="raw",
+                 max_frame_size=MAX_FRAME_SIZE, timeout=None,
+                 compression=None, compress_min_size=_compression.MIN_SIZE):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.framing = framing
+        self.max_frame_size = max_frame_size
+        self.framer = make_framer(framing, max_frame_size)
+        self.compression = _check_compression(compression, framing)
+        self.compress_min_size = compress_min_size
+        self.codec = None  # Сжатие, о котором договорились с сервером
+        self.sock = None
+        self.last_used = time.monotonic()
+        self._received = deque()  # Полученные, но еще не прочитанные ответы
+
+    def connect(self, sock=None):
+        """Подключается к серверу; sock - уже установленное подключение (например, из socket.socketpair())."""
+        if sock is None:
+            sock = transport.connect(self.host, self.port, self.timeout)
+        else:
+            sock.settimeout(self.timeout)
+        if transport.is_inet(sock):
+            # Ответы нужны сразу, а соединение живет долго
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self.sock = sock
+        self.last_used = time.monotonic()
+        self.codec = None
+        if self.compression:
+            self.sock.sendall(self.framer.encode(_compression.offer(self.compression)))
+            self.codec = _compression.accept_offer(self._recv_frame(), self.compress_min_size,
+                                                   self.max_frame_size)
+        return self
+
+    def is_alive(self):
+        """Проверяет, не закрыл ли сервер подключение, не блокируя поток."""
+        if self.sock is None:
+            return False
+        try:
+            data = self.sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+        except BlockingIOError:
+            return True  # Данных нет, но соединение открыто
+        except OSError:
+            return False
+        return bool(data)
+
+    def send(self, data):
+        """Отправляет одно сообщение, не дожидаясь ответа."""
+        self.sock.sendall(self._encode(data))
+
+    def recv(self):
+        """Возвращает следующий ответ сервера."""
+        reply = self._recv_frame()
+        return self.codec.decode(reply) if self.codec is not None else reply
+
+    def _recv_frame(self):
+        while not self._received:
+            nbytes = self.sock.recv_into(self.framer.get_buffer())
+            if not nbytes:
+                raise ConnectionError("Сервер закрыл соединение")
+            self._received.extend(self.framer.buffer_updated(nbytes))
+        return self._received.popleft()
+
+    def _encode(self, data):
+        if self.codec is not None:
+            data = self.codec.encode(data)
+        return self.framer.encode(data)
+
+    def request(self, data):
+        """Отправляет сообщение и возвращает ответ сервера."""
+        self.send(data)
+        return self.recv()
+
+    def send_many(self, messages, in_flight=IN_FLIGHT):
+        """Отправляет сообщения конвейером и возвращает ответы в том же порядке.
+
+        Не ждет ответа на каждое сообщение: одновременно без ответа остается
+        до in_flight запросов, поэтому задержка сети почти не влияет на
+        пропускную способность. Новые запросы копятся в одном буфере и
+        уходят в сокет крупными порциями.
+        """
+        _check_pipelining(self.framing)
+        messages = iter(messages)
+        responses = []
+        outbuf = bytearray()
+        sent = 0
+        exhausted = False
+        sel = selectors.DefaultSelector()
+        self.sock.setblocking(False)
+        try:
+            sel.register(self.sock, selectors.EVENT_READ)
+            while True:
+                # Добираем запросы, пока не заполнено окно
+                while not exhausted and sent - len(responses) < in_flight:
+                    try:
+                        outbuf += self._encode(next(messages))
+                        sent += 1
+                    except StopIteration:
+                        exhausted = True
+                if exhausted and len(responses) == sent:
+                    return responses
+
+                events = selectors.EVENT_READ
+                if outbuf:
+                    events |= selectors.EVENT_WRITE
+                sel.modify(self.sock, events)
+                ready = sel.select(self.timeout)
+                if not ready:
+                    raise socket.timeout("Сервер не ответил вовремя")
+                for _, mask in ready:
+                    if mask & selectors.EVENT_WRITE:
+                        try:
+                            del outbuf[:self.sock.send(outbuf)]
+                        except BlockingIOError:
+                            pass
+                    if mask & selectors.EVENT_READ:
+                        try:
+                            nbytes = self.sock.recv_into(self.framer.get_buffer())
+                        except BlockingIOError:
+                            continue
+                        if not nbytes:
+                            raise ConnectionError("Сервер закрыл соединение")
+                        replies = self.framer.buffer_updated(nbytes)
+                        if self.codec is not None:
+                            replies = [self.codec.decode(reply) for reply in replies]
+                        responses.extend(replies)
+        finally:
+            sel.close()
+            self.sock.settimeout(self.timeout)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class DatagramClient:
+    """Клиент сервера в режиме udp: каждое сообщение - отдельная датаграмма.
+
+    send() отправляет сообщение и не ждет ответа, request() ждет ответ
+    не дольше timeout. Датаграммы могут теряться, поэтому без ответа
+    request() завершается socket.timeout. Пример:
+
+        with DatagramClient(port=33333, timeout=1) as client:
+            client.send(b"cpu=0.5")
+            reply = client.request(b"ping")
+    """
+
+    def __init__(self, host=HOST, port=PORT, timeout=None,
+                 max_datagram=transport.MAX_DATAGRAM):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_datagram = max_datagram
+        self.sock = None
+
+    def connect(self):
+        family, address = transport.resolve(self.host, self.port)
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        try:
+            if family == socket.AF_UNIX:
+                self.sock.bind("")  # Свой адрес, чтобы серверу было куда ответить
+            # Ответы принимаются только от сервера, а отправка не требует адреса
+            self.sock.connect(address)
+        except BaseException:
+            self.close()
+            raise
+        self.sock.settimeout(self.timeout)
+        return self
+
+    def send(self, data):
+        """Отправляет одно сообщение, не дожидаясь ответа."""
+        self.sock.send(data)
+
+    def send_many(self, messages):
+        """Отправляет сообщения подряд, не дожидаясь ответов; возвращает их число."""
+        count = 0
+        for data in messages:
+            self.sock.send(data)
+            count += 1
+        return count
+
+    def recv(self):
+        """Возвращает следующий ответ сервера."""
+        return self.sock.recv(self.max_datagram)
+
+    def request(self, data):
+        """Отправляет сообщение и возвращает ответ сервера."""
+        self.send(data)
+        return self.recv()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncClient:
+    """Асинхронный клиент: одно подключение к серверу на asyncio.
+
+    Пример:
+
+        async with AsyncClient(port=33333) as client:
+            reply = await client.request(b"hello")
+    """
+
+    def __init__(self, host=HOST, port=PORT, framing="raw",
+                 max_frame_size=MAX_FRAME_SIZE, compression=None,
+                 compress_min_size=_compression.MIN_SIZE):
+        self.host = host
+        self.port = port
+        self.framing = framing
+        self.max_frame_size = max_frame_size
+        self.framer = make_framer(framing, max_frame_size)
+        self.compression = _check_compression(compression, framing)
+        self.compress_min_size = compress_min_size
+        self.codec = None
+        self.reader = None
+        self.writer = None
+        self._received = deque()
+
+    async def connect(self):
+        self.reader, self.writer = await transport.open_connection(self.host, self.port)
+        self.codec = None
+        if self.compression:
+            self.writer.write(self.framer.encode(_compression.offer(self.compression)))
+            self.codec = _compression.accept_offer(await self._recv_frame(),
+                                                   self.compress_min_size, self.max_frame_size)
+        return self
+
+    async def request(self, data):
+        """Отправляет данные и возвращает ответ сервера."""
+        self.writer.write(self._encode(data))
+        await self.writer.drain()
+        return await self.recv()
+
+    async def recv(self):
+        """Возвращает следующий ответ сервера."""
+        reply = await self._recv_frame()
+        return self.codec.decode(reply) if self.codec is not None else reply
+
+    async def _recv_frame(self):
+        while not self._received:
+            chunk = await self.reader.read(READ_SIZE)
+            if not chunk:
+                raise ConnectionError("Сервер закрыл соединение")
+            self._received.extend(self.framer.feed(chunk))
+        return self._received.popleft()
+
+    def _encode(self, data):
+        if self.codec is not None:
+            data = self.codec.encode(data)
+        return self.framer.encode(data)
+
+    async def send_many(self, messages, in_flight=IN_FLIGHT):
+        """Асинхронный вариант Client.send_many: конвейер из in_flight запросов."""
+        _check_pipelining(self.framing)
+        window = asyncio.Semaphore(in_flight)
+        sent = asyncio.Queue()  # Отметки об отправленных запросах, None в конце
+
+        async def write():
+            try:
+                for message in messages:
+                    await window.acquire()
+                    self.writer.write(self._encode(message))
+                    sent.put_nowait(True)
+                    # Сбрасываем буфер, только когда окно заполнено
+                    if window.locked():
+                        await self.writer.drain()
+                await self.writer.drain()
+            finally:
+                sent.put_nowait(None)
+
+        async def read():
+            responses = []
+            while await sent.get() is not None:
+                responses.append(await self.recv())
+                window.release()
+            return responses
+
+        writing = asyncio.ensure_future(write())
+        try:
+            responses = await read()
+        except BaseException:
+            writing.cancel()
+            raise
+        await writing  # Пробрасываем ошибку отправки, если она была
+        return responses
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.writer = None
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+def _check_compression(compression, framing):
+    algorithms = _compression.parse_algorithms(compression or ())
+    if algorithms and framing != "length":
+        raise ValueError("Сжатие сообщений работает только в режиме length")
+    return algorithms
+
+
+def _check_pipelining(framing):
+    if framing == "raw":
+        raise ValueError("Конвейерная отправка требует разметки сообщений (length или line)")
+
+
+class ConnectionPool:
+    """Пул постоянных подключений к серверу для нескольких потоков.
+
+    Подключения создаются по мере надобности, но не больше size штук, и
+    после использования возвращаются в пул, поэтому сообщения не платят
+    за установку и закрытие TCP-соединения. Подключение, простоявшее
+    дольше idle_check секунд, перед выдачей проверяется; подключение,
+    на котором произошла ошибка, закрывается и позже создается заново.
+
+        pool = ConnectionPool(port=33333, framing="length")
+        reply = pool.request(b"hello")
+        with pool.connection() as conn:
+            replies = conn.send_many(messages)
+        pool.close()
+    """
+
+    def __init__(self, host=HOST, port=PORT, size=POOL_SIZE, framing="raw",
+                 max_frame_size=MAX_FRAME_SIZE, timeout=None, idle_check=IDLE_CHECK,
+                 compression=None):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.framing = framing
+        self.max_frame_size = max_frame_size
+        self.compression = compression
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self._idle = queue.LifoQueue()  # Свежие подключения выдаются первыми
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def acquire(self):
+        """Выдает подключение; ждет, если все size подключений заняты."""
+        if self._closed:
+            raise RuntimeError("Пул подключений закрыт")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Нет свободных подключений в пуле")
+        try:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if self._healthy(conn):
+                    return conn
+                conn.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """Возвращает подключение в пул; сломанное подключение закрывается."""
+        try:
+            if broken or self._closed or conn._received:
+                conn.close()
+            else:
+                conn.last_used = time.monotonic()
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        """Берет подключение из пула на время блока with."""
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, broken=True)
+            raise
+        self.release(conn)
+
+    def request(self, data, retries=1):
+        """Отправляет сообщение через подключение из пула.
+
+        При сетевой ошибке повторяет запрос на новом подключении.
+        """
+        for attempt in range(retries + 1):
+            try:
+                with self.connection() as conn:
+                    return conn.request(data)
+            except OSError:
+                if attempt == retries:
+                    raise
+
+    def close(self):
+        """Закрывает все свободные подключения; занятые закроются при возврате."""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _connect(self):
+        return Client(self.host, self.port, self.framing, self.max_frame_size,
+                      self.timeout, self.compression).connect()
+
+    def _healthy(self, conn):
+        if time.monotonic() - conn.last_used < self.idle_check:
+            return True
+        return conn.is_alive()
+
+
+class AsyncConnectionPool:
+    """Пул постоянных подключений для корутин (аналог ConnectionPool)."""
+
+    def __init__(self, host=HOST, port=PORT, size=POOL_SIZE, framing="raw",
+                 max_frame_size=MAX_FRAME_SIZE, compression=None):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.framing = framing
+        self.max_frame_size = max_frame_size
+        self.compression = compression
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+        self._closed = False
+
+    async def acquire(self):
+        if self._closed:
+            raise RuntimeError("Пул подключений закрыт")
+        await self._slots.acquire()
+        try:
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.reader.at_eof():
+                    return conn
+                await conn.close()
+            return await AsyncClient(self.host, self.port, self.framing,
+                                     self.max_frame_size, self.compression).connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, conn, broken=False):
+        try:
+            if broken or self._closed or conn._received:
+                await conn.close()
+            else:
+                self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            await self.release(conn, broken=True)
+            raise
+        await self.release(conn)
+
+    async def request(self, data, retries=1):
+        for attempt in range(retries + 1):
+            try:
+                async with self.connection() as conn:
+                    return await conn.request(data)
+            except OSError:
+                if attempt == retries:
+                    raise
+
+    async def close(self):
+        self._closed = True
+        while self._idle:
+            await self._idle.pop().close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+async def run_clients(messages, host=HOST, port=PORT, concurrency=CONCURRENCY,
+                      framing="raw"):
+    """Отправляет каждое сообщение через отдельное подключение.
+
+    Одновременно открыто не больше concurrency подключений; все они
+    обслуживаются одним потоком. Возвращает ответы в порядке сообщений.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(message):
+        async with semaphore:
+            async with AsyncClient(host, port, framing) as client:
+                return await client.request(message)
+
+    return await asyncio.gather(*(one(message) for message in messages))
+
+
+def read_lines(path):
+    """Сообщения из файла, по одному на строку (без перевода строки).
+
+    Файл отображается в память (mmap), а не читается целиком: в памяти
+    оказываются только страницы, которые сейчас разбираются.
+    """
+    with open(path, "rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # Пустой файл нельзя отобразить в память
+    with mm:
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)  # Файл читается один раз от начала до конца
+        start, size = 0, len(mm)
+        while start < size:
+            end = mm.find(b"\n", start)
+            if end < 0:
+                end = size
+            yield mm[start:end]
+            start = end + 1
+
+
+def read_stream(stream):
+    """Сообщения из двоичного потока (например, sys.stdin.buffer), по одному на строку."""
+    for line in stream:
+        yield line[:-1] if line.endswith(b"\n") else line
+
+
+def _batches(messages, size):
+    batch = []
+    for message in messages:
+        batch.append(message)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def send_bulk(messages, output, host=HOST, port=PORT, connections=1, framing="length",
+              in_flight=IN_FLIGHT, batch_size=BATCH_SIZE, timeout=None, compression=None):
+    """Отправляет поток сообщений через пул из connections подключений.
+
+    Сообщения разбиваются на пачки по batch_size, каждая пачка уходит
+    конвейером (send_many) через свободное подключение. Ответы пишутся
+    в двоичный поток output по одному на строку, в порядке сообщений;
+    в памяти одновременно держится не больше 2 * connections пачек.
+    Возвращает сводку: число сообщений, объем данных и скорость.
+    """
+    _check_pipelining(framing)
+    sent = received = count = 0
+    started = time.perf_counter()
+    with ConnectionPool(host, port, connections, framing, timeout=timeout,
+                        compression=compression) as pool, \
+            ThreadPoolExecutor(connections, thread_name_prefix="bulk") as executor:
+
+        def send(batch):
+            with pool.connection() as conn:
+                return conn.send_many(batch, in_flight)
+
+        def write(future):
+            nonlocal received, count
+            for reply in future.result():
+                output.write(reply)
+                output.write(b"\n")
+                received += len(reply)
+                count += 1
+
+        pending = deque()  # Пачки в порядке отправки
+        for batch in _batches(messages, batch_size):
+            sent += sum(len(message) for message in batch)
+            pending.append(executor.submit(send, batch))
+            if len(pending) >= 2 * connections:
+                write(pending.popleft())
+        while pending:
+            write(pending.popleft())
+    output.flush()
+    elapsed = time.perf_counter() - started
+    return {
+        "messages": count,
+        "sent_bytes": sent,
+        "received_bytes": received,
+        "seconds": round(elapsed, 3),
+        "msgs_per_sec": round(count / elapsed, 1) if elapsed else 0.0,
+        "mb_per_sec": round((sent + received) / elapsed / 1e6, 3) if elapsed else 0.0,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Клиент эхо-сервера TCP. Без --file и --stdin отправляет одно "
+                    "сообщение, введенное с клавиатуры.")
+    parser.add_argument("--host", default=HOST,
+                        help='адрес IPv4 или IPv6 либо unix:/path.sock для Unix-сокета')
+    parser.add_argument("--port", type=int, default=PORT, help="для Unix-сокета не используется")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--file", help="отправить сообщения из файла, по одному на строку")
+    source.add_argument("--stdin", action="store_true",
+                        help="отправить сообщения из стандартного ввода, по одному на строку")
+    parser.add_argument("--output", help="файл для ответов (по умолчанию стандартный вывод)")
+    parser.add_argument("--connections", type=int, default=1,
+                        help="число подключений для отправки")
+    parser.add_argument("--framing", choices=FRAMINGS[1:], default="length",
+                        help="разбиение сообщений; должно совпадать с режимом сервера")
+    parser.add_argument("--in-flight", type=int, default=IN_FLIGHT,
+                        help="сколько запросов на подключение отправлять, не дожидаясь ответов")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="сколько сообщений отправлять через подключение за раз")
+    parser.add_argument("--timeout", type=float, help="тайм-аут ответа сервера, секунд")
+    parser.add_argument("--compression",
+                        help="предложить серверу сжатие (например, zlib), только для length")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not (args.file or args.stdin):
+        start_client(args.host, args.port)
+        return
+    messages = read_lines(args.file) if args.file else read_stream(sys.stdin.buffer)
+    output = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        summary = send_bulk(messages, output, args.host, args.port, args.connections,
+                            args.framing, args.in_flight, args.batch_size, args.timeout,
+                            args.compression)
+    finally:
+        if args.output:
+            output.close()
+    # Ответы могут идти в stdout, поэтому сводка печатается в stderr
+    print(json.dumps(summary), file=sys.stderr)
+
+
 if __name__ == "__main__":
-    start_client()
+    main()
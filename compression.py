@@ -0,0 +1,199 @@
+#сжатие сообщений (общее для сервера и клиента):
+"""Сжатие сообщений, о котором клиент и сервер договариваются при подключении.
+
+Работает только в режиме разбиения length: сжатые данные могут содержать
+перевод строки. Клиент первым сообщением отправляет предложение
+
+    OFFER + b"zlib,lzma"
+
+и сервер отвечает ANSWER + выбранный алгоритм (или b"none"). Клиент,
+который ничего не предлагает, работает с сервером как раньше, без сжатия;
+сервер, который ничего не знает о сжатии, вернет эхом само предложение,
+и клиент тоже продолжит без сжатия.
+После договоренности каждое сообщение в обе стороны начинается с байта
+PLAIN или COMPRESSED: сообщения короче min_size не сжимаются.
+
+zlib сжимает все сообщения подключения одним потоком (Z_SYNC_FLUSH после
+каждого), поэтому повторяющиеся между сообщениями данные сжимаются лучше,
+а контекст сжатия не создается заново. Сообщения одного подключения
+должны кодироваться и раскодироваться строго по порядку.
+"""
+import lzma
+import zlib
+
+from framing import MAX_FRAME_SIZE, FrameError, FrameTooLarge
+
+# Такое начало не встречается в обычных сообщениях
+OFFER = b"\x00\xffCOMPRESS? "
+ANSWER = b"\x00\xffCOMPRESS= "
+ALGORITHMS = ("zlib", "lzma")
+MIN_SIZE = 512   # Сообщения короче сжимать невыгодно
+
+PLAIN = b"\x00"
+COMPRESSED = b"\x01"
+
+ZLIB_LEVEL = 6
+LZMA_PRESET = 6
+
+
+class Codec:
+    """Сжатие сообщений одного подключения в обе стороны."""
+
+    name = None
+
+    def __init__(self, min_size=MIN_SIZE, max_size=MAX_FRAME_SIZE):
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def encode(self, payload):
+        """Сообщение с байтом-признаком, сжатое, если оно не короче min_size."""
+        if len(payload) < self.min_size:
+            return PLAIN + payload
+        return COMPRESSED + self._compress(payload)
+
+    def decode(self, data):
+        """Исходное сообщение из полученного."""
+        flag, body = data[:1], memoryview(data)[1:]
+        if flag == PLAIN:
+            return bytes(body)
+        if flag == COMPRESSED:
+            return self._decompress(body)
+        raise FrameError("Неизвестный признак сжатия сообщения")
+
+    def _compress(self, payload):
+        raise NotImplementedError
+
+    def _decompress(self, body):
+        raise NotImplementedError
+
+
+class ZlibCodec(Codec):
+    name = "zlib"
+
+    def __init__(self, min_size=MIN_SIZE, max_size=MAX_FRAME_SIZE, level=ZLIB_LEVEL):
+        super().__init__(min_size, max_size)
+        # Без заголовков zlib (wbits < 0): поток и так живет столько же, сколько подключение
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+    def _compress(self, payload):
+        return self._compressor.compress(payload) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def _decompress(self, body):
+        try:
+            data = self._decompressor.decompress(body, self.max_size + 1)
+        except zlib.error as e:
+            raise FrameError(f"Не удалось распаковать сообщение: {e}") from None
+        if len(data) > self.max_size or self._decompressor.unconsumed_tail:
+            raise FrameTooLarge("Распакованное сообщение больше допустимого размера")
+        return data
+
+
+class LzmaCodec(Codec):
+    """Сильное, но медленное сжатие. Каждое сообщение сжимается отдельно:
+    у LZMACompressor нет сброса буфера без завершения потока."""
+
+    name = "lzma"
+
+    def __init__(self, min_size=MIN_SIZE, max_size=MAX_FRAME_SIZE, preset=LZMA_PRESET):
+        super().__init__(min_size, max_size)
+        self._filters = [{"id": lzma.FILTER_LZMA2, "preset": preset}]
+
+    def _compress(self, payload):
+        return lzma.compress(payload, format=lzma.FORMAT_RAW, filters=self._filters)
+
+    def _decompress(self, body):
+        decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=self._filters)
+        try:
+            data = decompressor.decompress(body, self.max_size + 1)
+        except lzma.LZMAError as e:
+            raise FrameError(f"Не удалось распаковать сообщение: {e}") from None
+        if len(data) > self.max_size:
+            raise FrameTooLarge("Распакованное сообщение больше допустимого размера")
+        return data
+
+
+CODECS = {
+    "zlib": ZlibCodec,
+    "lzma": LzmaCodec,
+}
+
+
+def make_codec(name, min_size=MIN_SIZE, max_size=MAX_FRAME_SIZE):
+    try:
+        return CODECS[name](min_size, max_size)
+    except KeyError:
+        raise ValueError(f"Неизвестный алгоритм сжатия: {name}") from None
+
+
+def parse_algorithms(value):
+    """Список алгоритмов из строки вида "zlib,lzma"; "none" - без сжатия."""
+    if isinstance(value, str):
+        value = [] if value == "none" else value.split(",")
+    algorithms = tuple(name.strip() for name in value if name.strip())
+    for name in algorithms:
+        if name not in CODECS:
+            raise ValueError(f"Неизвестный алгоритм сжатия: {name}")
+    return algorithms
+
+
+def offer(algorithms=ALGORITHMS):
+    """Первое сообщение клиента: какие алгоритмы он поддерживает, в порядке предпочтения."""
+    return OFFER + ",".join(parse_algorithms(algorithms)).encode("ascii")
+
+
+def accept_offer(reply, min_size=MIN_SIZE, max_size=MAX_FRAME_SIZE):
+    """Разбирает ответ сервера на предложение и возвращает Codec или None."""
+    reply = bytes(reply)
+    if not reply.startswith(ANSWER):
+        return None  # Сервер не поддерживает сжатие и ответил на предложение как на сообщение
+    name = reply[len(ANSWER):].decode("ascii", "replace")
+    return None if name == "none" else make_codec(name, min_size, max_size)
+
+
+class ServerCompression:
+    """Договоренность о сжатии на стороне сервера для одного подключения.
+
+    Предложение ожидается только первым сообщением; если его нет,
+    подключение работает без сжатия и дальше сообщения не проверяются.
+    """
+
+    __slots__ = ("algorithms", "min_size", "max_size", "codec", "_first")
+
+    def __init__(self, algorithms=ALGORITHMS, min_size=MIN_SIZE, max_size=MAX_FRAME_SIZE):
+        self.algorithms = algorithms
+        self.min_size = min_size
+        self.max_size = max_size
+        self.codec = None
+        self._first = True
+
+    def incoming(self, data):
+        """Возвращает (сообщение для обработчика, None) или (None, ответ на предложение)."""
+        if self.codec is not None:
+            return self.codec.decode(data), None
+        if self._first:
+            self._first = False
+            if bytes(data[:len(OFFER)]) == OFFER:
+                offered = bytes(data[len(OFFER):]).decode("ascii", "replace").split(",")
+                # Выбираем первый из предложенных клиентом алгоритмов, который знаем сами
+                name = next((n for n in offered if n in self.algorithms), None)
+                if name is not None:
+                    self.codec = make_codec(name, self.min_size, self.max_size)
+                return None, ANSWER + (name or "none").encode("ascii")
+        return data, None
+
+    def outgoing(self, response):
+        """Ответ в виде для отправки (сжатый, если договорились о сжатии)."""
+        if self.codec is None:
+            return response
+        if not isinstance(response, (bytes, bytearray, memoryview)):
+            response = _read_file(response)  # FileResponse сжимаем как обычный ответ
+        return self.codec.encode(response)
+
+
+def _read_file(response):
+    try:
+        response.file.seek(response.offset)
+        return response.file.read(response.remaining)
+    finally:
+        response.close()
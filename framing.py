@@ -0,0 +1,248 @@
+#код разбиения потока на сообщения (общий для сервера и клиента):
+import re
+import struct
+from collections import deque
+
+FRAMINGS = ("raw", "length", "line")
+
+MAX_FRAME_SIZE = 16 * 1024 * 1024  # Максимальный размер одного сообщения, байт
+READ_SIZE = 64 * 1024              # Сколько байт читать из сокета за один вызов
+
+POOL_SIZE = 1024                   # Сколько свободных буферов хранит BufferPool
+
+# Ответ сервера, который не может принять подключение, перед его закрытием
+BUSY_MESSAGE = b"ERROR server busy"
+
+HEADER = struct.Struct("!I")  # Длина сообщения: 4 байта, сетевой порядок
+NEWLINE = re.compile(b"\n")   # re ищет и в memoryview, не копируя данные
+
+
+class FrameError(ValueError):
+    """Нарушен формат потока сообщений."""
+
+
+class FrameTooLarge(FrameError):
+    """Сообщение больше допустимого размера."""
+
+
+class BufferPool:
+    """Запас буферов для чтения из сокетов.
+
+    Подключение берет буфер, только пока читает и разбирает данные, и
+    возвращает его, когда в нем не осталось недочитанного сообщения. Так
+    буферы переиспользуются, а простаивающие подключения не держат память.
+    """
+
+    def __init__(self, size=READ_SIZE, limit=POOL_SIZE):
+        self.size = size
+        self.limit = limit
+        self._free = deque()  # append/pop атомарны, блокировка не нужна
+
+    def acquire(self):
+        try:
+            return self._free.pop()
+        except IndexError:
+            return bytearray(self.size)
+
+    def release(self, buf):
+        # Выросшие под большое сообщение буферы не храним
+        if len(buf) == self.size and len(self._free) < self.limit:
+            self._free.append(buf)
+
+
+class Framer:
+    """Разбивает поток байт на сообщения и упаковывает ответы.
+
+    Данные читаются прямо во внутренний буфер, который переиспользуется
+    между вызовами, без склеивания bytes:
+
+        n = sock.recv_into(framer.get_buffer())
+        for message in framer.buffer_updated(n):
+            ...
+        framer.release()
+
+    С copy=False сообщения возвращаются как memoryview внутри буфера, без
+    копирования; такое сообщение действительно только до следующего вызова
+    get_buffer(), feed() или release().
+
+    Наследники реализуют _parse() и frame().
+    """
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE, pool=None, copy=True):
+        self.max_frame_size = max_frame_size
+        self.pool = pool
+        self.copy = copy
+        self._buf = None
+        self._start = 0  # Начало еще не разобранных данных
+        self._end = 0    # Конец полученных данных
+
+    def get_buffer(self, sizehint=READ_SIZE):
+        """Возвращает свободную часть буфера для recv_into."""
+        if sizehint <= 0:
+            sizehint = READ_SIZE
+        if self._buf is None:
+            self._buf = self.pool.acquire() if self.pool else bytearray(READ_SIZE)
+        if len(self._buf) - self._end < sizehint:
+            pending = self._end - self._start
+            if len(self._buf) - pending >= sizehint:
+                # Места хватит, если сдвинуть неразобранный хвост в начало
+                self._buf[:pending] = self._buf[self._start:self._end]
+            else:
+                # Новый буфер: старый мог остаться занят memoryview сообщений.
+                # Растем вдвое, чтобы большое сообщение не копировалось много раз.
+                buf = bytearray(max(pending + sizehint, 2 * len(self._buf)))
+                buf[:pending] = memoryview(self._buf)[self._start:self._end]
+                self._buf = buf
+            self._start, self._end = 0, pending
+        return memoryview(self._buf)[self._end:]
+
+    def buffer_updated(self, nbytes):
+        """Учитывает nbytes новых байт в буфере и возвращает готовые сообщения."""
+        self._end += nbytes
+        messages = self._parse()
+        if self._start == self._end:
+            self._start = self._end = 0
+        return messages
+
+    def feed(self, data):
+        """Добавляет уже прочитанные данные и возвращает готовые сообщения."""
+        size = len(data)
+        self.get_buffer(size)[:size] = data
+        return self.buffer_updated(size)
+
+    def release(self):
+        """Возвращает буфер в пул, если в нем нет недочитанных данных."""
+        if self.pool is not None and self._buf is not None and self._start == self._end:
+            self.pool.release(self._buf)
+            self._buf = None
+            self._start = self._end = 0
+
+    @property
+    def pending(self):
+        """Сколько байт получено, но еще не сложилось в сообщение."""
+        return self._end - self._start
+
+    def frame(self, payload):
+        """Проверяет ответ и возвращает байты до и после него: (prefix, suffix)."""
+        raise NotImplementedError
+
+    def encode(self, payload):
+        """Упаковывает ответ в одно сообщение."""
+        prefix, suffix = self.frame(payload)
+        return b"".join((prefix, payload, suffix))
+
+    def encode_into(self, out, payload):
+        """Дописывает упакованный ответ в bytearray out без промежуточных копий."""
+        prefix, suffix = self.frame(payload)
+        out += prefix
+        out += payload
+        out += suffix
+
+    def _parse(self):
+        raise NotImplementedError
+
+    def _message(self, begin, end):
+        view = memoryview(self._buf)[begin:end]
+        return bytes(view) if self.copy else view
+
+    def _check_size(self, size):
+        if size > self.max_frame_size:
+            raise FrameTooLarge(
+                f"Сообщение размером {size} байт больше допустимых {self.max_frame_size}")
+
+
+class RawFramer(Framer):
+    """Без разметки: каждая полученная порция данных считается сообщением.
+
+    Так работал исходный сервер; режим оставлен для совместимости
+    с клиентами, которые просто пишут байты в сокет.
+    """
+
+    def frame(self, payload):
+        return b"", b""
+
+    def _parse(self):
+        if self._start == self._end:
+            return []
+        message = self._message(self._start, self._end)
+        self._start = self._end
+        return [message]
+
+
+class LengthPrefixFramer(Framer):
+    """Каждое сообщение предваряется 4-байтовой длиной (big-endian)."""
+
+    def frame(self, payload):
+        self._check_size(len(payload))
+        return HEADER.pack(len(payload)), b""
+
+    def _parse(self):
+        messages = []
+        buf = self._buf
+        while self._end - self._start >= HEADER.size:
+            (size,) = HEADER.unpack_from(buf, self._start)
+            self._check_size(size)
+            begin = self._start + HEADER.size
+            if self._end - begin < size:
+                break
+            messages.append(self._message(begin, begin + size))
+            self._start = begin + size
+        return messages
+
+
+class LineFramer(Framer):
+    """Сообщения разделяются символом перевода строки."""
+
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE, pool=None, copy=True):
+        super().__init__(max_frame_size, pool, copy)
+        self._scanned = 0  # До какого места буфер уже проверен на b"\n"
+
+    def frame(self, payload):
+        self._check_size(len(payload))
+        # Содержимое файла (FileResponse) не проверяется
+        if isinstance(payload, (bytes, bytearray, memoryview)) and NEWLINE.search(payload):
+            raise FrameError("Сообщение в построчном режиме не может содержать перевод строки")
+        return b"", b"\n"
+
+    def get_buffer(self, sizehint=READ_SIZE):
+        # При сдвиге буфера позиция проверки сдвигается вместе с данными
+        offset = self._scanned - self._start
+        view = super().get_buffer(sizehint)
+        self._scanned = self._start + offset
+        return view
+
+    def _parse(self):
+        messages = []
+        buf = self._buf
+        self._scanned = max(self._scanned, self._start)
+        while True:
+            newline = buf.find(b"\n", self._scanned, self._end)
+            if newline < 0:
+                self._scanned = self._end
+                self._check_size(self._end - self._start)
+                break
+            self._check_size(newline - self._start)
+            messages.append(self._message(self._start, newline))
+            self._start = self._scanned = newline + 1
+        return messages
+
+    def buffer_updated(self, nbytes):
+        messages = super().buffer_updated(nbytes)
+        if self._start == 0 and self._end == 0:
+            self._scanned = 0
+        return messages
+
+
+FRAMERS = {
+    "raw": RawFramer,
+    "length": LengthPrefixFramer,
+    "line": LineFramer,
+}
+
+
+def make_framer(framing="raw", max_frame_size=MAX_FRAME_SIZE, pool=None, copy=True):
+    """Создает разборщик сообщений для выбранного режима."""
+    try:
+        return FRAMERS[framing](max_frame_size, pool, copy)
+    except KeyError:
+        raise ValueError(f"Неизвестный режим разбиения сообщений: {framing}") from None
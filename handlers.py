@@ -0,0 +1,483 @@
+#обработчики сообщений сервера:
+"""Обработчики сообщений и цепочки промежуточных звеньев.
+
+Обработчик - это вызываемый объект handler(data, conn), где data - байты
+сообщения, а conn - ConnectionInfo с данными о подключении. Он возвращает
+один из вариантов:
+
+- bytes - готовый ответ;
+- FileResponse - ответ из файла, сервер отправит его через sendfile;
+- concurrent.futures.Future - ответ будет вычислен в другом потоке или процессе
+  (так работает ProcessPoolHandler), цикл ввода-вывода при этом не блокируется;
+- awaitable - асинхронный обработчик, поддерживается только режимом asyncio.
+
+Обычная функция от одного аргумента, как do_something, тоже подходит:
+as_handler() обернет ее. Pipeline собирает обработчик из промежуточных звеньев
+(Middleware) и сам является обработчиком, поэтому цепочки можно вкладывать
+и раздавать через Router по портам или типам сообщений. Обработчик, ответ
+которого зависит только от сообщения, можно пометить @cacheable, и тогда
+ResponseCache будет отвечать на повторные сообщения без его вызова.
+"""
+import hashlib
+import importlib
+import inspect
+import itertools
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+
+CHECKSUM_SIZE = 4  # CRC32 в конце сообщения
+CACHE_KEY_SIZE = 16         # Размер хеша сообщения - ключа кэша, байт
+CACHE_ENTRY_OVERHEAD = 128  # Примерный расход памяти на запись кэша сверх самого ответа
+
+
+class HandlerError(Exception):
+    """Обработчик не смог обработать сообщение; соединение будет закрыто."""
+
+
+class ChecksumError(HandlerError, ValueError):
+    """Контрольная сумма сообщения не совпала."""
+
+
+class ConnectionInfo:
+    """Сведения о подключении, которые получает обработчик."""
+
+    __slots__ = ("id", "peer", "local", "started", "extra")
+
+    _ids = itertools.count(1)
+
+    def __init__(self, peer, local):
+        self.id = next(self._ids)
+        self.peer = peer        # Адрес клиента
+        self.local = local      # Адрес сервера, на который пришло подключение
+        self.started = time.monotonic()
+        self.extra = {}         # Место для данных обработчиков
+
+    @property
+    def port(self):
+        """Порт сервера, принявшего подключение (None для Unix-сокета)."""
+        return self.local[1] if isinstance(self.local, tuple) else None
+
+    def __repr__(self):
+        return f"ConnectionInfo(id={self.id}, peer={self.peer}, local={self.local})"
+
+
+class FileResponse:
+    """Ответ из файла: сервер отправляет его через sendfile, не читая в память.
+
+    file - путь или открытый в двоичном режиме файл; отправляются count байт,
+    начиная с offset (по умолчанию до конца файла). Файл, открытый по пути,
+    сервер закроет после отправки; переданный открытым закрывает вызывающий.
+    Промежуточные звенья Pipeline такой ответ не преобразуют.
+    """
+
+    def __init__(self, file, offset=0, count=None):
+        self._owned = isinstance(file, (str, os.PathLike))
+        self.file = open(file, "rb") if self._owned else file
+        if count is None:
+            count = os.fstat(self.file.fileno()).st_size - offset
+        self.offset = offset
+        self.count = count
+        self.remaining = count  # Сколько байт еще не отправлено
+
+    def __len__(self):
+        return self.count
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def advance(self, nbytes):
+        """Учитывает nbytes отправленных байт."""
+        self.offset += nbytes
+        self.remaining -= nbytes
+
+    def close(self):
+        if self._owned:
+            self.file.close()
+
+    def __repr__(self):
+        name = getattr(self.file, "name", self.file)
+        return f"FileResponse({name!r}, offset={self.offset}, count={self.count})"
+
+
+def load_handler(spec, reload=False):
+    """Загружает обработчик по строке вида "модуль:имя", например "server:do_something".
+
+    Если по этому имени лежит фабрика без аргументов, которая собирает
+    обработчик (например, Pipeline), укажите "модуль:имя()". С reload уже
+    загруженный модуль загружается заново, чтобы подхватить изменения в коде.
+    """
+    module_name, _, attr = spec.partition(":")
+    if not module_name or not attr:
+        raise ValueError(f"Обработчик задается как модуль:имя, получено: {spec}")
+    call = attr.endswith("()")
+    module = importlib.import_module(module_name)
+    if reload:
+        module = importlib.reload(module)
+    obj = getattr(module, attr[:-2] if call else attr)
+    return as_handler(obj() if call else obj)
+
+
+def as_handler(func):
+    """Приводит функцию вида func(data) или func(data, conn) к обработчику."""
+    if isinstance(func, (Pipeline, Router, ProcessPoolHandler, ResponseCache)):
+        return func
+    try:
+        params = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return func
+    positional = [p for p in params
+                  if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD, p.VAR_POSITIONAL)]
+    if len(positional) == 1 and positional[0].kind != positional[0].VAR_POSITIONAL:
+        return _DataHandler(func)
+    return func
+
+
+class _DataHandler:
+    """Обработчик из функции func(data), которой не нужно подключение.
+
+    Класс, а не замыкание, чтобы обработчик передавался в процессы
+    Supervisor и там, где их запускают через spawn или forkserver.
+    """
+
+    def __init__(self, func):
+        self.__dict__.update(getattr(func, "__dict__", {}))  # Например, пометка cacheable
+        self.func = func
+        self.__name__ = getattr(func, "__name__", "handler")
+
+    def __call__(self, data, conn):
+        return self.func(data)
+
+
+class StageStats:
+    """Число вызовов и время работы одного звена цепочки."""
+
+    __slots__ = ("count", "total", "max", "_lock")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {"count": self.count, "total": self.total, "max": self.max,
+                    "avg": self.total / self.count if self.count else 0.0}
+
+
+class Middleware:
+    """Звено цепочки: преобразует запрос до обработчика и ответ после него."""
+
+    @property
+    def name(self):
+        return type(self).__name__
+
+    def before(self, data, conn):
+        return data
+
+    def after(self, response, conn):
+        return response
+
+
+class Transform(Middleware):
+    """Звено из двух произвольных функций над байтами."""
+
+    def __init__(self, before=None, after=None, name="Transform"):
+        self._before = before
+        self._after = after
+        self._name = name
+
+    @property
+    def name(self):
+        return self._name
+
+    def before(self, data, conn):
+        return self._before(data) if self._before else data
+
+    def after(self, response, conn):
+        return self._after(response) if self._after else response
+
+
+class Checksum(Middleware):
+    """Проверяет и снимает CRC32 в конце запроса, добавляет CRC32 к ответу."""
+
+    def before(self, data, conn):
+        if len(data) < CHECKSUM_SIZE:
+            raise ChecksumError("Сообщение короче контрольной суммы")
+        body, tail = data[:-CHECKSUM_SIZE], data[-CHECKSUM_SIZE:]
+        if zlib.crc32(body).to_bytes(CHECKSUM_SIZE, "big") != tail:
+            raise ChecksumError("Контрольная сумма сообщения не совпала")
+        return body
+
+    def after(self, response, conn):
+        return response + zlib.crc32(response).to_bytes(CHECKSUM_SIZE, "big")
+
+
+class Zlib(Middleware):
+    """Распаковывает запрос и сжимает ответ zlib."""
+
+    def __init__(self, level=6):
+        self.level = level
+
+    def before(self, data, conn):
+        try:
+            return zlib.decompress(data)
+        except zlib.error as e:
+            raise HandlerError(f"Не удалось распаковать сообщение: {e}") from None
+
+    def after(self, response, conn):
+        return zlib.compress(response, self.level)
+
+
+class Pipeline:
+    """Обработчик из цепочки промежуточных звеньев и конечного обработчика.
+
+    Запрос проходит before() звеньев по порядку, затем обработчик, затем
+    ответ проходит after() в обратном порядке. Время каждого этапа
+    учитывается в stats().
+    """
+
+    def __init__(self, handler, middlewares=(), timed=True):
+        self.handler = as_handler(handler)
+        self.middlewares = list(middlewares)
+        self.timed = timed
+        self.handler_name = getattr(handler, "__name__", type(handler).__name__)
+        # Кэшировать ответы цепочки можно, если можно кэшировать ответы ее обработчика
+        self.cacheable = getattr(self.handler, "cacheable", False)
+        self._stats = {name: StageStats() for name in self.stage_names()}
+
+    def stage_names(self):
+        names = [f"{m.name}.before" for m in self.middlewares]
+        names.append(self.handler_name)
+        names.extend(f"{m.name}.after" for m in reversed(self.middlewares))
+        return names
+
+    def stats(self):
+        """Статистика по этапам: число вызовов и время (total/avg/max, секунды)."""
+        return {name: stage.snapshot() for name, stage in self._stats.items()}
+
+    def __call__(self, data, conn):
+        timed = self.timed
+        for m in self.middlewares:
+            if timed:
+                started = time.perf_counter()
+                data = m.before(data, conn)
+                self._stats[f"{m.name}.before"].add(time.perf_counter() - started)
+            else:
+                data = m.before(data, conn)
+
+        started = time.perf_counter()
+        result = self.handler(data, conn)
+        if isinstance(result, Future):
+            chained = Future()
+
+            def done(future):
+                if timed:
+                    self._stats[self.handler_name].add(time.perf_counter() - started)
+                try:
+                    chained.set_result(self._after(future.result(), conn))
+                except BaseException as e:
+                    chained.set_exception(e)
+
+            result.add_done_callback(done)
+            return chained
+        if inspect.isawaitable(result):
+            return self._after_async(result, conn, started)
+        if timed:
+            self._stats[self.handler_name].add(time.perf_counter() - started)
+        return self._after(result, conn)
+
+    async def _after_async(self, awaitable, conn, started):
+        response = await awaitable
+        if self.timed:
+            self._stats[self.handler_name].add(time.perf_counter() - started)
+        return self._after(response, conn)
+
+    def _after(self, response, conn):
+        for m in reversed(self.middlewares):
+            if self.timed:
+                started = time.perf_counter()
+                response = m.after(response, conn)
+                self._stats[f"{m.name}.after"].add(time.perf_counter() - started)
+            else:
+                response = m.after(response, conn)
+        return response
+
+
+class Router:
+    """Выбирает обработчик по ключу сообщения или подключения.
+
+    key(data, conn) возвращает ключ, по которому в routes ищется обработчик;
+    если ключа нет, используется default.
+    """
+
+    def __init__(self, routes, key, default=None):
+        self.routes = {k: as_handler(h) for k, h in routes.items()}
+        self.key = key
+        self.default = as_handler(default) if default is not None else None
+
+    @classmethod
+    def by_port(cls, routes, default=None):
+        """Обработчик для каждого порта сервера."""
+        return cls(routes, lambda data, conn: conn.port, default)
+
+    @classmethod
+    def by_prefix(cls, routes, separator=b" ", default=None):
+        """Тип сообщения - его начало до separator: b"UPPER hello" -> b"UPPER"."""
+        return cls(routes, lambda data, conn: bytes(data).partition(separator)[0], default)
+
+    def __call__(self, data, conn):
+        handler = self.routes.get(self.key(data, conn), self.default)
+        if handler is None:
+            raise HandlerError("Нет обработчика для сообщения")
+        return handler(data, conn)
+
+
+class ProcessPoolHandler:
+    """Выполняет тяжелую функцию func(data) в пуле процессов.
+
+    Возвращает Future, поэтому поток ввода-вывода не ждет результата.
+    func должна быть функцией верхнего уровня модуля (ее передают в процесс
+    через pickle).
+    """
+
+    def __init__(self, func, workers=None):
+        self.func = func
+        self.__name__ = getattr(func, "__name__", "ProcessPoolHandler")
+        self._pool = ProcessPoolExecutor(max_workers=workers)
+
+    def __call__(self, data, conn):
+        return self._pool.submit(self.func, bytes(data))
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+
+
+def cacheable(func):
+    """Помечает обработчик, ответ которого зависит только от сообщения.
+
+    Ответы такого обработчика можно брать из ResponseCache. Обработчик,
+    которому важен conn (например, адрес клиента), помечать нельзя.
+    """
+    func.cacheable = True
+    return func
+
+
+class ResponseCache:
+    """Кэш ответов перед обработчиком: LRU с ограничением по объему и времени жизни.
+
+    Ключ - хеш сообщения (BLAKE2b), поэтому само сообщение в кэше не
+    хранится. Когда объем ответов превышает max_bytes (или записей больше
+    max_entries), вытесняются давно не использованные; записи старше ttl
+    секунд считаются устаревшими. Кэшируются только ответы-байты, в том
+    числе полученные через Future или корутину; FileResponse не кэшируется.
+    """
+
+    def __init__(self, handler, max_bytes, ttl=None, max_entries=None):
+        self.handler = as_handler(handler)
+        self.__name__ = getattr(handler, "__name__", type(handler).__name__)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # Ключ -> (ответ, когда устареет)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __call__(self, data, conn):
+        key = hashlib.blake2b(data, digest_size=CACHE_KEY_SIZE).digest()
+        response = self.get(key)
+        if response is not None:
+            return response
+        result = self.handler(data, conn)
+        if isinstance(result, Future):
+            result.add_done_callback(lambda future: self._store_future(key, future))
+            return result
+        if inspect.isawaitable(result):
+            return self._store_async(key, result)
+        return self.put(key, result)
+
+    def get(self, key):
+        """Ответ из кэша или None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, response):
+        """Сохраняет ответ и возвращает его (копию, если это был memoryview)."""
+        if not isinstance(response, (bytes, bytearray, memoryview)):
+            return response
+        response = bytes(response)  # Ответ мог ссылаться на буфер чтения
+        size = len(response) + CACHE_ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return response
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (response, expires)
+            self._bytes += size
+            while (self._bytes > self.max_bytes
+                   or (self.max_entries is not None and len(self._entries) > self.max_entries)):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return response
+
+    def _remove(self, key):
+        response, _ = self._entries.pop(key)
+        self._bytes -= len(response) + CACHE_ENTRY_OVERHEAD
+
+    def _store_future(self, key, future):
+        if not future.cancelled() and future.exception() is None:
+            self.put(key, future.result())
+
+    async def _store_async(self, key, awaitable):
+        return self.put(key, await awaitable)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Попадания, промахи, вытеснения, устаревшие записи и текущий объем."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "expirations": self.expirations,
+                    "entries": len(self._entries), "bytes": self._bytes,
+                    "hit_ratio": self.hits / lookups if lookups else 0.0}
+
+
+def resolve(result):
+    """Ответ обработчика для блокирующего кода: ждет Future, запрещает корутины."""
+    if isinstance(result, Future):
+        return result.result()
+    if inspect.isawaitable(result):
+        if hasattr(result, "close"):
+            result.close()
+        raise HandlerError("Асинхронный обработчик поддерживается только в режиме asyncio")
+    return result
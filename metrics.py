@@ -0,0 +1,333 @@
+#метрики сервера:
+"""Счетчики и гистограммы сервера.
+
+ServerMetrics собирает число подключений, объем данных, число сообщений
+и время работы обработчика. snapshot() возвращает их словарем (удобно
+в тестах и из кода), render() - в текстовом формате Prometheus, который
+MetricsServer отдает по HTTP на отдельном локальном порту:
+
+    curl http://127.0.0.1:9100/metrics
+"""
+import bisect
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from timers import TIMEOUTS
+from tracing import STAGES
+
+METRICS_HOST = "127.0.0.1"  # Метрики по умолчанию доступны только локально
+POLL_INTERVAL = 0.05  # Как быстро HTTP-сервер метрик замечает остановку, секунд
+PREFIX = "server"
+DATAGRAM_QUEUES = ("receive", "reply")  # Где теряются датаграммы в режиме UDP
+
+# Границы корзин гистограммы времени обработчика, секунд
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Начало struct tcp_info (Linux): 8 однобайтовых полей, затем rto, ato,
+# snd_mss, rcv_mss, unacked, sacked. У слушающего сокета unacked - число
+# подключений в очереди accept, sacked - ее предел (backlog).
+_TCP_INFO = struct.Struct("8B6I")
+
+
+def accept_queue(sock):
+    """Длина очереди accept слушающего сокета и ее предел или None, если ОС не сообщает."""
+    if not hasattr(socket, "TCP_INFO"):
+        return None
+    try:
+        info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, _TCP_INFO.size)
+    except OSError:
+        return None
+    fields = _TCP_INFO.unpack_from(info)
+    return fields[12], fields[13]
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами, как в Prometheus.
+
+    Не потокобезопасна сама по себе: ее защищает блокировка ServerMetrics.
+    """
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # Последняя корзина - +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self):
+        """Пары (граница, число значений не больше нее), последняя граница - inf."""
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, q):
+        """Оценка квантиля q (0..1): верхняя граница корзины, в которую он попал."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, total in self.cumulative():
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+class ServerMetrics:
+    """Метрики одного сервера; методы можно вызывать из любых потоков."""
+
+    def __init__(self, backlog=None):
+        self.backlog = backlog
+        self.listen_socket = None  # Для длины очереди accept
+        self.cache = None          # ResponseCache, если кэш ответов включен
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self.active = 0
+        self.accepted = 0
+        self.closed = 0
+        self.timed_out = 0
+        self.timeouts = dict.fromkeys(TIMEOUTS, 0)  # Закрытые по тайм-ауту, по видам
+        self.rejected = 0
+        self.paused = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.messages = 0
+        self.latency = Histogram()
+        # Режим UDP: датаграммы больше предела и потерянные в очередях приема и ответов
+        self.datagrams_oversized = 0
+        self.datagrams_dropped = dict.fromkeys(DATAGRAM_QUEUES, 0)
+        self.stages = None  # Гистограммы этапов по tracing.STAGES, если трассировка включена
+
+    def connection_opened(self):
+        with self._lock:
+            self.active += 1
+            self.accepted += 1
+
+    def connection_closed(self, timed_out=False):
+        """timed_out - вид тайм-аута из timers.TIMEOUTS, если подключение закрыто по нему."""
+        with self._lock:
+            self.active -= 1
+            self.closed += 1
+            if timed_out:
+                self.timed_out += 1
+                if timed_out in self.timeouts:
+                    self.timeouts[timed_out] += 1
+
+    def connection_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def read_paused(self):
+        """Чтение подключения приостановлено: клиент не забирает ответы."""
+        with self._lock:
+            self.paused += 1
+
+    def message(self, bytes_in, bytes_out, latency=None):
+        """Учитывает обработанное сообщение; latency - время обработчика, секунд."""
+        with self._lock:
+            self.messages += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            if latency is not None:
+                self.latency.observe(latency)
+
+    def enable_stages(self):
+        """Включает гистограммы этапов; уже собранные значения сохраняются."""
+        with self._lock:
+            if self.stages is None:
+                self.stages = {name: Histogram() for name in STAGES}
+
+    def stage(self, name, seconds):
+        """Учитывает длительность этапа name из tracing.STAGES."""
+        with self._lock:
+            if self.stages is not None:
+                self.stages[name].observe(seconds)
+
+    def datagram_oversized(self):
+        with self._lock:
+            self.datagrams_oversized += 1
+
+    def datagrams_lost(self, queue, count=1):
+        """Учитывает датаграммы, потерянные в очереди queue ("receive" или "reply")."""
+        with self._lock:
+            self.datagrams_dropped[queue] += count
+
+    def snapshot(self):
+        """Текущие значения метрик словарем."""
+        queue = accept_queue(self.listen_socket) if self.listen_socket is not None else None
+        cache = self.cache.stats() if self.cache is not None else None
+        with self._lock:
+            uptime = time.monotonic() - self.started
+            stages = None
+            if self.stages is not None:
+                stages = {name: {"count": hist.count,
+                                 "sum": hist.sum,
+                                 "buckets": hist.cumulative(),
+                                 "p50": hist.quantile(0.5),
+                                 "p99": hist.quantile(0.99)}
+                          for name, hist in self.stages.items()}
+            return {
+                "uptime": uptime,
+                "connections_active": self.active,
+                "connections_accepted": self.accepted,
+                "connections_closed": self.closed,
+                "connections_timed_out": self.timed_out,
+                "timeouts": dict(self.timeouts),
+                "connections_rejected": self.rejected,
+                "read_pauses": self.paused,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "messages": self.messages,
+                "messages_per_sec": self.messages / uptime if uptime else 0.0,
+                "handler_latency": {
+                    "count": self.latency.count,
+                    "sum": self.latency.sum,
+                    "buckets": self.latency.cumulative(),
+                    "p50": self.latency.quantile(0.5),
+                    "p99": self.latency.quantile(0.99),
+                },
+                "accept_queue": {
+                    "length": queue[0] if queue else None,
+                    "limit": queue[1] if queue else self.backlog,
+                    # Доля занятой очереди: близко к 1 - новые подключения отбрасываются
+                    "saturation": queue[0] / queue[1] if queue and queue[1] else None,
+                },
+                "cache": cache,
+                "datagrams": {
+                    "oversized": self.datagrams_oversized,
+                    "dropped": dict(self.datagrams_dropped),
+                },
+                "stages": stages,
+            }
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus (версия 0.0.4)."""
+        snap = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, value):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            if value is not None:
+                lines.append(f"{PREFIX}_{name} {value}")
+
+        metric("uptime_seconds", "gauge", "Секунд с запуска сервера.",
+               f"{snap['uptime']:.3f}")
+        metric("connections_active", "gauge", "Открытые подключения клиентов.",
+               snap["connections_active"])
+        metric("connections_accepted_total", "counter", "Принятые подключения.",
+               snap["connections_accepted"])
+        metric("connections_closed_total", "counter", "Закрытые подключения.",
+               snap["connections_closed"])
+        metric("connections_timed_out_total", "counter",
+               "Подключения, закрытые по тайм-ауту.", snap["connections_timed_out"])
+        metric("connection_timeouts_total", "counter",
+               "Подключения, закрытые по тайм-ауту, по видам тайм-аута.", None)
+        for kind, count in snap["timeouts"].items():
+            lines.append(f'{PREFIX}_connection_timeouts_total{{kind="{kind}"}} {count}')
+        metric("connections_rejected_total", "counter",
+               "Подключения, отклоненные из-за перегрузки.", snap["connections_rejected"])
+        metric("read_pauses_total", "counter",
+               "Паузы чтения из-за неотправленных ответов.", snap["read_pauses"])
+        metric("received_bytes_total", "counter", "Получено байт в сообщениях клиентов.",
+               snap["bytes_in"])
+        metric("sent_bytes_total", "counter", "Отправлено байт в ответах.", snap["bytes_out"])
+        metric("messages_total", "counter", "Обработано сообщений.", snap["messages"])
+        datagrams = snap["datagrams"]
+        metric("datagrams_oversized_total", "counter",
+               "Датаграммы больше допустимого размера (режим UDP).", datagrams["oversized"])
+        metric("datagrams_dropped_total", "counter",
+               "Потерянные датаграммы по очередям (режим UDP).", None)
+        for queue, count in datagrams["dropped"].items():
+            lines.append(f'{PREFIX}_datagrams_dropped_total{{queue="{queue}"}} {count}')
+
+        latency = snap["handler_latency"]
+        metric("handler_latency_seconds", "histogram", "Время работы обработчика, секунд.", None)
+        for bound, total in latency["buckets"]:
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{PREFIX}_handler_latency_seconds_bucket{{le="{le}"}} {total}')
+        lines.append(f"{PREFIX}_handler_latency_seconds_sum {latency['sum']}")
+        lines.append(f"{PREFIX}_handler_latency_seconds_count {latency['count']}")
+        if snap["stages"] is not None:
+            metric("stage_seconds", "histogram",
+                   "Длительность этапов обработки сообщений, секунд (трассировка).", None)
+            for name, stage in snap["stages"].items():
+                for bound, total in stage["buckets"]:
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{name}",le="{le}"}} {total}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{name}"}} {stage["sum"]}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{name}"}} {stage["count"]}')
+
+        queue = snap["accept_queue"]
+        if queue["length"] is not None:
+            metric("accept_queue_length", "gauge",
+                   "Подключения в очереди accept.", queue["length"])
+        if queue["limit"] is not None:
+            metric("accept_queue_limit", "gauge", "Размер очереди accept (backlog).", queue["limit"])
+        if queue["saturation"] is not None:
+            metric("accept_queue_saturation", "gauge",
+                   "Доля занятой очереди accept.", f"{queue['saturation']:.3f}")
+        cache = snap["cache"]
+        if cache is not None:
+            metric("cache_hits_total", "counter", "Ответы из кэша.", cache["hits"])
+            metric("cache_misses_total", "counter", "Промахи кэша.", cache["misses"])
+            metric("cache_evictions_total", "counter", "Вытесненные из кэша ответы.",
+                   cache["evictions"])
+            metric("cache_expirations_total", "counter", "Устаревшие записи кэша.",
+                   cache["expirations"])
+            metric("cache_entries", "gauge", "Записей в кэше.", cache["entries"])
+            metric("cache_bytes", "gauge", "Объем кэша, байт.", cache["bytes"])
+        return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Опросы метрик в журнал не пишем
+
+
+class MetricsServer:
+    """HTTP-сервер метрик в отдельном потоке."""
+
+    def __init__(self, metrics, host=METRICS_HOST, port=0):
+        self._httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.metrics = metrics
+        self._thread = None
+
+    @property
+    def server_address(self):
+        return self._httpd.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever,
+                                        args=(POLL_INTERVAL,), name="metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+        self._httpd.server_close()
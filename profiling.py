@@ -0,0 +1,87 @@
+#профиль работающего сервера:
+"""Снимок профиля работающего сервера без перезапуска.
+
+Profiler.start() в отдельном потоке заданное время опрашивает стеки
+всех потоков процесса (sys._current_frames) и пишет их в файл в
+формате "свернутых стеков": строка - поток и цепочка функций через ";",
+затем число попаданий. Файл читают flamegraph.pl, speedscope и
+подобные инструменты. В отличие от cProfile, который до Python 3.12
+видит только вызвавший его поток, опрос стеков охватывает и рабочие
+потоки, и цикл событий, а сервер при этом почти не замедляется.
+Сервер запускает профиль по сигналу SIGUSR1.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILE_SECONDS = 10.0   # Длительность снимка профиля, секунд
+SAMPLE_INTERVAL = 0.005  # Пауза между опросами стеков, секунд
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds, interval=SAMPLE_INTERVAL):
+    """Опрашивает стеки всех потоков, кроме текущего; возвращает Counter свернутых стеков."""
+    own = threading.get_ident()
+    counts = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def write_folded(counts, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in counts.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """Снимает профиль процесса в фоне; одновременно идет не больше одного снимка."""
+
+    def __init__(self, directory=".", seconds=PROFILE_SECONDS, interval=SAMPLE_INTERVAL,
+                 log=None):
+        self.directory = directory
+        self.seconds = seconds
+        self.interval = interval
+        self.log = log
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Начинает снимок и возвращает путь будущего файла или None, если снимок уже идет."""
+        if self.running:
+            return None
+        name = time.strftime("profile-%Y%m%d-%H%M%S") + f"-{os.getpid()}.folded"
+        path = os.path.join(self.directory, name)
+        self._thread = threading.Thread(target=self._run, args=(path,), name="profiler",
+                                        daemon=True)
+        self._thread.start()
+        return path
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self, path):
+        write_folded(sample_stacks(self.seconds, self.interval), path)
+        if self.log is not None:
+            self.log.info("Профиль записан в %s", path)
@@ -1,54 +1,1831 @@
 #код сервера:
+import argparse
+import asyncio
+import errno
+import inspect
+import itertools
+import json
+import multiprocessing
+import multiprocessing.connection
+import os
+import selectors
+import signal
 import socket
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
 
-HOST = ""  # Пустая строка означает, что сервер будет слушать все доступные интерфейсы
+from framing import (BUSY_MESSAGE, FRAMINGS, MAX_FRAME_SIZE, READ_SIZE, BufferPool, FrameError,
+                     make_framer)
+from capture import BUFFER_BYTES, CaptureWriter
+from compression import ALGORITHMS, MIN_SIZE, ServerCompression, parse_algorithms
+from handlers import (ConnectionInfo, FileResponse, HandlerError, ResponseCache, as_handler,
+                      load_handler, resolve)
+from metrics import METRICS_HOST, MetricsServer, ServerMetrics
+from profiling import PROFILE_SECONDS, Profiler
+from serverlog import LEVELS, ConnectionLog, configure_logging, logger, payload_sampler, preview
+from timers import TIMEOUTS, TimerWheel, deadline
+from tracing import ConnectionTrace
+from transport import MAX_DATAGRAM, create_listener, describe, remove_unix_socket, unix_path
+
+# Пустая строка означает, что сервер будет слушать все доступные интерфейсы IPv4;
+# "::" - IPv6, "unix:/path.sock" - Unix-сокет (см. transport)
+HOST = ""
 PORT = 33333
 
-TYPE = socket.AF_INET
-PROTOCOL = socket.SOCK_STREAM
+BACKLOG = 5          # Очередь из 5 подключений, в лекции сказано, что 1 мало
+TIMEOUT = 5.0        # Тайм-аут ожидания данных от клиента, секунд (None - без ограничения)
+WORKERS = 16         # Число рабочих потоков в режиме "threads"
+LOG_PAYLOADS = 0     # Сколько сообщений в секунду записывать в журнал целиком (уровень DEBUG)
+IOV_MAX = 1024       # Сколько буферов передавать в один вызов sendmsg
+MAX_CONNECTIONS = None  # Сколько клиентов обслуживать одновременно (None - без ограничения)
+HIGH_WATER = 1024 * 1024  # Неотправленных байт на подключение, после которых чтение приостанавливается
+LOW_WATER = 256 * 1024    # ... и до которых должно опуститься, чтобы чтение возобновилось
+MAX_PENDING = 1024   # Сколько ответов из других потоков может ждать одно подключение
+CACHE_BYTES = 0      # Объем кэша ответов, байт (0 - кэш выключен)
+PROCESSES = 1        # Число процессов сервера (больше 1 - запуск через Supervisor)
+RESTART_DELAY = 1.0  # Пауза перед перезапуском процесса, упавшего сразу после старта
+STOP_TIMEOUT = 5.0   # Сколько ждать завершения процессов при остановке, секунд
+DRAIN_TIMEOUT = 10.0  # Сколько по SIGTERM ждать ответов на уже присланные сообщения, секунд
+DATAGRAM_BATCH = 64   # Сколько датаграмм вычитывать подряд, пока сокет не опустеет
+REPLY_QUEUE = 1024    # Сколько ответов-датаграмм может ждать, пока ядро их примет
+
+BACKENDS = ("threads", "selector", "asyncio")  # Режимы для потоковых подключений (TCP, Unix)
+DATAGRAM = "udp"  # Режим датаграмм: каждое сообщение - отдельная датаграмма
+
+# Процессы Supervisor создаются через fork, где он есть: так они наследуют
+# загруженный обработчик и настройки без повторного импорта
+MP_CONTEXT = multiprocessing.get_context(
+    "fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+
+# Счетчик датаграмм, которые ядро отбросило из-за переполненной очереди приема
+# (в модуле socket константы нет, значение из <asm-generic/socket.h>)
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40 if sys.platform.startswith("linux") else None)
+
+# Настройки, которые можно менять на ходу (reconfigure() и SIGHUP)
+RELOADABLE = ("handler", "timeout", "handshake_timeout", "read_timeout", "idle_timeout",
+              "write_timeout", "max_connections", "high_water", "low_water",
+              "log_payloads", "drain_timeout", "trace")
+
+# Причины закрытия подключения по тайм-аутам (см. timers.TIMEOUTS)
+TIMEOUT_REASONS = {
+    "handshake": "нет первого сообщения",
+    "read": "сообщение не дослано",
+    "idle": "нет данных",
+    "write": "клиент не забирает ответы",
+}
+
 
 def do_something(data):
     """Пример функции для обработки данных."""
     return data  # Просто возвращаем данные (эхо-сервер)
 
-# Создаем сокет
-srv = socket.socket(TYPE, PROTOCOL)
-srv.bind((HOST, PORT))
-srv.listen(5)  # Очередь из 5 подключений, в лекции сказано, что 1 мало
-print(f"Сервер запущен и слушает порт {PORT}")
 
-try:
-    while True:
-        print("Ожидание подключения клиента...")
-        sock, addr = srv.accept()
-        print(f"Подключен клиент: {addr}")
+def log_handler_error(addr, error):
+    """Пишет в журнал ошибку обработчика; возвращает причину закрытия соединения."""
+    if isinstance(error, HandlerError):
+        logger.warning("Ошибка обработки сообщения от клиента %s: %s", addr, error)
+    else:
+        logger.error("Ошибка обработчика для клиента %s", addr, exc_info=error)
+    return "ошибка обработчика"
+
+
+def send_buffers(sock, buffers):
+    """Отправляет буферы блокирующим сокетом без склеивания (sendmsg, он же writev)."""
+    buffers = deque(memoryview(b) for b in buffers if len(b))
+    if not hasattr(sock, "sendmsg"):  # Windows
+        sock.sendall(b"".join(buffers))
+        return
+    while buffers:
+        sent = sock.sendmsg(list(itertools.islice(buffers, IOV_MAX)))
+        # Отправленное целиком убираем, от частично отправленного берем хвост
+        while sent:
+            if sent >= len(buffers[0]):
+                sent -= len(buffers.popleft())
+            else:
+                buffers[0] = buffers[0][sent:]
+                sent = 0
+
+
+def send_file(sock, response):
+    """Отправляет FileResponse блокирующим сокетом (sendfile, где он есть)."""
+    try:
+        sent = sock.sendfile(response.file, response.offset, response.remaining)
+    finally:
+        response.close()
+    if sent < response.remaining:
+        raise OSError(f"Файл ответа короче заявленного: {response!r}")
+
+
+def send_file_chunk(sock, response):
+    """Отправляет часть FileResponse неблокирующим сокетом; возвращает число байт."""
+    if hasattr(os, "sendfile"):
+        sent = os.sendfile(sock.fileno(), response.fileno(), response.offset, response.remaining)
+    else:
+        response.file.seek(response.offset)
+        sent = sock.send(response.file.read(min(READ_SIZE, response.remaining)))
+    if not sent:
+        raise OSError(f"Файл ответа короче заявленного: {response!r}")
+    response.advance(sent)
+    return sent
+
+
+def reject_connection(sock, frame, metrics):
+    """Быстрый отказ перегруженного сервера: сообщение об ошибке и закрытие подключения."""
+    metrics.connection_rejected()
+    try:
+        # Не ждем: если клиент не готов принять ответ, просто закрываем
+        sock.send(frame, getattr(socket, "MSG_DONTWAIT", 0))
+    except OSError:
+        pass
+    sock.close()
+    logger.debug("Подключение отклонено: сервер перегружен")
+
+
+def owned(data):
+    """Копия данных, если это memoryview в чужом буфере, иначе сами данные."""
+    return bytes(data) if isinstance(data, memoryview) else data
+
+
+def resolve_timeouts(timeout, handshake=None, read=None, idle=None, write=None):
+    """Тайм-ауты по видам, секунд: None - как timeout, 0 - без ограничения.
+
+    handshake - от подключения до первого сообщения, read - пауза внутри
+    сообщения, idle - пауза между сообщениями, write - сколько клиент
+    может не забирать ответы.
+    """
+    values = dict(handshake=handshake, read=read, idle=idle, write=write)
+    return {kind: timeout if values[kind] is None else (values[kind] or None)
+            for kind in TIMEOUTS}
+
+
+def timeout_reason(kind, timeouts):
+    timeout = timeouts[kind]
+    return f"{TIMEOUT_REASONS[kind]} {timeout:g} с" if timeout else TIMEOUT_REASONS[kind]
+
+
+def shutdown_socket(sock, how):
+    """shutdown() сокета, который клиент мог уже закрыть."""
+    try:
+        sock.shutdown(how)
+    except OSError:
+        pass
+
 
+def read_config(path):
+    """Настройки из JSON-файла; ключи - имена из RELOADABLE."""
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    unknown = set(config) - set(RELOADABLE)
+    if unknown:
+        raise ValueError(f"Эти настройки нельзя задать в файле: {', '.join(sorted(unknown))}")
+    if not config.get("timeout", True):
+        config["timeout"] = None  # 0 - как в командной строке, без ограничения
+    return config
+
+
+def load_settings(config=None, handler=None):
+    """Настройки для reconfigure(): файл config и обработчик handler ("модуль:имя").
+
+    Модуль обработчика загружается заново, поэтому по SIGHUP подхватываются
+    и изменения в его коде. Обработчик из файла важнее handler.
+    """
+    settings = read_config(config) if config else {}
+    spec = settings.get("handler", handler)
+    if spec:
+        settings["handler"] = load_handler(spec, reload=True)
+    return settings
+
+
+def reload_server(server, loader):
+    """Применяет настройки loader() к серверу; при ошибке сервер работает со старыми."""
+    try:
+        server.reconfigure(**loader())
+    except Exception:
+        logger.exception("Не удалось перечитать настройки, сервер работает со старыми")
+
+
+def create_server_socket(host=HOST, port=PORT, backlog=BACKLOG, reuse_port=False, listen=True,
+                         type=socket.SOCK_STREAM):
+    """Создает слушающий сокет сервера: TCP (IPv4/IPv6) или Unix, потоковый или датаграмм.
+
+    С reuse_port на тот же порт могут встать сокеты других процессов
+    (SO_REUSEPORT), и ядро распределяет подключения между ними.
+    """
+    return create_listener(host, port, backlog, reuse_port, listen, type)
+
+
+class BaseServer:
+    """Общая часть серверов: слушающий сокет, запуск и остановка.
+
+    Наследники реализуют метод _serve(), который обслуживает подключения
+    до вызова shutdown().
+    """
+
+    def __init__(self, host=HOST, port=PORT, handler=do_something,
+                 backlog=BACKLOG, timeout=TIMEOUT,
+                 framing="raw", max_frame_size=MAX_FRAME_SIZE,
+                 log_payloads=LOG_PAYLOADS, zero_copy=False, metrics_port=None,
+                 sock=None, reuse_port=False, max_connections=MAX_CONNECTIONS,
+                 high_water=HIGH_WATER, low_water=LOW_WATER,
+                 cache_bytes=CACHE_BYTES, cache_ttl=None,
+                 compression=ALGORITHMS, compress_min_size=MIN_SIZE,
+                 drain_timeout=DRAIN_TIMEOUT, handshake_timeout=None, read_timeout=None,
+                 idle_timeout=None, write_timeout=None, trace=False, capture=None,
+                 capture_buffer=BUFFER_BYTES):
+        self.handler = as_handler(handler)
+        self.backlog = backlog
+        # Общий тайм-аут и отдельные по видам (см. resolve_timeouts)
+        self.timeout = timeout
+        self.handshake_timeout = handshake_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.write_timeout = write_timeout
+        self._update_timeouts()
+        # Тайм-ауты всех подключений на одном колесе
+        self._timers = TimerWheel()
+        self.framing = framing
+        self.max_frame_size = max_frame_size
+        self.log_payloads = log_payloads
+        # С zero_copy обработчик получает memoryview в буфере чтения, который
+        # действителен только до возврата из обработчика
+        self.zero_copy = zero_copy
+        self._pool = BufferPool()  # Буферы чтения, общие для всех подключений
+        # Сжатие, если клиент его предложит (только в режиме length)
+        self.compression = parse_algorithms(compression)
+        self.compress_min_size = compress_min_size
+        self.max_connections = max_connections
+        self.high_water = high_water
+        self.low_water = min(low_water, high_water)
+        self._connections = 0
+        self._connections_lock = threading.Lock()
+        self._connections_changed = threading.Condition(self._connections_lock)
+        self.drain_timeout = drain_timeout
+        self._draining = False  # Новые подключения не принимаются, старые дослуживаются
+        self._deadline = None   # Когда закрыть подключения, не дождавшись ответов
+        # Заодно проверяем режим до запуска
+        self._busy_frame = make_framer(framing, max_frame_size).encode(BUSY_MESSAGE)
+        # sock - уже открытый слушающий сокет (например, общий для нескольких процессов)
+        self.srv = sock if sock is not None else create_server_socket(host, port, backlog,
+                                                                      reuse_port)
+        # Файл Unix-сокета удаляет тот, кто его создал
+        self._unix_path = unix_path(host) if sock is None else None
+        self.metrics = ServerMetrics(backlog)
+        self.metrics.listen_socket = self.srv
+        # Трассировка этапов сообщений (см. tracing); включается и на ходу
+        self.trace = trace
+        if trace:
+            self.metrics.enable_stages()
+        # Запись сообщений клиентов в файл capture для bench/replay.py
+        self.capture = None
+        if capture:
+            self.capture = CaptureWriter(capture, framing, capture_buffer)
+            logger.info("Трафик записывается в %s", capture)
+        self.cache_bytes = cache_bytes
+        self.cache_ttl = cache_ttl
+        if cache_bytes:
+            self._enable_cache(cache_bytes, cache_ttl)
+        # Метрики по HTTP отдаются, только если задан порт (0 - любой свободный)
+        self.metrics_server = None
+        if metrics_port is not None:
+            self.metrics_server = MetricsServer(self.metrics, METRICS_HOST, metrics_port)
+        # Пара сокетов, чтобы разбудить цикл ожидания при остановке
+        self._waker_r, self._waker_w = socket.socketpair()
+        self._stopped = threading.Event()
+        # Установлено, когда serve_forever() начал обслуживать подключения
+        self.ready = threading.Event()
+        self._sampler = payload_sampler(self.log_payloads)
+
+    @property
+    def server_address(self):
+        """Адрес, на котором фактически слушает сервер (полезно при port=0)."""
+        return self.srv.getsockname()
+
+    def serve_forever(self):
+        """Обслуживает клиентов до вызова shutdown()."""
+        logger.info("Сервер запущен и слушает %s", describe(self.server_address))
+        self._start_metrics()
+        try:
+            self._serve()
+        finally:
+            self.server_close()
+            logger.info("Сервер завершил работу")
+
+    def _start_metrics(self):
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+            logger.info("Метрики доступны на http://%s:%s/metrics",
+                        *self.metrics_server.server_address[:2])
+
+    def server_close(self):
+        """Закрывает сокеты сервера; serve_forever() вызывает его сам при остановке."""
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+        self.srv.close()
+        if self._unix_path is not None:
+            remove_unix_socket(self._unix_path)
+            self._unix_path = None
+        if self.capture is not None:
+            self.capture.close()
+        self._waker_r.close()
+        self._waker_w.close()
+
+    def shutdown(self, drain=False):
+        """Просит сервер остановиться; безопасно вызывать из другого потока.
+
+        С drain сервер сразу перестает принимать подключения, но до
+        drain_timeout секунд дает клиентам получить ответы на уже присланные
+        сообщения; подключение закрывается, как только ответов не ждет.
+        """
+        if not self._stopped.is_set():
+            self._deadline = time.monotonic() + (self.drain_timeout if drain else 0)
+            self._stopped.set()
+            try:
+                self._waker_w.send(b"\0")
+            except OSError:
+                pass
+
+    def reconfigure(self, **settings):
+        """Меняет настройки работающего сервера, не разрывая подключений.
+
+        Принимает имена из RELOADABLE. Новый обработчик и лимиты действуют
+        со следующего сообщения, новые тайм-аут и границы буфера отправки
+        (high_water, low_water) - в режиме asyncio для новых подключений,
+        трассировка - для новых подключений.
+        """
+        unknown = set(settings) - set(RELOADABLE)
+        if unknown:
+            raise ValueError(f"Эти настройки нельзя менять на ходу: {', '.join(sorted(unknown))}")
+        names = ", ".join(sorted(settings))
+        if "handler" in settings:
+            self.handler = as_handler(settings.pop("handler"))
+            self.metrics.cache = None
+            if self.cache_bytes:
+                self._enable_cache(self.cache_bytes, self.cache_ttl)  # Старые ответы не годятся
+        for name, value in settings.items():
+            setattr(self, name, value)
+        self._update_timeouts()
+        self.low_water = min(self.low_water, self.high_water)
+        if "log_payloads" in settings:
+            self._sampler = payload_sampler(self.log_payloads)
+        if self.trace:
+            self.metrics.enable_stages()
+        logger.info("Настройки сервера обновлены: %s", names)
+
+    def _serve(self):
+        raise NotImplementedError
+
+    def _update_timeouts(self):
+        self._timeouts = resolve_timeouts(self.timeout, self.handshake_timeout,
+                                          self.read_timeout, self.idle_timeout,
+                                          self.write_timeout)
+
+    def _make_trace(self, accepted=None):
+        return ConnectionTrace(self.metrics, accepted) if self.trace else None
+
+    def _make_framer(self):
+        return make_framer(self.framing, self.max_frame_size, self._pool, not self.zero_copy)
+
+    def _make_compression(self):
+        # Сервер отвечает на предложение сжатия, даже если сам сжатие не поддерживает
+        if self.framing != "length":
+            return None
+        return ServerCompression(self.compression, self.compress_min_size, self.max_frame_size)
+
+    def _enable_cache(self, cache_bytes, cache_ttl):
+        # Ответ обработчика может зависеть не только от сообщения, поэтому кэш
+        # включается только для обработчиков, помеченных @cacheable
+        if not getattr(self.handler, "cacheable", False):
+            logger.warning("Обработчик %s не помечен как cacheable, кэш ответов не используется",
+                           getattr(self.handler, "__name__", self.handler))
+            return
+        self.handler = ResponseCache(self.handler, cache_bytes, cache_ttl)
+        self.metrics.cache = self.handler
+
+    def _admit(self, sock):
+        """Учитывает новое подключение или отклоняет его, если достигнут max_connections."""
+        with self._connections_lock:
+            if self.max_connections is None or self._connections < self.max_connections:
+                self._connections += 1
+                return True
+        reject_connection(sock, self._busy_frame, self.metrics)
+        return False
+
+    def _leave(self):
+        with self._connections_changed:
+            self._connections -= 1
+            self._connections_changed.notify_all()
+
+
+class ThreadPoolServer(BaseServer):
+    """Сервер, обслуживающий клиентов в пуле из ограниченного числа потоков.
+
+    Каждое подключение целиком обслуживает один рабочий поток, поэтому
+    медленный клиент занимает только свой поток, а не весь сервер.
+    Если все потоки заняты, новые подключения ждут в очереди пула.
+    Тайм-ауты чтения отслеживает поток приема подключений по колесу
+    таймеров: истекшее подключение он закрывает через shutdown(), и recv
+    в рабочем потоке возвращается. Отправка ограничена тайм-аутом сокета.
+    """
+
+    def __init__(self, *args, workers=WORKERS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.workers = workers
+        # Сокеты обслуживаемых подключений -> ждет ли поток нового сообщения.
+        # Отдельные ключи меняют только потоки своих подключений (под GIL).
+        self._clients = {}
+        self._expired = {}  # Сокет -> вид тайм-аута, по которому его закрыли
+
+    def _serve(self):
+        # Неблокирующий accept: подключение из общего сокета мог забрать другой процесс
+        self.srv.setblocking(False)
+        sel = selectors.DefaultSelector()
+        sel.register(self.srv, selectors.EVENT_READ)
+        sel.register(self._waker_r, selectors.EVENT_READ)
+        with ThreadPoolExecutor(max_workers=self.workers,
+                                thread_name_prefix="client") as pool:
+            self.ready.set()
+            try:
+                while not self._stopped.is_set():
+                    # Таймеры взводят рабочие потоки, поэтому, пока есть подключения,
+                    # просыпаемся на каждый тик колеса
+                    timeout = self._timers.tick if self._connections else None
+                    for key, _ in sel.select(timeout):
+                        if key.fileobj is not self.srv:
+                            continue
+                        try:
+                            sock, addr = self.srv.accept()
+                        except BlockingIOError:
+                            continue
+                        # Подключения сверх лимита не ждут свободного потока, а сразу получают отказ
+                        if self._admit(sock):
+                            pool.submit(self._handle_client, sock, addr, time.perf_counter())
+                    self._expire()
+            finally:
+                sel.close()
+                self._drain()
+
+    def _expire(self):
+        for sock, kind in self._timers.advance():
+            if sock in self._clients:
+                self._expired[sock] = kind
+                shutdown_socket(sock, socket.SHUT_RDWR)
+
+    def _drain(self):
+        """Ждет до self._deadline, пока потоки дослужат подключения, и закрывает оставшиеся."""
+        self.srv.close()  # Новые подключения больше не принимаются
+        self._draining = True
+        # Поток простаивающего подключения ждет в recv: shutdown будит его, и recv
+        # отдает то, что клиент уже прислал, а затем 0
+        for sock, idle in list(self._clients.items()):
+            if idle:
+                shutdown_socket(sock, socket.SHUT_RD)
+        with self._connections_changed:
+            while self._connections:
+                remaining = self._deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._connections_changed.wait(remaining)
+        for sock in list(self._clients):
+            shutdown_socket(sock, socket.SHUT_RDWR)
+
+    def serve_connection(self, sock, addr=None):
+        """Обслуживает уже установленное подключение в текущем потоке.
+
+        Нужен, чтобы проверять обработчик без сети, через socket.socketpair().
+        Тайм-ауты чтения срабатывают, только пока работает serve_forever().
+        """
+        if self._admit(sock):
+            self._handle_client(sock, addr if addr is not None else sock.getsockname())
+
+    def _handle_client(self, sock, addr, accepted=None):
+        """Обслуживает одного клиента до его отключения (блокирующий режим).
+
+        accepted - момент accept (time.perf_counter()) для трассировки.
+        """
+        log = ConnectionLog(addr, self._sampler, self.metrics, self.capture)
+        trace = self._make_trace(accepted)
+        info = ConnectionInfo(addr, sock.getsockname())
+        framer = self._make_framer()
+        compression = self._make_compression()
+        reason = "клиент отключился"
+        timed_out = False
+        connected = last_activity = time.monotonic()
+        greeted = False  # Получено ли первое сообщение
         try:
-            sock.settimeout(5.0)  # Устанавливаем тайм-аут для операций с клиентом
             while True:
-                try:
-                    data = sock.recv(1024)  # Получаем данные от клиента
-                    if not data:
-                        print(f"Клиент {addr} отключился")
+                # Тайм-аут сокета ограничивает отправку; тайм-аутами чтения ведает колесо.
+                # Он мог измениться через reconfigure().
+                write_timeout = self._timeouts["write"]
+                if sock.gettimeout() != write_timeout:
+                    sock.settimeout(write_timeout)
+                idle = framer.pending == 0
+                self._clients[sock] = idle
+                if self._draining and idle:
+                    # Сервер останавливается: отвечаем только на то, что клиент уже прислал
+                    reason = "остановка сервера"
+                    sock.setblocking(False)
+                    try:
+                        nbytes = sock.recv_into(framer.get_buffer())
+                    except BlockingIOError:
                         break
-                    print(f"Получено от {addr}: {data.decode('utf-8')}")
+                    finally:
+                        sock.settimeout(write_timeout)
+                else:
+                    timer = deadline(self._timeouts, connected, last_activity, greeted, not idle)
+                    if timer is not None:
+                        self._timers.schedule(sock, timer[1], timer[0])
+                    try:
+                        # Получаем данные от клиента прямо в буфер разборщика
+                        nbytes = sock.recv_into(framer.get_buffer())
+                    except socket.timeout:
+                        continue  # Тайм-аут отправки к чтению не относится
+                    finally:
+                        self._timers.cancel(sock)
+                self._clients[sock] = False
+                if not nbytes:
+                    if self._draining:
+                        reason = "остановка сервера"
+                    break
+                last_activity = time.monotonic()
+                now = time.perf_counter()  # Когда пришла порция: для трассировки и записи
+                if trace is not None:
+                    trace.received(now)
+                messages = framer.buffer_updated(nbytes)
+                if messages:
+                    greeted = True
+                # Ответы на все сообщения из одной порции отправляем одним вызовом,
+                # не копируя их в общий буфер
+                out = []
+                for data in messages:
+                    if compression is not None:
+                        data, reply = compression.incoming(data)
+                        if reply is not None:  # Ответ на предложение сжатия
+                            out.append(framer.encode(reply))
+                            continue
+                    if trace is not None:
+                        trace.framed(now)
+                    log.received(data, now)
+                    started = time.perf_counter()
+                    response = resolve(self.handler(data, info))  # Обрабатываем данные
+                    latency = time.perf_counter() - started
+                    log.message(data, response, latency)
+                    if trace is not None:
+                        trace.handled(latency)
+                    if compression is not None:
+                        response = compression.outgoing(response)
+                    prefix, suffix = framer.frame(response)
+                    out.append(prefix)
+                    if isinstance(response, FileResponse):
+                        send_buffers(sock, out)
+                        out = []
+                        send_file(sock, response)
+                    else:
+                        out.append(response)
+                    out.append(suffix)
+                send_buffers(sock, out)  # Отправляем данные обратно клиенту
+                framer.release()
+                if trace is not None:
+                    trace.sent(time.perf_counter())
+                    trace.settled(framer.pending)
 
-                    # Обрабатываем данные
-                    response = do_something(data)
-                    sock.sendall(response)  # Отправляем данные обратно клиенту
-                    print(f"Отправлено {addr}: {response.decode('utf-8')}")
+        except socket.timeout:
+            reason = timeout_reason("write", self._timeouts)
+            timed_out = "write"
 
-                except socket.timeout:
-                    print(f"Клиент {addr} не отправил данные в течение 5 секунд")
-                    break
+        except FrameError as e:
+            reason = "ошибка формата"
+            logger.warning("Ошибка формата данных от клиента %s: %s", addr, e)
+
+        except OSError as e:
+            reason = "ошибка сокета"
+            if sock not in self._expired:
+                logger.warning("Ошибка при работе с клиентом %s: %s", addr, e)
+
+        except Exception as e:
+            reason = log_handler_error(addr, e)
 
         finally:
+            self._clients.pop(sock, None)
+            self._timers.cancel(sock)
+            kind = self._expired.pop(sock, None)
+            if kind is not None:
+                reason = timeout_reason(kind, self._timeouts)
+                timed_out = kind
             sock.close()
-            print(f"Соединение с клиентом {addr} закрыто")
+            framer.release()
+            self._leave()
+            log.closed(reason, timed_out)
+
+
+class _Connection:
+    """Состояние одного клиента в режиме "selector"."""
+
+    __slots__ = ("sock", "addr", "info", "framer", "compression", "log", "out", "out_size",
+                 "pending", "last_activity", "greeted", "eof", "paused", "closed", "trace",
+                 "events")
+
+    def __init__(self, sock, addr, framer, log, compression=None, trace=None):
+        self.sock = sock
+        self.addr = addr
+        self.info = ConnectionInfo(addr, sock.getsockname())
+        self.framer = framer
+        self.compression = compression
+        self.log = log
+        # Неотправленные ответы: bytearray с упакованными ответами и FileResponse
+        self.out = deque()
+        self.out_size = 0    # Сколько байт в out (без файлов)
+        # Ответы, которые еще считаются в другом потоке:
+        # [ответ или None, запрос, время обработчика или момент его вызова].
+        # Отправляются строго по порядку запросов.
+        self.pending = deque()
+        self.last_activity = time.monotonic()
+        self.greeted = False  # Получено ли первое сообщение
+        self.eof = False     # Клиент больше ничего не пришлет
+        self.paused = False  # Чтение приостановлено, пока клиент не заберет ответы
+        self.closed = False
+        self.trace = trace   # ConnectionTrace, если трассировка включена
+        self.events = 0      # События, которых сокет ждет в селекторе (0 - снят с учета)
+
+
+class SelectorServer(BaseServer):
+    """Однопоточный сервер на цикле событий selectors (epoll/kqueue/select).
+
+    Все сокеты неблокирующие: цикл читает данные только из готовых сокетов,
+    а неотправленный ответ копит в буфере подключения и досылает, когда
+    сокет снова готов к записи. Если клиент не забирает ответы и в буфере
+    накопилось больше high_water байт, чтение от него приостанавливается
+    до опустошения буфера до low_water. Тайм-ауты всех подключений ведет
+    одно колесо таймеров. Обработчик вызывается в том же потоке,
+    поэтому он должен быть быстрым; тяжелую работу стоит отдавать
+    обработчику, возвращающему Future (например, ProcessPoolHandler) -
+    цикл продолжит обслуживать других клиентов, пока ответ считается.
+    """
+
+    def _serve(self):
+        self._sel = sel = selectors.DefaultSelector()
+        self._done = deque()  # Завершенные Future: (подключение, ячейка, future)
+        self._conns = set()   # Открытые подключения, в том числе снятые с учета селектора
+        self.srv.setblocking(False)
+        self._waker_r.setblocking(False)
+        sel.register(self.srv, selectors.EVENT_READ)
+        sel.register(self._waker_r, selectors.EVENT_READ)
+        self.ready.set()
+        try:
+            while True:
+                if self._stopped.is_set():
+                    if not self._connections or time.monotonic() >= self._deadline:
+                        break
+                    if not self._draining:
+                        self._start_drain()
+                        continue
+                for key, events in sel.select(timeout=self._next_timeout()):
+                    if key.fileobj is self.srv:
+                        self._accept()
+                    elif key.fileobj is self._waker_r:
+                        self._complete()
+                    elif key.data is not None:
+                        if events & selectors.EVENT_READ:
+                            self._read(key.data)
+                        if events & selectors.EVENT_WRITE and not key.data.closed:
+                            self._write(key.data)
+                self._expire()
+        finally:
+            for conn in list(self._conns):
+                self._close(conn, "остановка сервера")
+            sel.close()
+
+    def _next_timeout(self):
+        # Просыпаемся к следующему тику колеса таймеров, если они есть
+        timeout = self._timers.next_tick()
+        if self._draining:
+            remaining = max(0.0, self._deadline - time.monotonic())
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return timeout
+
+    def _start_drain(self):
+        """Перестает принимать подключения и закрывает те, что не ждут ответов."""
+        self._sel.unregister(self.srv)
+        self.srv.close()
+        self._draining = True
+        for conn in list(self._conns):
+            if self._idle(conn) and not conn.paused:
+                self._read(conn)  # Забираем то, что клиент уже прислал
+                if not conn.closed and self._idle(conn):
+                    self._close(conn, "остановка сервера")
+
+    @staticmethod
+    def _idle(conn):
+        """Подключение не ждет ответов и не прислало начало следующего сообщения."""
+        return not conn.out and not conn.pending and not conn.framer.pending
+
+    def _accept(self):
+        while True:
+            try:
+                sock, addr = self.srv.accept()
+            except BlockingIOError:
+                return
+            if not self._admit(sock):
+                continue
+            sock.setblocking(False)
+            conn = _Connection(sock, addr, self._make_framer(),
+                               ConnectionLog(addr, self._sampler, self.metrics, self.capture),
+                               self._make_compression(), self._make_trace())
+            self._conns.add(conn)
+            self._watch(conn, selectors.EVENT_READ)
+            self._arm(conn)
+
+    def _read(self, conn):
+        try:
+            nbytes = conn.sock.recv_into(conn.framer.get_buffer())
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logger.warning("Ошибка при работе с клиентом %s: %s", conn.addr, e)
+            self._close(conn, "ошибка сокета")
+            return
+        if not nbytes:
+            conn.eof = True
+            self._write(conn)  # Досылаем то, что осталось в буфере, и закрываем
+            return
+        conn.last_activity = time.monotonic()
+        trace = conn.trace
+        now = time.perf_counter()  # Когда пришла порция: для трассировки и записи
+        if trace is not None:
+            trace.received(now)
+        try:
+            messages = conn.framer.buffer_updated(nbytes)
+        except FrameError as e:
+            logger.warning("Ошибка формата данных от клиента %s: %s", conn.addr, e)
+            self._close(conn, "ошибка формата")
+            return
+        if messages:
+            conn.greeted = True
+        try:
+            for data in messages:
+                if conn.compression is not None:
+                    data, reply = conn.compression.incoming(data)
+                    if reply is not None:  # Ответ на предложение сжатия
+                        self._queue_frame(conn, reply)
+                        continue
+                if trace is not None:
+                    trace.framed(now)
+                conn.log.received(data, now)
+                started = time.perf_counter()
+                result = self.handler(data, conn.info)
+                # Запрос и ответ, которые ждут в pending, не должны ссылаться на буфер чтения
+                if isinstance(result, Future):
+                    slot = [None, owned(data), started]
+                    conn.pending.append(slot)
+                    result.add_done_callback(partial(self._on_done, conn, slot))
+                    continue
+                response = resolve(result)
+                latency = time.perf_counter() - started
+                if conn.pending:
+                    # Ответ готов, но раньше него должны уйти ответы из других потоков
+                    conn.pending.append([owned(response), owned(data), latency])
+                else:
+                    self._queue_response(conn, data, response, latency)
+        except FrameError as e:
+            logger.warning("Ошибка формата данных от клиента %s: %s", conn.addr, e)
+            self._close(conn, "ошибка формата")
+            return
+        except Exception as e:
+            self._close(conn, log_handler_error(conn.addr, e))
+            return
+        conn.framer.release()
+        if trace is not None:
+            trace.settled(conn.framer.pending)
+        self._write(conn)
+
+    def _queue_response(self, conn, data, response, latency=None):
+        conn.log.message(data, response, latency)
+        if conn.trace is not None:
+            conn.trace.handled(latency)
+        # Ответы сжимаются здесь, строго в порядке отправки
+        if conn.compression is not None:
+            response = conn.compression.outgoing(response)
+        if isinstance(response, FileResponse):
+            prefix, suffix = conn.framer.frame(response)
+            self._buffer(conn).extend(prefix)
+            conn.out.append(response)
+            self._buffer(conn).extend(suffix)
+            conn.out_size += len(prefix) + len(suffix)
+        else:
+            self._queue_frame(conn, response)
+
+    def _queue_frame(self, conn, payload):
+        # Ответ копируется один раз - сразу в буфер отправки
+        buf = self._buffer(conn)
+        size = len(buf)
+        conn.framer.encode_into(buf, payload)
+        conn.out_size += len(buf) - size
+
+    @staticmethod
+    def _buffer(conn):
+        """Буфер в конце очереди отправки, куда дописываются ответы."""
+        if not conn.out or not isinstance(conn.out[-1], bytearray):
+            conn.out.append(bytearray())
+        return conn.out[-1]
+
+    def _on_done(self, conn, slot, future):
+        # Вызывается в потоке, где завершился Future: передаем результат циклу
+        slot[2] = time.perf_counter() - slot[2]
+        self._done.append((conn, slot, future))
+        try:
+            self._waker_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _complete(self):
+        """Переносит готовые ответы из других потоков в буферы подключений."""
+        try:
+            while self._waker_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self._done:
+            conn, slot, future = self._done.popleft()
+            if conn.closed:
+                continue
+            try:
+                slot[0] = future.result()
+                while conn.pending and conn.pending[0][0] is not None:
+                    response, data, latency = conn.pending.popleft()
+                    self._queue_response(conn, data, response, latency)
+            except FrameError as e:
+                logger.warning("Ошибка формата данных от клиента %s: %s", conn.addr, e)
+                self._close(conn, "ошибка формата")
+                continue
+            except Exception as e:
+                self._close(conn, log_handler_error(conn.addr, e))
+                continue
+            self._write(conn)
+
+    def _write(self, conn):
+        try:
+            while conn.out:
+                item = conn.out[0]
+                if isinstance(item, FileResponse):
+                    send_file_chunk(conn.sock, item)
+                    if item.remaining:
+                        break
+                    item.close()
+                else:
+                    sent = conn.sock.send(item)
+                    conn.out_size -= sent
+                    conn.last_activity = time.monotonic()  # Клиент забирает ответы
+                    if sent < len(item):
+                        del item[:sent]
+                        break
+                conn.out.popleft()
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            logger.warning("Ошибка при работе с клиентом %s: %s", conn.addr, e)
+            self._close(conn, "ошибка сокета")
+            return
+        if conn.trace is not None and not conn.out:
+            conn.trace.sent(time.perf_counter())  # Все поставленные ответы ушли в сокет
+        if conn.eof and not conn.out and not conn.pending:
+            self._close(conn, "клиент отключился")
+            return
+        if self._draining and self._idle(conn):
+            self._close(conn, "остановка сервера")
+            return
+        # Клиент, который не забирает ответы, не может заставить нас копить их без конца
+        if conn.paused:
+            if conn.out_size <= self.low_water and len(conn.pending) < MAX_PENDING:
+                conn.paused = False
+        elif conn.out_size > self.high_water or len(conn.pending) >= MAX_PENDING:
+            conn.paused = True
+            self.metrics.read_paused()
+        # Ждем готовности к записи только пока есть что досылать
+        events = 0 if conn.eof or conn.paused else selectors.EVENT_READ
+        if conn.out:
+            events |= selectors.EVENT_WRITE
+        self._watch(conn, events)
+        self._arm(conn)
+
+    def _watch(self, conn, events):
+        """Меняет события, которых сокет подключения ждет в селекторе.
+
+        Подключение, которому ждать нечего (клиент закрыл запись или чтение
+        приостановлено, а ответы еще считаются), снимается с учета: select и
+        kqueue не принимают пустую маску. Следующий _write() вернет его.
+        """
+        if events == conn.events:
+            return
+        if not events:
+            self._sel.unregister(conn.sock)
+        elif not conn.events:
+            self._sel.register(conn.sock, events, conn)
+        else:
+            self._sel.modify(conn.sock, events, conn)
+        conn.events = events
+
+    def _arm(self, conn):
+        """Взводит таймер подключения по тому, чего оно сейчас ждет."""
+        if conn.out:
+            timeout = self._timeouts["write"]
+            timer = None if timeout is None else ("write", conn.last_activity + timeout)
+        elif conn.pending:
+            timer = None  # Ответ считается на сервере, клиент ни при чем
+        else:
+            timer = deadline(self._timeouts, conn.log.started, conn.last_activity,
+                             conn.greeted, conn.framer.pending)
+        if timer is None:
+            self._timers.cancel(conn)
+        else:
+            self._timers.schedule(conn, timer[1], timer[0])
+
+    def _expire(self):
+        for conn, kind in self._timers.advance():
+            self._close(conn, timeout_reason(kind, self._timeouts), timed_out=kind)
+
+    def _close(self, conn, reason, timed_out=False):
+        if conn.closed:
+            return
+        conn.closed = True
+        self._conns.discard(conn)
+        self._timers.cancel(conn)
+        if conn.events:
+            self._sel.unregister(conn.sock)
+        conn.sock.close()
+        for item in conn.out:
+            if isinstance(item, FileResponse):
+                item.close()
+        conn.out.clear()
+        conn.framer.release()
+        self._leave()
+        conn.log.closed(reason, timed_out)
+
+
+class DatagramServer(BaseServer):
+    """Сервер датаграмм (UDP или Unix SOCK_DGRAM) для частых мелких сообщений.
+
+    Каждая датаграмма - отдельное сообщение, ответ уходит отправителю
+    одной датаграммой; подключений, разбиения потока и тайм-аутов нет,
+    поэтому отправитель не тратит время на установку соединения. Цикл
+    selectors в одном потоке вычитывает готовый сокет пачкой до batch
+    датаграмм подряд (как recvmmsg). Ответ, который ядро не приняло
+    сразу, ждет в очереди не длиннее reply_queue, а не поместившийся в
+    нее теряется. Датаграммы больше max_datagram и потерянные ядром из-за
+    переполненной очереди приема учитываются в метриках (потери в очереди
+    приема ядро сообщает со следующей принятой датаграммой). Обработчик
+    вызывается в том же потоке, как в режиме selector; ответ обработчика,
+    вернувшего Future, отправляется, когда он готов, а цикл тем временем
+    принимает датаграммы других отправителей.
+    """
+
+    def __init__(self, host=HOST, port=PORT, *, max_datagram=MAX_DATAGRAM,
+                 batch=DATAGRAM_BATCH, reply_queue=REPLY_QUEUE, sock=None,
+                 backlog=BACKLOG, reuse_port=False, **kwargs):
+        if kwargs.get("capture"):
+            raise ValueError("Запись трафика в режиме udp не поддерживается")
+        owned_sock = sock is None
+        if owned_sock:
+            sock = create_server_socket(host, port, backlog, reuse_port, type=socket.SOCK_DGRAM)
+        super().__init__(host, port, sock=sock, backlog=backlog, **kwargs)
+        if owned_sock:
+            self._unix_path = unix_path(host)
+        self.max_datagram = max_datagram
+        self.batch = batch
+        self.reply_queue = reply_queue
+        self._buffer = bytearray(max_datagram)  # Длиннее - датаграмма обрезана (MSG_TRUNC)
+        self._replies = deque()  # Ответы, которые ядро еще не приняло: (данные, адрес)
+        self._done = deque()  # Завершенные Future: (датаграмма, адрес, начало, задержка, future)
+        self._ancbufsize = 0
+        self._overflow = 0  # Последнее значение счетчика потерь ядра
+        if SO_RXQ_OVFL is not None:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+                self._ancbufsize = socket.CMSG_SPACE(4)
+            except OSError:
+                pass
+
+    def _serve(self):
+        self._local = self.server_address
+        self.srv.setblocking(False)
+        self._waker_r.setblocking(False)
+        sel = selectors.DefaultSelector()
+        sel.register(self.srv, selectors.EVENT_READ)
+        sel.register(self._waker_r, selectors.EVENT_READ)
+        writing = False
+        self.ready.set()
+        try:
+            while not self._stopped.is_set():
+                # Готовность к записи нужна, только пока есть неотправленные ответы
+                if writing != bool(self._replies):
+                    writing = not writing
+                    sel.modify(self.srv, selectors.EVENT_READ
+                               | (selectors.EVENT_WRITE if writing else 0))
+                for key, events in sel.select():
+                    if key.fileobj is self._waker_r:
+                        self._complete()
+                        continue
+                    if events & selectors.EVENT_WRITE:
+                        self._flush()
+                    if events & selectors.EVENT_READ:
+                        self._receive()
+        finally:
+            sel.close()
+            self._complete()  # Ответы, готовые к остановке, тоже досылаются
+            self._drain()
+
+    def _drain(self):
+        """До self._deadline досылает ответы из очереди; оставшиеся считаются потерянными."""
+        with selectors.DefaultSelector() as sel:
+            sel.register(self.srv, selectors.EVENT_WRITE)
+            while self._replies:
+                remaining = self._deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if sel.select(remaining):
+                    self._flush()
+        if self._replies:
+            self.metrics.datagrams_lost("reply", len(self._replies))
+            self._replies.clear()
+
+    def _receive(self):
+        """Вычитывает до batch датаграмм подряд или пока сокет не опустеет."""
+        view = memoryview(self._buffer)
+        for _ in range(self.batch):
+            try:
+                nbytes, ancdata, flags, addr = self.srv.recvmsg_into([self._buffer],
+                                                                     self._ancbufsize)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                logger.warning("Ошибка при приеме датаграммы: %s", e)
+                return
+            if ancdata:
+                self._count_overflow(ancdata)
+            if flags & socket.MSG_TRUNC:
+                self.metrics.datagram_oversized()
+                logger.debug("Датаграмма от %s больше %d байт отброшена", addr, self.max_datagram)
+                continue
+            data = view[:nbytes]
+            self._handle(data if self.zero_copy else bytes(data), addr)
+
+    def _count_overflow(self, ancdata):
+        for level, kind, value in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(value) >= 4:
+                # Ядро сообщает, сколько датаграмм отброшено с открытия сокета
+                total = int.from_bytes(value[:4], sys.byteorder)
+                lost = (total - self._overflow) & 0xFFFFFFFF
+                if lost:
+                    self.metrics.datagrams_lost("receive", lost)
+                self._overflow = total
+
+    def _handle(self, data, addr):
+        started = time.perf_counter()
+        try:
+            result = self.handler(data, ConnectionInfo(addr, self._local))
+            if isinstance(result, Future):
+                # Датаграмма, которая ждет ответа, не должна ссылаться на буфер приема
+                result.add_done_callback(partial(self._on_done, owned(data), addr, started))
+                return
+            response = resolve(result)
+        except Exception as e:
+            log_handler_error(addr, e)  # Датаграмма остается без ответа
+            return
+        self._reply(data, addr, response, started, time.perf_counter() - started)
+
+    def _on_done(self, data, addr, started, future):
+        # Вызывается в потоке, где завершился Future: передаем ответ циклу
+        self._done.append((data, addr, started, time.perf_counter() - started, future))
+        try:
+            self._waker_w.send(b"\0")
+        except OSError:
+            pass
+
+    def _complete(self):
+        """Отправляет ответы, посчитанные в других потоках."""
+        try:
+            while self._waker_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while self._done:
+            data, addr, started, latency, future = self._done.popleft()
+            try:
+                response = future.result()
+            except Exception as e:
+                log_handler_error(addr, e)
+                continue
+            self._reply(data, addr, response, started, latency)
+
+    def _reply(self, data, addr, response, started, latency):
+        if isinstance(response, FileResponse):
+            log_handler_error(addr, HandlerError("ответ из файла не отправить одной датаграммой"))
+            return
+        self.metrics.message(len(data), len(response), latency)
+        if self.trace:
+            self.metrics.stage("handler", latency)
+        if self._sampler is not None and self._sampler.allow():
+            logger.debug("Датаграмма от %s: %s -> %s", addr, preview(data), preview(response))
+        if not addr:
+            return  # Отправитель Unix-сокета без адреса: ответить некуда
+        if self._replies or not self._send(response, addr):
+            if len(self._replies) >= self.reply_queue:
+                self.metrics.datagrams_lost("reply")
+            else:
+                self._replies.append((owned(response), addr))
+        elif self.trace:
+            # Датаграмма приходит целиком: этапы first_byte и frame не имеют смысла
+            sent = time.perf_counter()
+            self.metrics.stage("send", sent - started - latency)
+            self.metrics.stage("total", sent - started)
+
+    def _flush(self):
+        while self._replies:
+            if not self._send(*self._replies[0]):
+                return
+            self._replies.popleft()
+
+    def _send(self, response, addr):
+        """Отправляет ответ; False, если ядро пока не может его принять."""
+        try:
+            self.srv.sendto(response, addr)
+        except BlockingIOError:
+            return False
+        except OSError as e:
+            if e.errno == errno.EMSGSIZE:
+                self.metrics.datagram_oversized()
+            else:
+                self.metrics.datagrams_lost("reply")
+            logger.debug("Ответ клиенту %s не отправлен: %s", addr, e)
+        return True
+
+
+class EchoServer:
+    """Асинхронный эхо-сервер на asyncio.start_server.
+
+    Каждое подключение обслуживает отдельная корутина, поэтому один поток
+    держит тысячи клиентов. Обработчик (см. handlers.py) может вернуть
+    ответ сразу, Future или корутину. Пример:
+
+        server = EchoServer(port=0)
+        await server.start()
+        await server.serve_forever()
+    """
+
+    def __init__(self, host=HOST, port=PORT, handler=do_something,
+                 backlog=BACKLOG, timeout=TIMEOUT,
+                 framing="raw", max_frame_size=MAX_FRAME_SIZE,
+                 log_payloads=LOG_PAYLOADS, zero_copy=False, sock=None, metrics=None,
+                 max_connections=MAX_CONNECTIONS, high_water=HIGH_WATER, low_water=LOW_WATER,
+                 compression=ALGORITHMS, compress_min_size=MIN_SIZE, handshake_timeout=None,
+                 read_timeout=None, idle_timeout=None, write_timeout=None, trace=False,
+                 capture=None):
+        self.host = host
+        self.port = port
+        self.handler = as_handler(handler)
+        self.backlog = backlog
+        self.timeout = timeout
+        self._timeouts = resolve_timeouts(timeout, handshake_timeout, read_timeout,
+                                          idle_timeout, write_timeout)
+        self._timers = TimerWheel()
+        self._expired = {}  # writer -> вид тайм-аута, по которому закрыто подключение
+        self._expiring = None
+        self.framing = framing
+        self.max_frame_size = max_frame_size
+        self.log_payloads = log_payloads
+        self.zero_copy = zero_copy
+        self.sock = sock
+        self.metrics = metrics if metrics is not None else ServerMetrics(backlog)
+        self.trace = trace
+        if trace:
+            self.metrics.enable_stages()
+        self.capture = capture  # capture.CaptureWriter; закрывает его владелец
+        self.max_connections = max_connections
+        self.high_water = high_water
+        self.low_water = min(low_water, high_water)
+        self.compression = parse_algorithms(compression)
+        self.compress_min_size = compress_min_size
+        self._busy_frame = make_framer(framing, max_frame_size).encode(BUSY_MESSAGE)
+        self._pool = BufferPool()
+        self._sampler = None
+        self._server = None
+        self._unix_path = None  # Файл Unix-сокета, если сервер создал его сам
+        self._writers = set()
+        self._idle = set()   # Подключения, которые ждут следующего сообщения
+        self._tasks = set()  # Корутины, обслуживающие подключения
+        self._draining = False
+
+    @property
+    def server_address(self):
+        """Адрес, на котором фактически слушает сервер (полезно при port=0)."""
+        return self._server.sockets[0].getsockname()
+
+    async def start(self):
+        """Открывает слушающий сокет и начинает принимать подключения."""
+        if self.sock is None:
+            self.sock = create_server_socket(self.host, self.port, self.backlog)
+            self._unix_path = unix_path(self.host)
+        self._server = await asyncio.start_server(
+            self._handle_client, sock=self.sock, backlog=self.backlog)
+        self._sampler = payload_sampler(self.log_payloads)
+        self.metrics.listen_socket = self._server.sockets[0]
+        self._expiring = asyncio.ensure_future(self._expire())
+        logger.info("Сервер запущен и слушает %s", describe(self.server_address))
+
+    async def _expire(self):
+        """Закрывает подключения, у которых истек тайм-аут (одна задача на весь сервер)."""
+        while True:
+            await asyncio.sleep(self._timers.tick)
+            for writer, kind in self._timers.advance():
+                self._expired[writer] = kind
+                writer.transport.abort()  # Ожидающий read() вернет EOF, drain() - ошибку
+
+    async def serve_forever(self):
+        """Обслуживает клиентов, пока сервер не будет закрыт."""
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    async def close(self, drain=0):
+        """Перестает принимать подключения и закрывает активные.
+
+        С drain > 0 сначала до drain секунд ждет, пока клиенты получат
+        ответы на уже присланные сообщения.
+        """
+        if self._server is None:
+            return
+        self._server.close()
+        self._expiring.cancel()
+        if drain > 0 and self._tasks:
+            self._draining = True
+            # Корутина простаивающего подключения ждет в read(): закрытие отдаст ей EOF
+            for writer in list(self._idle):
+                writer.close()
+            await asyncio.wait(list(self._tasks), timeout=drain)
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+        if self._unix_path is not None:
+            remove_unix_socket(self._unix_path)
+        logger.info("Сервер завершил работу")
+
+    async def _handle_client(self, reader, writer):
+        if self.max_connections is not None and len(self._writers) >= self.max_connections:
+            self.metrics.connection_rejected()
+            writer.write(self._busy_frame)
+            writer.close()
+            return
+        addr = writer.get_extra_info("peername")
+        self._writers.add(writer)
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        # drain() ниже ждет, пока неотправленного станет меньше low_water,
+        # и до этого от клиента ничего не читается
+        writer.transport.set_write_buffer_limits(self.high_water, self.low_water)
+        log = ConnectionLog(addr, self._sampler, self.metrics, self.capture)
+        trace = ConnectionTrace(self.metrics) if self.trace else None
+        info = ConnectionInfo(addr, writer.get_extra_info("sockname"))
+        framer = make_framer(self.framing, self.max_frame_size, self._pool, not self.zero_copy)
+        compression = None
+        if self.framing == "length":
+            compression = ServerCompression(self.compression, self.compress_min_size,
+                                            self.max_frame_size)
+        reason = "клиент отключился"
+        timed_out = False
+        connected = last_activity = time.monotonic()
+        greeted = False  # Получено ли первое сообщение
+        try:
+            while True:
+                idle = framer.pending == 0
+                if self._draining and idle:
+                    reason = "остановка сервера"
+                    break
+                if idle:
+                    self._idle.add(writer)
+                timer = deadline(self._timeouts, connected, last_activity, greeted, not idle)
+                if timer is not None:
+                    self._timers.schedule(writer, timer[1], timer[0])
+                try:
+                    chunk = await reader.read(READ_SIZE)
+                finally:
+                    self._idle.discard(writer)
+                    self._timers.cancel(writer)
+                if not chunk:
+                    if self._draining:
+                        reason = "остановка сервера"
+                    break
+                last_activity = time.monotonic()
+                now = time.perf_counter()  # Когда пришла порция: для трассировки и записи
+                if trace is not None:
+                    trace.received(now)
+                messages = framer.feed(chunk)
+                if messages:
+                    greeted = True
+                for data in messages:
+                    if compression is not None:
+                        data, reply = compression.incoming(data)
+                        if reply is not None:  # Ответ на предложение сжатия
+                            writer.write(framer.encode(reply))
+                            continue
+                    if trace is not None:
+                        trace.framed(now)
+                    log.received(data, now)
+                    started = time.perf_counter()
+                    response = self.handler(data, info)
+                    if isinstance(response, Future):
+                        response = await asyncio.wrap_future(response)
+                    elif inspect.isawaitable(response):
+                        response = await response
+                    latency = time.perf_counter() - started
+                    log.message(data, response, latency)
+                    if trace is not None:
+                        trace.handled(latency)
+                    if compression is not None:
+                        response = compression.outgoing(response)
+                    prefix, suffix = framer.frame(response)
+                    if isinstance(response, FileResponse):
+                        writer.write(prefix)
+                        await self._send_file(writer, response)
+                        writer.write(suffix)
+                    else:
+                        # Транспорт (с Python 3.12) хранит memoryview без копии, а буфер
+                        # чтения вернется в пул до отправки: с zero_copy копируем ответ
+                        writer.writelines((prefix, owned(response), suffix))
+                framer.release()
+                if writer.transport.get_write_buffer_size() > self.high_water:
+                    self.metrics.read_paused()
+                    # Клиент должен забрать ответы до low_water за write-тайм-аут
+                    timeout = self._timeouts["write"]
+                    if timeout is not None:
+                        self._timers.schedule(writer, time.monotonic() + timeout, "write")
+                try:
+                    await writer.drain()
+                finally:
+                    self._timers.cancel(writer)
+                if trace is not None:
+                    # Ответы переданы транспорту (в сокет или в его буфер до low_water)
+                    trace.sent(time.perf_counter())
+                    trace.settled(framer.pending)
+
+        except FrameError as e:
+            reason = "ошибка формата"
+            logger.warning("Ошибка формата данных от клиента %s: %s", addr, e)
+
+        except OSError as e:
+            reason = "ошибка сокета"
+            if writer not in self._expired:
+                logger.warning("Ошибка при работе с клиентом %s: %s", addr, e)
+
+        except Exception as e:
+            reason = log_handler_error(addr, e)
+
+        finally:
+            self._writers.discard(writer)
+            self._tasks.discard(task)
+            kind = self._expired.pop(writer, None)
+            if kind is not None:
+                reason = timeout_reason(kind, self._timeouts)
+                timed_out = kind
+            writer.close()
+            log.closed(reason, timed_out)
+
+    @staticmethod
+    async def _send_file(writer, response):
+        try:
+            await writer.drain()
+            loop = asyncio.get_running_loop()
+            sent = await loop.sendfile(writer.transport, response.file,
+                                       response.offset, response.remaining)
+        finally:
+            response.close()
+        if sent < response.remaining:
+            raise OSError(f"Файл ответа короче заявленного: {response!r}")
+
+
+class AsyncioServer(BaseServer):
+    """Обертка над EchoServer с тем же синхронным интерфейсом, что у других режимов.
+
+    Цикл asyncio работает в потоке, вызвавшем serve_forever().
+    """
+
+    _echo = None
+
+    def serve_forever(self):
+        # Сообщения о запуске и остановке пишет в журнал сам EchoServer
+        self._start_metrics()
+        try:
+            asyncio.run(self._main())
+        finally:
+            self.server_close()
+
+    async def _main(self):
+        echo = EchoServer(handler=self.handler, backlog=self.backlog,
+                          timeout=self.timeout, framing=self.framing,
+                          max_frame_size=self.max_frame_size,
+                          log_payloads=self.log_payloads, zero_copy=self.zero_copy,
+                          sock=self.srv, metrics=self.metrics,
+                          max_connections=self.max_connections,
+                          high_water=self.high_water, low_water=self.low_water,
+                          compression=self.compression,
+                          compress_min_size=self.compress_min_size,
+                          handshake_timeout=self.handshake_timeout,
+                          read_timeout=self.read_timeout, idle_timeout=self.idle_timeout,
+                          write_timeout=self.write_timeout, trace=self.trace,
+                          capture=self.capture)
+        await echo.start()
+        self._echo = echo
+        loop = asyncio.get_running_loop()
+        serving = asyncio.ensure_future(echo.serve_forever())
+
+        def wake():
+            loop.remove_reader(self._waker_r)
+            serving.cancel()
+
+        loop.add_reader(self._waker_r, wake)
+        self.ready.set()
+        try:
+            await serving
+        finally:
+            loop.remove_reader(self._waker_r)
+            drain = self._deadline - time.monotonic() if self._deadline is not None else 0
+            await echo.close(drain)
+
+    def reconfigure(self, **settings):
+        super().reconfigure(**settings)
+        # Подключения обслуживает EchoServer: передаем ему новые настройки
+        echo = self._echo
+        if echo is not None:
+            for name in ("handler", "timeout", "_timeouts", "max_connections",
+                         "high_water", "low_water", "trace"):
+                setattr(echo, name, getattr(self, name))
+            if "log_payloads" in settings:
+                echo._sampler = self._sampler
+
+
+def make_server(backend="threads", **kwargs):
+    """Создает сервер с выбранным режимом обслуживания клиентов."""
+    if backend == "threads":
+        return ThreadPoolServer(**kwargs)
+    kwargs.pop("workers", None)
+    if backend == "selector":
+        return SelectorServer(**kwargs)
+    if backend == "asyncio":
+        return AsyncioServer(**kwargs)
+    if backend == DATAGRAM:
+        return DatagramServer(**kwargs)
+    raise ValueError(f"Неизвестный режим сервера: {backend}")
+
+
+def handle_signals(server, loader=None, profiler=None):
+    """SIGTERM - остановка с дослуживанием подключений, SIGINT - сразу,
+    SIGHUP - reload_server(server, loader), если loader задан,
+    SIGUSR1 - снимок профиля (profiling.Profiler), если profiler задан."""
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown(drain=True))
+    signal.signal(signal.SIGINT, lambda signum, frame: server.shutdown())
+    if loader is not None and hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, lambda signum, frame: reload_server(server, loader))
+    if profiler is not None and hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: start_profile(profiler))
+
+
+def start_profile(profiler):
+    """Начинает снимок профиля, если он еще не идет."""
+    path = profiler.start()
+    if path is None:
+        logger.warning("Снимок профиля уже идет")
+    else:
+        logger.info("Снимаем профиль %.1f с в %s", profiler.seconds, path)
+
+
+# Сигналы, которые процесс сервера под Supervisor обрабатывает сам (см. handle_signals)
+WORKER_SIGNALS = ("SIGTERM", "SIGINT", "SIGHUP", "SIGUSR1")
+
+
+def _run_worker(backend, sock, kwargs, ready, loader=None, reloaded=False, profiler=None):
+    """Тело процесса сервера под Supervisor."""
+    if kwargs.get("capture"):
+        # У каждого процесса свой файл записи: имя дополняется pid
+        kwargs = dict(kwargs, capture=f"{kwargs['capture']}.{os.getpid()}")
+    # Пока обработчики не установлены, сигналы откладываются: иначе SIGTERM сразу
+    # после запуска убил бы процесс вместе с подключениями в очереди его сокета
+    held = [getattr(signal, name) for name in WORKER_SIGNALS if hasattr(signal, name)]
+    if hasattr(signal, "pthread_sigmask"):
+        signal.pthread_sigmask(signal.SIG_BLOCK, held)
+    try:
+        server = make_server(backend, sock=sock, **kwargs)
+        if reloaded:
+            reload_server(server, loader)  # Перезапущенный процесс берет последние настройки
+        handle_signals(server, loader, profiler)
+    finally:
+        if hasattr(signal, "pthread_sigmask"):
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, held)
+    ready.set()  # Сокет открыт, подключения уже встают в очередь
+    server.serve_forever()
+
+
+class Supervisor:
+    """Запускает несколько процессов сервера на одном порту и следит за ними.
+
+    Каждый процесс - обычный сервер выбранного режима со своим циклом
+    обслуживания, поэтому обработчики работают на разных ядрах, а не
+    делят один GIL. Где есть SO_REUSEPORT, каждый процесс открывает свой
+    сокет и подключения между ними распределяет ядро; иначе процессы
+    принимают подключения из общего сокета, открытого супервизором.
+    Упавший процесс перезапускается; SIGTERM и SIGINT останавливают все,
+    давая им дослужить подключения. SIGHUP передается процессам: каждый
+    применяет настройки, которые возвращает loader() (см. load_settings).
+    SIGUSR1 тоже передается процессам: каждый снимает свой профиль (profiler).
+    """
+
+    def __init__(self, backend="threads", processes=2, host=HOST, port=PORT,
+                 backlog=BACKLOG, reuse_port=None, metrics_port=None, loader=None,
+                 profiler=None, **kwargs):
+        if unix_path(host) is not None:
+            reuse_port = False  # Один путь может слушать только один сокет
+        elif backend == DATAGRAM:
+            # Привязанный UDP-сокет супервизора сам получал бы часть датаграмм
+            reuse_port = False
+        elif reuse_port is None:
+            reuse_port = hasattr(socket, "SO_REUSEPORT")
+        self.backend = backend
+        self.processes = processes
+        self.reuse_port = reuse_port
+        self.metrics_port = metrics_port
+        self.loader = loader
+        self.profiler = profiler
+        self._reloaded = False
+        self.kwargs = dict(kwargs, backlog=backlog)
+        # С SO_REUSEPORT сокет супервизора только занимает порт: без listen()
+        # ядро не отдает ему подключения
+        kind = socket.SOCK_DGRAM if backend == DATAGRAM else socket.SOCK_STREAM
+        self.srv = create_server_socket(host, port, backlog, reuse_port, listen=not reuse_port,
+                                        type=kind)
+        self._unix_path = unix_path(host)
+        if reuse_port:
+            self.kwargs.update(host=host, port=self.server_address[1], reuse_port=True)
+        self.workers = {}  # Номер процесса -> процесс из MP_CONTEXT
+        self._started = {}
+        self._stopped = threading.Event()
+        self._waker_r, self._waker_w = socket.socketpair()
+
+    @property
+    def server_address(self):
+        return self.srv.getsockname()
+
+    def start(self, timeout=STOP_TIMEOUT):
+        """Запускает процессы и ждет, пока каждый откроет сокет."""
+        where = (f"порту {self.server_address[1]}" if self._unix_path is None
+                 else describe(self.server_address))
+        logger.info("Супервизор запускает %d процессов на %s (%s)", self.processes,
+                    where, "SO_REUSEPORT" if self.reuse_port else "общий сокет")
+        events = [self._start(index) for index in range(self.processes)]
+        deadline = time.monotonic() + timeout
+        for ready in events:
+            ready.wait(max(0.0, deadline - time.monotonic()))
+
+    def serve_forever(self):
+        """Перезапускает упавшие процессы до вызова shutdown()."""
+        handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                handlers[signum] = signal.signal(signum, lambda signum, frame: self.shutdown())
+            if hasattr(signal, "SIGHUP"):
+                handlers[signal.SIGHUP] = signal.signal(signal.SIGHUP,
+                                                        lambda signum, frame: self.reload())
+            if hasattr(signal, "SIGUSR1"):
+                handlers[signal.SIGUSR1] = signal.signal(signal.SIGUSR1,
+                                                         lambda signum, frame: self.profile())
+        try:
+            if not self.workers:
+                self.start()
+            while not self._stopped.is_set():
+                sentinels = {p.sentinel: index for index, p in self.workers.items()}
+                for ready in multiprocessing.connection.wait([*sentinels, self._waker_r]):
+                    if ready in sentinels and not self._stopped.is_set():
+                        self._restart(sentinels[ready])
+        finally:
+            self._stop_workers()
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            self.srv.close()
+            if self._unix_path is not None:
+                remove_unix_socket(self._unix_path)
+            self._waker_r.close()
+            self._waker_w.close()
+            logger.info("Супервизор завершил работу")
+
+    def shutdown(self):
+        """Просит супервизор остановить процессы; можно вызывать из обработчика сигнала."""
+        if not self._stopped.is_set():
+            self._stopped.set()
+            try:
+                self._waker_w.send(b"\0")
+            except OSError:
+                pass
+
+    def reload(self):
+        """Просит процессы перечитать настройки (SIGHUP), не прерывая подключений."""
+        if self.loader is None:
+            logger.warning("Настройки для перечитывания не заданы")
+            return
+        self._reloaded = True
+        for process in self.workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGHUP)
+
+    def profile(self):
+        """Просит процессы снять профиль (SIGUSR1); каждый пишет свой файл."""
+        if self.profiler is None:
+            logger.warning("Профилирование не настроено")
+            return
+        for process in self.workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGUSR1)
+
+    def _start(self, index):
+        kwargs = dict(self.kwargs)
+        if self.metrics_port:
+            kwargs["metrics_port"] = self.metrics_port + index  # Свой порт метрик у процесса
+        elif self.metrics_port is not None:
+            kwargs["metrics_port"] = 0
+        sock = None if self.reuse_port else self.srv
+        ready = MP_CONTEXT.Event()
+        process = MP_CONTEXT.Process(target=_run_worker, name=f"server-{index}",
+                                     args=(self.backend, sock, kwargs, ready,
+                                           self.loader, self._reloaded, self.profiler))
+        process.start()
+        self.workers[index] = process
+        self._started[index] = time.monotonic()
+        logger.info("Запущен процесс сервера %d (pid %d)", index, process.pid)
+        return ready
+
+    def _restart(self, index):
+        process = self.workers[index]
+        process.join()
+        logger.warning("Процесс сервера %d (pid %d) завершился с кодом %s, перезапускаем",
+                       index, process.pid, process.exitcode)
+        # Процесс, падающий сразу после старта, не перезапускаем в цикле без паузы
+        if time.monotonic() - self._started[index] < RESTART_DELAY:
+            self._stopped.wait(RESTART_DELAY)
+        if not self._stopped.is_set():
+            self._start(index)
+
+    def _stop_workers(self):
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()  # SIGTERM: процесс дослуживает подключения и выходит
+        drain = self.kwargs.get("drain_timeout", DRAIN_TIMEOUT)
+        deadline = time.monotonic() + drain + STOP_TIMEOUT
+        for process in self.workers.values():
+            process.join(max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logger.warning("Процесс сервера pid %d не завершился вовремя", process.pid)
+                process.kill()
+                process.join()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Эхо-сервер TCP")
+    parser.add_argument("--host", default=HOST,
+                        help='адрес IPv4 или IPv6 ("::") либо unix:/path.sock для Unix-сокета')
+    parser.add_argument("--port", type=int, default=PORT, help="для Unix-сокета не используется")
+    parser.add_argument("--backend", choices=BACKENDS + (DATAGRAM,), default="threads",
+                        help="пул потоков, цикл событий selectors, asyncio или udp "
+                             "(датаграммы вместо подключений)")
+    parser.add_argument("--backlog", type=int, default=BACKLOG,
+                        help="длина очереди подключений, ожидающих accept")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS,
+                        help="сколько клиентов обслуживать одновременно; остальные сразу "
+                             "получают сообщение об ошибке и отключаются")
+    parser.add_argument("--high-water", type=int, default=HIGH_WATER,
+                        help="неотправленных байт на подключение, после которых сервер "
+                             "перестает читать от клиента")
+    parser.add_argument("--low-water", type=int, default=LOW_WATER,
+                        help="до скольких байт должен опустеть буфер, чтобы чтение возобновилось")
+    parser.add_argument("--compression", default=",".join(ALGORITHMS),
+                        help="алгоритмы сжатия, которые сервер принимает от клиентов "
+                             "в режиме length, через запятую; none - без сжатия")
+    parser.add_argument("--compress-min-size", type=int, default=MIN_SIZE,
+                        help="сообщения короче этого размера, байт, не сжимаются")
+    parser.add_argument("--cache-bytes", type=int, default=CACHE_BYTES,
+                        help="объем кэша ответов для обработчиков, помеченных @cacheable, "
+                             "байт (0 - без кэша)")
+    parser.add_argument("--cache-ttl", type=float,
+                        help="сколько секунд ответ хранится в кэше (по умолчанию без ограничения)")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="число рабочих потоков в режиме threads")
+    parser.add_argument("--processes", type=int, default=PROCESSES,
+                        help="число процессов сервера на одном порту (SO_REUSEPORT "
+                             "или общий сокет); упавшие процессы перезапускаются")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT,
+                        help="тайм-аут по умолчанию для всех видов ниже, секунд; "
+                             "0 - без ограничения")
+    parser.add_argument("--handshake-timeout", type=float,
+                        help="сколько ждать первого сообщения после подключения")
+    parser.add_argument("--read-timeout", type=float,
+                        help="пауза внутри начатого сообщения, после которой подключение закрывается")
+    parser.add_argument("--idle-timeout", type=float,
+                        help="пауза между сообщениями; 0 - держать простаивающие "
+                             "подключения без ограничения")
+    parser.add_argument("--write-timeout", type=float,
+                        help="сколько клиент может не забирать ответы")
+    parser.add_argument("--framing", choices=FRAMINGS, default="raw",
+                        help="разбиение потока на сообщения: без разметки, "
+                             "с 4-байтовой длиной или по строкам")
+    parser.add_argument("--max-frame-size", type=int, default=MAX_FRAME_SIZE,
+                        help="максимальный размер сообщения, байт")
+    parser.add_argument("--handler", default="server:do_something",
+                        help="обработчик сообщений в виде модуль:имя (или модуль:фабрика())")
+    parser.add_argument("--config",
+                        help="JSON-файл с настройками, которые можно менять на ходу "
+                             f"({', '.join(RELOADABLE)}); перечитывается по SIGHUP вместе "
+                             "с модулем обработчика")
+    parser.add_argument("--drain-timeout", type=float, default=DRAIN_TIMEOUT,
+                        help="сколько секунд после SIGTERM ждать ответов на уже "
+                             "присланные сообщения")
+    parser.add_argument("--log-level", choices=LEVELS, default="INFO",
+                        help="уровень журнала")
+    parser.add_argument("--quiet", action="store_true",
+                        help="писать в журнал только предупреждения и ошибки")
+    parser.add_argument("--log-payloads", type=float, default=LOG_PAYLOADS,
+                        help="сколько сообщений в секунду записывать в журнал целиком "
+                             "(только с --log-level DEBUG)")
+    parser.add_argument("--metrics-port", type=int,
+                        help=f"порт для метрик в формате Prometheus на {METRICS_HOST} "
+                             "(по умолчанию не открывается)")
+    parser.add_argument("--trace", action="store_true",
+                        help="собирать гистограммы длительности этапов обработки сообщений "
+                             "(accept, прием, обработчик, отправка) в метриках")
+    parser.add_argument("--profile-dir", default=".",
+                        help="куда по SIGUSR1 записывать профиль работающего сервера")
+    parser.add_argument("--profile-seconds", type=float, default=PROFILE_SECONDS,
+                        help="сколько секунд снимать профиль по SIGUSR1")
+    parser.add_argument("--dump-profile", type=int, metavar="PID",
+                        help="попросить запущенный сервер с этим pid снять профиль "
+                             "(послать SIGUSR1) и выйти")
+    parser.add_argument("--capture", metavar="FILE",
+                        help="записывать сообщения клиентов с временем и номером подключения "
+                             "в файл для bench/replay.py (с --processes - файл на процесс, "
+                             "FILE.<pid>)")
+    parser.add_argument("--capture-buffer", type=int, default=BUFFER_BYTES,
+                        help="сколько записей держать в памяти до сброса на диск, байт; "
+                             "если диск не успевает, лишние записи теряются")
+    parser.add_argument("--zero-copy", action="store_true",
+                        help="передавать обработчику memoryview в буфере чтения без копирования")
+    parser.add_argument("--max-datagram", type=int, default=MAX_DATAGRAM,
+                        help="режим udp: датаграммы длиннее отбрасываются, байт")
+    parser.add_argument("--reply-queue", type=int, default=REPLY_QUEUE,
+                        help="режим udp: сколько ответов может ждать отправки; "
+                             "не поместившиеся в очередь теряются")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configure_logging(args.log_level, args.quiet)
+    if args.dump_profile is not None:
+        os.kill(args.dump_profile, signal.SIGUSR1)
+        logger.info("Процесс %d снимает профиль; файл появится в его --profile-dir",
+                    args.dump_profile)
+        return
+    timeout = args.timeout if args.timeout > 0 else None
+    kwargs = dict(host=args.host, port=args.port, handler=load_handler(args.handler),
+                  backlog=args.backlog, max_connections=args.max_connections,
+                  high_water=args.high_water, low_water=args.low_water,
+                  cache_bytes=args.cache_bytes, cache_ttl=args.cache_ttl,
+                  compression=args.compression, compress_min_size=args.compress_min_size,
+                  timeout=timeout, workers=args.workers, framing=args.framing,
+                  max_frame_size=args.max_frame_size, log_payloads=args.log_payloads,
+                  zero_copy=args.zero_copy, metrics_port=args.metrics_port,
+                  drain_timeout=args.drain_timeout, handshake_timeout=args.handshake_timeout,
+                  read_timeout=args.read_timeout, idle_timeout=args.idle_timeout,
+                  write_timeout=args.write_timeout, trace=args.trace)
+    if args.capture:
+        kwargs.update(capture=args.capture, capture_buffer=args.capture_buffer)
+    if args.backend == DATAGRAM:
+        kwargs.update(max_datagram=args.max_datagram, reply_queue=args.reply_queue)
+    if args.config:
+        kwargs.update(load_settings(args.config))  # Файл важнее параметров командной строки
+    # По SIGHUP перечитываются файл настроек и модуль обработчика
+    loader = partial(load_settings, args.config, args.handler)
+    # По SIGUSR1 снимается профиль работающего сервера
+    profiler = Profiler(args.profile_dir, args.profile_seconds, log=logger)
+    if args.processes > 1:
+        server = Supervisor(args.backend, args.processes, loader=loader, profiler=profiler,
+                            **kwargs)
+    else:
+        server = make_server(args.backend, **kwargs)
+        handle_signals(server, loader, profiler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Сервер остановлен по запросу пользователя")
 
-except KeyboardInterrupt:
-    print("Сервер остановлен по запросу пользователя")
 
-finally:
-    srv.close()
-    print("Сервер завершил работу")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#журналирование сервера:
+"""Журнал сервера на стандартном модуле logging.
+
+Сообщения о подключениях пишутся с уровнем DEBUG, итоги по подключению
+при закрытии - INFO, ошибки - WARNING. Содержимое сообщений пишется только
+на уровне DEBUG и не чаще заданного числа раз в секунду, поэтому при
+обычной работе сервер не декодирует и не форматирует данные клиентов.
+"""
+import logging
+import threading
+import time
+
+logger = logging.getLogger("server")
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+PREVIEW_SIZE = 64  # Сколько байт сообщения попадает в журнал
+
+
+def configure_logging(level="INFO", quiet=False):
+    """Настраивает вывод журнала в stderr; quiet оставляет только предупреждения и ошибки."""
+    logging.basicConfig(format=LOG_FORMAT)
+    logger.setLevel(logging.WARNING if quiet else level)
+
+
+def preview(data, size=PREVIEW_SIZE):
+    """Начало сообщения в читаемом виде; не падает на данных не в UTF-8."""
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        return repr(data)  # Например, FileResponse
+    text = bytes(data[:size]).decode("utf-8", "replace")
+    if len(data) > size:
+        text += "..."
+    return repr(text)
+
+
+class RateLimiter:
+    """Разрешает не больше rate событий в секунду (маркерная корзина)."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def payload_sampler(rate):
+    """Ограничитель для записи содержимого сообщений или None, если запись выключена."""
+    if rate > 0 and logger.isEnabledFor(logging.DEBUG):
+        return RateLimiter(rate)
+    return None
+
+
+class ConnectionLog:
+    """Счетчики одного подключения и их запись в журнал при закрытии.
+
+    Если передан metrics (ServerMetrics), те же события учитываются в метриках сервера,
+    если capture (capture.CaptureWriter) - сообщения клиента записываются в файл.
+    """
+
+    __slots__ = ("addr", "sampler", "metrics", "capture", "capture_id", "started", "messages",
+                 "bytes_in", "bytes_out")
+
+    def __init__(self, addr, sampler=None, metrics=None, capture=None):
+        # У клиента Unix-сокета обычно нет своего адреса
+        self.addr = addr if addr else "unix-клиент"
+        self.sampler = sampler
+        self.metrics = metrics
+        self.started = time.monotonic()
+        self.messages = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.capture = capture
+        self.capture_id = capture.opened() if capture is not None else None
+        if metrics is not None:
+            metrics.connection_opened()
+        logger.debug("Подключен клиент: %s", self.addr)
+
+    def received(self, data, at):
+        """Записывает сообщение клиента в capture, если запись включена;
+        at - когда пришла его последняя порция (time.perf_counter())."""
+        if self.capture is not None:
+            self.capture.message(self.capture_id, data, at)
+
+    def message(self, data, response, latency=None):
+        """Учитывает обработанное сообщение и ответ на него; latency - время обработчика."""
+        self.messages += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(response)
+        if self.metrics is not None:
+            self.metrics.message(len(data), len(response), latency)
+        if self.sampler is not None and self.sampler.allow():
+            logger.debug("Сообщение от %s: %s -> %s", self.addr, preview(data), preview(response))
+
+    def closed(self, reason, timed_out=False):
+        """Пишет итог по подключению; reason - почему оно закрыто,
+        timed_out - вид тайм-аута, если подключение закрыто по нему."""
+        if self.metrics is not None:
+            self.metrics.connection_closed(timed_out)
+        if self.capture is not None:
+            self.capture.closed(self.capture_id)
+        logger.info("Соединение с клиентом %s закрыто (%s): сообщений %d, "
+                    "получено %d Б, отправлено %d Б, %.3f с",
+                    self.addr, reason, self.messages, self.bytes_in, self.bytes_out,
+                    time.monotonic() - self.started)
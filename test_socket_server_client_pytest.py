@@ -1,139 +1,51 @@
+import asyncio
+import json
+import os
+import pickle
+import re
+import selectors
+import signal
 import socket
+import subprocess
+import sys
+import zlib
 import threading
 import time
+import urllib.request
 import pytest
 from unittest.mock import patch, MagicMock
 import io
 from contextlib import redirect_stdout
 
-# Импортируем функции из основных файлов или определяем их здесь для тестирования
-def do_something(data):
-    """Пример функции для обработки данных."""
-    return data  # Просто возвращаем данные (эхо-сервер)
-
-# Мок-сервер для тестирования клиента
-class MockServer(threading.Thread):
-    def __init__(self, host='127.0.0.1', port=33333):
-        super().__init__()
-        self.host = host
-        self.port = port
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(5)
-        self.running = False
-        self.client_socket = None
-        
-    def run(self):
-        self.running = True
-        self.server_socket.settimeout(1)
-        
-        while self.running:
-            try:
-                self.client_socket, _ = self.server_socket.accept()
-                data = self.client_socket.recv(1024)
-                if data:
-                    # Эхо-ответ
-                    self.client_socket.sendall(data)
-                self.client_socket.close()
-            except socket.timeout:
-                continue
-            except Exception as e:
-                print(f"Ошибка в мок-сервере: {e}")
-                break
-                
-    def stop(self):
-        self.running = False
-        if self.client_socket:
-            self.client_socket.close()
-        self.server_socket.close()
-
-# Мок-клиент для тестирования сервера
-class MockClient(threading.Thread):
-    def __init__(self, host='127.0.0.1', port=33334, message="Test message"):
-        super().__init__()
-        self.host = host
-        self.port = port
-        self.message = message
-        self.response = None
-        self.error = None
-        
-    def run(self):
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-                sock.connect((self.host, self.port))
-                sock.sendall(self.message.encode('utf-8'))
-                self.response = sock.recv(1024).decode('utf-8')
-        except Exception as e:
-            self.error = str(e)
-
-# Функция для запуска сервера в отдельном потоке
-def run_server():
-    HOST = ""
-    PORT = 33334
-    
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as srv:
-        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        srv.bind((HOST, PORT))
-        srv.listen(5)
-        srv.settimeout(1)
-        
-        while True:
-            try:
-                sock, addr = srv.accept()
-                with sock:
-                    sock.settimeout(1)
-                    data = sock.recv(1024)
-                    if data:
-                        response = do_something(data)
-                        sock.sendall(response)
-            except socket.timeout:
-                continue
-            except Exception:
-                break
+import capture
+import client
+import compression
+import framing
+import handlers
+import metrics
+import profiling
+import server
+import serverlog
+from bench import loadgen, replay
 
-# Функция клиента для тестирования
-def start_client():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
-        try:
-            sock.connect(('127.0.0.1', 33333))
-            print(f"Установлено соединение с сервером 127.0.0.1:33333")
-            
-            message = input("Введите сообщение для отправки серверу: ")
-            print(f"Отправка данных серверу: {message}")
-            
-            sock.sendall(message.encode('utf-8'))
-            
-            data = sock.recv(1024)
-            print(f"Получено от сервера: {data.decode('utf-8')}")
-            
-        except socket.error as e:
-            print(f"Ошибка при работе с сокетом: {e}")
-        finally:
-            print("Соединение с сервером закрыто")
+# Импортируем функции из основных файлов
+from server import do_something
+from client import start_client
+from testing import MockClient, MockServer, handler_client, running_server, wait_for
 
 # Фикстура для запуска сервера перед тестами
 @pytest.fixture(scope="module")
 def server_fixture():
-    # Запускаем сервер в отдельном потоке
-    server_thread = threading.Thread(target=run_server)
-    server_thread.daemon = True
-    server_thread.start()
-    # Даем серверу время на запуск
-    time.sleep(1)
-    
-    yield
-    
-    # Освобождаем ресурсы после тестов
-    pass
+    # Настоящий сервер из server.py на свободном порту
+    with running_server(timeout=1.0) as srv:
+        yield srv
 
 # Фикстура для запуска мок-сервера перед каждым тестом клиента
 @pytest.fixture
 def mock_server_fixture():
-    # Запускаем мок-сервер
+    # start() возвращается, когда мок-сервер готов принимать подключения
     mock_server = MockServer()
     mock_server.start()
-    time.sleep(0.5)  # Даем серверу время на запуск
     
     yield mock_server
     
@@ -161,7 +73,7 @@ def test_do_something():
 # Тест отправки сообщения на сервер и получения эхо-ответа
 def test_server_echo(server_fixture):
     """Тест отправки сообщения на сервер и получения эхо-ответа"""
-    client = MockClient(port=33334, message="Hello, Server!")
+    client = MockClient(port=server_fixture.server_address[1], message="Hello, Server!")
     client.start()
     client.join(timeout=5)
     
@@ -175,7 +87,7 @@ def test_server_multiple_clients(server_fixture):
     messages = ["Client 1", "Client 2", "Client 3"]
     
     for i, message in enumerate(messages):
-        client = MockClient(port=33334, message=message)
+        client = MockClient(port=server_fixture.server_address[1], message=message)
         client.start()
         clients.append(client)
     
@@ -188,6 +100,1329 @@ def test_server_multiple_clients(server_fixture):
         assert client.error is None, f"Клиент {i+1} должен подключиться без ошибок"
         assert client.response == messages[i], f"Сервер должен отправить правильный эхо-ответ клиенту {i+1}"
 
+# Настоящий сервер в каждом режиме
+@pytest.fixture(params=server.BACKENDS)
+def backend_server(request):
+    with running_server(request.param) as srv:
+        yield srv
+
+# Тест эхо-ответа для каждого режима сервера
+def test_backend_echo(backend_server):
+    """Тест эхо-ответа сервера в каждом режиме"""
+    port = backend_server.server_address[1]
+    clients = [MockClient(port=port, message=f"Client {i}") for i in range(10)]
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join(timeout=5)
+
+    for i, client in enumerate(clients):
+        assert client.error is None, f"Клиент {i} должен подключиться без ошибок"
+        assert client.response == f"Client {i}"
+
+# Тест: зависший клиент не блокирует остальных
+def test_backend_stalled_client(backend_server):
+    """Клиент, который ничего не отправляет, не должен задерживать других"""
+    port = backend_server.server_address[1]
+    with socket.create_connection(("127.0.0.1", port)):
+        start = time.monotonic()
+        client = MockClient(port=port, message="Hello")
+        client.start()
+        client.join(timeout=5)
+        assert client.response == "Hello"
+        assert time.monotonic() - start < 1.0, "Ответ не должен ждать тайм-аута зависшего клиента"
+
+def test_make_server_unknown_backend():
+    """Неизвестный режим сервера должен приводить к ошибке"""
+    with pytest.raises(ValueError):
+        server.make_server("fork", port=0)
+
+# Тесты разбиения потока на сообщения
+@pytest.mark.parametrize("mode", ["length", "line"])
+def test_framer_split_and_merged_chunks(mode):
+    """Сообщения должны собираться из любых порций данных"""
+    encoder = framing.make_framer(mode)
+    messages = [b"first", b"", b"x" * 5000, b"last"]
+    stream = b"".join(encoder.encode(m) for m in messages)
+
+    decoder = framing.make_framer(mode)
+    received = []
+    for i in range(0, len(stream), 7):
+        received.extend(decoder.feed(stream[i:i + 7]))
+    assert received == messages
+    assert decoder.pending == 0
+
+    # Все сообщения одной порцией
+    assert framing.make_framer(mode).feed(stream) == messages
+
+@pytest.mark.parametrize("mode", ["length", "line"])
+def test_framer_max_frame_size(mode):
+    """Слишком большое сообщение должно приводить к ошибке"""
+    decoder = framing.make_framer(mode, max_frame_size=10)
+    with pytest.raises(framing.FrameTooLarge):
+        decoder.feed(framing.make_framer(mode).encode(b"y" * 11))
+    with pytest.raises(framing.FrameTooLarge):
+        decoder.encode(b"y" * 11)
+
+def test_framer_raw_and_unknown_mode():
+    """Режим raw отдает каждую порцию данных как есть"""
+    raw = framing.make_framer("raw")
+    assert raw.feed(b"abc") == [b"abc"]
+    assert raw.encode(b"abc") == b"abc"
+    with pytest.raises(ValueError):
+        framing.make_framer("xml")
+
+# Тест: большие сообщения проходят через сервер целиком
+@pytest.mark.parametrize("backend", server.BACKENDS)
+@pytest.mark.parametrize("mode", ["length", "line"])
+def test_backend_large_frames(backend, mode):
+    """Сообщения больше 1 КБ должны возвращаться целиком и по одному"""
+    with running_server(backend, framing=mode) as srv:
+        messages = [b"a" * 300000, b"b", b"c" * 70000]
+        with client.Client(port=srv.server_address[1], framing=mode, timeout=5) as conn:
+            assert [conn.request(message) for message in messages] == messages
+
+# Тест конвейерной отправки запросов
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_pipelining(backend):
+    """Ответы на конвейерные запросы должны приходить по порядку"""
+    with running_server(backend, framing="length") as srv:
+        messages = [f"Message {i}".encode("utf-8") * (i % 50 + 1) for i in range(2000)]
+        with client.Client(port=srv.server_address[1], framing="length", timeout=5) as conn:
+            assert conn.send_many(messages, in_flight=32) == messages
+            # После конвейера подключение можно использовать как обычно
+            assert conn.request(b"after") == b"after"
+
+def test_async_pipelining():
+    """Асинхронный конвейер должен возвращать ответы по порядку"""
+    async def scenario():
+        echo = server.EchoServer(host="127.0.0.1", port=0, framing="line")
+        await echo.start()
+        try:
+            async with client.AsyncClient(port=echo.server_address[1], framing="line") as conn:
+                return await conn.send_many((b"%d" % i for i in range(1000)), in_flight=16)
+        finally:
+            await echo.close()
+
+    responses = asyncio.run(scenario())
+    assert responses == [b"%d" % i for i in range(1000)]
+
+def test_pipelining_requires_framing():
+    """Без разметки сообщений конвейер невозможен"""
+    conn = client.Client(framing="raw")
+    with pytest.raises(ValueError):
+        conn.send_many([b"a"])
+
+# Тесты пула постоянных подключений
+def test_connection_pool_reuse_and_threads():
+    """Пул должен переиспользовать подключения и раздавать их потокам"""
+    with running_server("selector", framing="length") as srv:
+        with client.ConnectionPool(port=srv.server_address[1], size=4, framing="length", timeout=5) as pool:
+            with pool.connection() as first:
+                assert first.request(b"one") == b"one"
+            with pool.connection() as second:
+                assert second is first, "Свободное подключение должно выдаваться повторно"
+
+            results = {}
+            def worker(n):
+                results[n] = [pool.request(b"%d-%d" % (n, i)) for i in range(50)]
+            threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(timeout=5)
+            assert results == {n: [b"%d-%d" % (n, i) for i in range(50)] for n in range(8)}
+            assert pool._idle.qsize() <= 4
+
+def test_connection_pool_reconnects():
+    """Подключение, закрытое сервером, должно заменяться новым"""
+    with running_server("threads", framing="length", timeout=0.2) as srv:
+        with client.ConnectionPool(port=srv.server_address[1], size=1, framing="length",
+                                   timeout=5, idle_check=0) as pool:
+            with pool.connection() as first:
+                assert first.request(b"before") == b"before"
+            # Сервер закрывает простаивающее подключение
+            wait_for(lambda: srv.metrics.snapshot()["connections_active"] == 0)
+            with pool.connection() as second:
+                assert second is not first
+                assert second.request(b"after") == b"after"
+
+def test_async_connection_pool():
+    """Асинхронный пул должен обслуживать много корутин малым числом подключений"""
+    async def scenario():
+        echo = server.EchoServer(host="127.0.0.1", port=0, framing="length")
+        await echo.start()
+        try:
+            async with client.AsyncConnectionPool(port=echo.server_address[1], size=4,
+                                                  framing="length") as pool:
+                replies = await asyncio.gather(*(pool.request(b"%d" % i) for i in range(100)))
+                return replies, len(echo._writers)
+        finally:
+            await echo.close()
+
+    replies, connections = asyncio.run(scenario())
+    assert replies == [b"%d" % i for i in range(100)]
+    assert connections <= 4
+
+# Тесты пакетной отправки из файла
+def test_read_lines_and_stream(tmp_path):
+    """Сообщения читаются по строкам из файла через mmap и из потока"""
+    path = tmp_path / "messages.txt"
+    path.write_bytes(b"one\n\ntwo\nthree")
+    assert list(client.read_lines(path)) == [b"one", b"", b"two", b"three"]
+    empty = tmp_path / "empty.txt"
+    empty.write_bytes(b"")
+    assert list(client.read_lines(empty)) == []
+    assert list(client.read_stream(io.BytesIO(b"a\nb\n"))) == [b"a", b"b"]
+
+@pytest.mark.parametrize("mode", ["length", "line"])
+def test_send_bulk_keeps_order(mode):
+    """Ответы пишутся в порядке сообщений при нескольких подключениях"""
+    messages = [b"message %d" % i for i in range(1000)]
+    output = io.BytesIO()
+    with running_server("selector", framing=mode) as srv:
+        summary = client.send_bulk(iter(messages), output, port=srv.server_address[1],
+                                   connections=4, framing=mode, batch_size=37, timeout=5)
+    assert output.getvalue() == b"".join(message + b"\n" for message in messages)
+    assert summary["messages"] == 1000
+    assert summary["sent_bytes"] == summary["received_bytes"] == sum(map(len, messages))
+
+def test_client_cli_file_mode(tmp_path, capsys):
+    """python client.py --file ... --output ... отправляет файл и печатает сводку"""
+    source = tmp_path / "in.txt"
+    source.write_bytes(b"".join(b"line %d\n" % i for i in range(200)))
+    result = tmp_path / "out.txt"
+    with running_server("threads", framing="length", compression="zlib") as srv:
+        client.main(["--port", str(srv.server_address[1]), "--file", str(source),
+                     "--output", str(result), "--connections", "2",
+                     "--compression", "zlib", "--timeout", "5"])
+    assert result.read_bytes() == source.read_bytes()
+    summary = json.loads(capsys.readouterr().err)
+    assert summary["messages"] == 200
+
+# Тесты нагрузочного генератора
+def test_percentile():
+    """Перцентили считаются методом ближайшего ранга"""
+    values = list(range(1, 101))
+    assert loadgen.percentile(values, 50) == 50
+    assert loadgen.percentile(values, 99) == 99
+    assert loadgen.percentile(values, 100) == 100
+    assert loadgen.percentile([], 50) == 0.0
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_loadgen_against_backend(backend):
+    """Короткий замер должен пройти без ошибок и вернуть метрики"""
+    with running_server(backend, framing="length") as srv:
+        result = loadgen.run_benchmark(port=srv.server_address[1], connections=4,
+                                       size=64, depth=4, duration=0.2)
+    assert result["errors"] == 0
+    assert result["messages"] > 0
+    assert result["msgs_per_sec"] > 0
+    assert set(result["latency_ms"]) == {"p50", "p95", "p99", "max"}
+    assert result["latency_ms"]["p50"] <= result["latency_ms"]["max"]
+
+# Тесты записи и воспроизведения трафика
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_capture_and_replay(backend, tmp_path):
+    """Записанный трафик воспроизводится с сохранением порядка, пауз и подключений"""
+    path = tmp_path / "traffic.cap"
+    with running_server(backend, framing="length", capture=str(path)) as srv:
+        port = srv.server_address[1]
+        with client.Client(port=port, framing="length", timeout=5) as first, \
+                client.Client(port=port, framing="length", timeout=5) as second:
+            assert first.request(b"a1") == b"a1"
+            assert second.request(b"b1") == b"b1"
+            time.sleep(0.2)
+            assert first.send_many([b"a2", b"a3"]) == [b"a2", b"a3"]
+    framing_name, records = capture.read_capture(path)
+    assert framing_name == "length"
+    captured = replay.sessions(records)
+    assert [[data for _, data in session.messages] for session in captured] == [
+        [b"a1", b"a2", b"a3"], [b"b1"]]
+    assert all(session.end is not None for session in captured)
+    assert captured[0].messages[1][0] - captured[0].messages[0][0] >= 0.2
+
+    with running_server("selector", framing="length") as srv:
+        port = srv.server_address[1]
+        results = {speed: replay.run_replay(path, port=port, speed=speed)
+                   for speed in (1.0, 2.0, None)}
+        assert srv.metrics.snapshot()["messages"] == 12
+    for result in results.values():
+        assert result["errors"] == 0
+        assert result["messages"] == 4
+        assert result["connections"] == 2
+    assert results[1.0]["seconds"] >= 0.2
+    assert results[2.0]["seconds"] >= 0.1
+    assert results[None]["speed"] == "max"
+
+def test_capture_records_messages_on_arrival(tmp_path):
+    """Сообщение записывается, когда пришло, а не когда ушел ответ, и даже без ответа"""
+    from concurrent.futures import Future
+
+    def handler(data, conn):
+        if data == b"fail":
+            raise handlers.HandlerError("плохое сообщение")
+        if data == b"slow":
+            future = Future()
+            threading.Timer(0.3, future.set_result, (data,)).start()
+            return future
+        return data
+    path = tmp_path / "traffic.cap"
+    with running_server("selector", framing="length", handler=handler,
+                        capture=str(path)) as srv:
+        port = srv.server_address[1]
+        with client.Client(port=port, framing="length", timeout=5) as conn:
+            # Ответ на fast ждет ответа на slow, но сообщение пришло сразу
+            assert conn.send_many([b"slow", b"fast"]) == [b"slow", b"fast"]
+        with client.Client(port=port, framing="length", timeout=5) as conn:
+            conn.send(b"fail")
+            with pytest.raises(ConnectionError):
+                conn.recv()
+    _, records = capture.read_capture(path)
+    arrived = {record.data: record.time for record in records
+               if record.kind == capture.MESSAGE}
+    assert set(arrived) == {b"slow", b"fast", b"fail"}
+    assert arrived[b"fast"] - arrived[b"slow"] < 0.2
+
+@pytest.mark.skipif(not os.path.exists("/dev/full"), reason="нет /dev/full")
+def test_capture_write_error(caplog):
+    """Если файл записи не пишется, записи считаются потерянными, а файл закрывается"""
+    writer = capture.CaptureWriter("/dev/full", "length", flush_interval=0.01)
+    connection = writer.opened()
+    writer.message(connection, b"lost")
+    wait_for(lambda: writer.dropped == 2)
+    writer.closed(connection)
+    writer.close()
+    writer.close()
+    assert writer._file.closed
+    assert writer.records == 0 and writer.dropped == 3
+    assert "потеряно 3 записей из 3" in caplog.text
+
+def test_capture_bounded_buffer(tmp_path):
+    """Если диск не успевает, записи теряются и считаются, а сервер их не ждет"""
+    path = tmp_path / "small.cap"
+    writer = capture.CaptureWriter(path, "line", max_buffer=100, flush_interval=60)
+    connection = writer.opened()
+    writer.message(connection, b"x" * 200)  # Больше всего буфера
+    for _ in range(10):
+        writer.message(connection, b"x" * 20)
+    writer.closed(connection)
+    writer.close()
+    assert writer.dropped >= 1
+    assert writer.records + writer.dropped == 13
+    framing_name, records = capture.read_capture(path)
+    assert framing_name == "line"
+    assert len(records) == writer.records
+    assert records[0].kind == capture.OPEN
+    assert all(record.data == b"x" * 20 for record in records if record.kind == capture.MESSAGE)
+    # Оборванная последняя запись пропускается
+    with open(path, "ab") as f:
+        f.write(b"\x01\x00")
+    assert len(capture.read_capture(path)[1]) == writer.records
+    path.write_bytes(b"not a capture")
+    with pytest.raises(capture.CaptureError):
+        capture.read_capture(path)
+    with pytest.raises(ValueError):
+        server.make_server(server.DATAGRAM, host="127.0.0.1", port=0, capture=str(path))
+    assert replay.parse_speed("max") is None
+    assert replay.parse_speed("2.5") == 2.5
+
+# Тесты Unix-сокетов и IPv6
+def ipv6_available():
+    try:
+        with socket.socket(socket.AF_INET6) as sock:
+            sock.bind(("::1", 0))
+        return True
+    except OSError:
+        return False
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_unix_socket(backend, tmp_path):
+    """Сервер, клиенты и нагрузочный тест работают через адрес unix:/path.sock"""
+    path = tmp_path / "echo.sock"
+    # Файл от упавшего сервера не мешает запуску
+    stale = socket.socket(socket.AF_UNIX)
+    stale.bind(str(path))
+    stale.close()
+    host = f"unix:{path}"
+    ports = []
+
+    def handler(data, conn):
+        ports.append(conn.port)
+        return data
+
+    with running_server(backend, host=host, framing="length", handler=handler) as srv:
+        assert srv.server_address == str(path)
+        with client.Client(host=host, framing="length", timeout=5) as conn:
+            assert conn.send_many([b"a", b"b" * 100000, b"c"], in_flight=3) == [b"a", b"b" * 100000, b"c"]
+
+        async def async_request():
+            async with client.AsyncClient(host=host, framing="length") as conn:
+                return await conn.request(b"async")
+
+        assert asyncio.run(async_request()) == b"async"
+        result = loadgen.run_benchmark(host, None, connections=2, size=64, depth=4,
+                                       duration=0.1)
+        assert result["errors"] == 0 and result["messages"] > 0
+        with pytest.raises(OSError):
+            server.create_server_socket(host)  # Путь занят работающим сервером
+    assert not path.exists(), "Файл сокета удаляется при остановке"
+    assert ports[0] is None
+
+@pytest.mark.skipif(not ipv6_available(), reason="IPv6 недоступен")
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_ipv6(backend):
+    """Сервер и клиент работают по адресу IPv6"""
+    with running_server(backend, host="::1", framing="length") as srv:
+        port = srv.server_address[1]
+        assert srv.server_address[0] == "::1"
+        with client.Client(host="[::1]", port=port, framing="length", timeout=5) as conn:
+            assert conn.request(b"ipv6") == b"ipv6"
+            assert conn.sock.family == socket.AF_INET6
+
+def test_transport_addresses():
+    """Разбор и запись адресов всех видов"""
+    import transport
+    assert transport.resolve("unix:/tmp/a.sock", 1) == (socket.AF_UNIX, "/tmp/a.sock")
+    assert transport.resolve("[::1]", 80) == (socket.AF_INET6, ("::1", 80))
+    assert transport.resolve("", 80) == (socket.AF_INET, ("", 80))
+    with pytest.raises(ValueError):
+        transport.resolve("unix:", 0)
+    assert transport.format_address(("::1", 80, 0, 0)) == "[::1]:80"
+    assert transport.format_address(("127.0.0.1", 80)) == "127.0.0.1:80"
+    assert transport.describe(("127.0.0.1", 80)) == "порт 80"
+    assert transport.describe("/tmp/a.sock") == "unix:/tmp/a.sock"
+
+# Тесты режима датаграмм
+def test_datagram_server_echo_and_oversized():
+    """Каждая датаграмма - сообщение; слишком длинные отбрасываются и считаются"""
+    with running_server(server.DATAGRAM, max_datagram=1000) as srv:
+        with client.DatagramClient(port=srv.server_address[1], timeout=5) as conn:
+            assert conn.request(b"hello") == b"hello"
+            conn.send(b"x" * 2000)
+            assert conn.request(b"after") == b"after"
+            messages = [b"%d" % i for i in range(200)]
+            assert conn.send_many(messages) == 200
+            assert sorted(conn.recv() for _ in messages) == sorted(messages)
+        snapshot = srv.metrics.snapshot()
+        assert snapshot["messages"] == 202
+        assert snapshot["datagrams"] == {"oversized": 1, "dropped": {"receive": 0, "reply": 0}}
+        assert 'server_datagrams_dropped_total{queue="reply"} 0' in srv.metrics.render()
+
+def test_datagram_server_counts_receive_drops():
+    """Датаграммы, потерянные при переполненной очереди приема, видны в метриках"""
+    srv = server.make_server(server.DATAGRAM, host="127.0.0.1", port=0)
+    srv.srv.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    with client.DatagramClient(port=srv.server_address[1], timeout=0.2) as conn:
+        conn.send_many([b"m" * 100] * 500)  # Сервер еще не читает
+        thread = threading.Thread(target=srv.serve_forever, daemon=True)
+        thread.start()
+        try:
+            # Счетчик потерь приходит со следующей датаграммой, принятой в очередь
+            for _ in range(50):
+                try:
+                    if conn.request(b"last") == b"last":
+                        break
+                except socket.timeout:
+                    pass
+            if server.SO_RXQ_OVFL is not None:
+                wait_for(lambda: srv.metrics.snapshot()["datagrams"]["dropped"]["receive"] > 0)
+        finally:
+            srv.shutdown()
+            thread.join(timeout=5)
+
+def test_datagram_server_future_does_not_block_other_peers():
+    """Пока Future одного отправителя не готов, другие получают ответы"""
+    from concurrent.futures import Future
+    slow = Future()
+
+    def handler(data, conn):
+        if data == b"slow":
+            return slow
+        if data == b"fail":
+            future = Future()
+            future.set_exception(handlers.HandlerError("сбой"))
+            return future
+        return data
+
+    with running_server(server.DATAGRAM, handler=handler) as srv:
+        port = srv.server_address[1]
+        with client.DatagramClient(port=port, timeout=5) as waiting, \
+                client.DatagramClient(port=port, timeout=5) as other:
+            waiting.send(b"slow")
+            other.send(b"fail")  # Датаграмма остается без ответа
+            assert other.request(b"fast") == b"fast"
+            slow.set_result(b"done")
+            assert waiting.recv() == b"done"
+        assert srv.metrics.snapshot()["messages"] == 2
+
+def test_datagram_server_unix_socket(tmp_path):
+    """Режим датаграмм работает и через Unix-сокет"""
+    host = f"unix:{tmp_path / 'dgram.sock'}"
+    with running_server(server.DATAGRAM, host=host, handler=lambda data: bytes(data).upper()):
+        with client.DatagramClient(host=host, timeout=5) as conn:
+            assert conn.request(b"abc") == b"ABC"
+    assert not (tmp_path / "dgram.sock").exists()
+
+# Тесты журнала сервера
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_binary_payload_and_summary(backend, caplog):
+    """Данные не в UTF-8 не должны рвать соединение; при закрытии пишется итог"""
+    caplog.set_level("INFO", logger="server")
+    with running_server(backend, framing="length") as srv:
+        with client.Client(port=srv.server_address[1], framing="length", timeout=5) as conn:
+            assert conn.request(b"\xff\xfe\x00") == b"\xff\xfe\x00"
+            assert conn.request(b"ok") == b"ok"
+        deadline = time.monotonic() + 5
+        while "закрыто" not in caplog.text and time.monotonic() < deadline:
+            time.sleep(0.01)
+    assert "сообщений 2, получено 5 Б, отправлено 5 Б" in caplog.text
+
+def test_payload_logging_is_rate_limited(caplog):
+    """Содержимое сообщений пишется только на уровне DEBUG и не чаще лимита"""
+    caplog.set_level("INFO", logger="server")
+    assert serverlog.payload_sampler(100) is None, "На уровне INFO содержимое не пишется"
+
+    caplog.set_level("DEBUG", logger="server")
+    log = serverlog.ConnectionLog(("127.0.0.1", 1), serverlog.payload_sampler(3))
+    for _ in range(100):
+        log.message(b"\xffdata", b"\xffdata")
+    assert caplog.text.count("Сообщение от") == 3
+    assert log.messages == 100
+
+# Тесты обработчиков сообщений
+def reverse_bytes(data):
+    """Тяжелый обработчик для пула процессов (должен быть на уровне модуля)"""
+    return data[::-1]
+
+def test_pipeline_middlewares_and_stats():
+    """Цепочка проходит звенья по порядку и учитывает время этапов"""
+    seen = []
+    def handler(data, conn):
+        seen.append((data, conn.port))
+        return data.upper()
+
+    pipeline = handlers.Pipeline(handler, [
+        handlers.Checksum(),
+        handlers.Transform(before=lambda d: d.strip(), after=lambda r: r + b"!", name="strip"),
+    ])
+    conn = handlers.ConnectionInfo(("127.0.0.1", 5000), ("127.0.0.1", 33333))
+    body = b" hello "
+    request = body + zlib.crc32(body).to_bytes(4, "big")
+    response = pipeline(request, conn)
+
+    assert seen == [(b"hello", 33333)]
+    assert response == b"HELLO!" + zlib.crc32(b"HELLO!").to_bytes(4, "big")
+    stats = pipeline.stats()
+    assert list(stats) == ["Checksum.before", "strip.before", "handler", "strip.after", "Checksum.after"]
+    assert all(stage["count"] == 1 for stage in stats.values())
+
+    with pytest.raises(handlers.ChecksumError):
+        pipeline(b"broken message", conn)
+
+def test_router_and_legacy_handlers():
+    """Router выбирает обработчик по типу сообщения; старые функции data -> bytes подходят"""
+    router = handlers.Router.by_prefix({b"UPPER": lambda data: data.upper()}, default=do_something)
+    conn = handlers.ConnectionInfo(("127.0.0.1", 5000), ("127.0.0.1", 33333))
+    assert router(b"UPPER hi", conn) == b"UPPER HI"
+    assert router(b"echo hi", conn) == b"echo hi"
+
+    by_port = handlers.Router.by_port({33333: lambda data, conn: b"port"})
+    assert by_port(b"x", conn) == b"port"
+    with pytest.raises(handlers.HandlerError):
+        by_port(b"x", handlers.ConnectionInfo(("127.0.0.1", 5000), ("127.0.0.1", 1)))
+
+@pytest.mark.parametrize("mode", ["length", "line"])
+def test_handler_over_socketpair(mode):
+    """Обработчик проверяется через socketpair так же, как через сеть, но без TCP"""
+    router = handlers.Router.by_prefix({b"UPPER": lambda data: bytes(data).upper()},
+                                       default=do_something)
+    with handler_client(router, framing=mode) as conn:
+        assert conn.sock.family == socket.AF_UNIX
+        assert conn.request(b"UPPER hi") == b"UPPER HI"
+        assert conn.send_many([b"a", b"UPPER b", b"c"], in_flight=3) == [b"a", b"UPPER B", b"c"]
+
+def test_handler_over_socketpair_compression_and_errors():
+    """Через socketpair работают договоренность о сжатии и закрытие подключения при ошибке"""
+    def fail(data):
+        if data == b"boom":
+            raise RuntimeError("сбой обработчика")
+        return data
+
+    with handler_client(fail, compression="zlib") as conn:
+        assert conn.codec is not None
+        assert conn.request(b"x" * 10000) == b"x" * 10000
+        conn.send(b"boom")
+        with pytest.raises(ConnectionError):
+            conn.recv()
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_process_pool_handler(backend):
+    """Тяжелый обработчик в пуле процессов не нарушает порядок ответов"""
+    heavy = handlers.ProcessPoolHandler(reverse_bytes, workers=2)
+    pipeline = handlers.Pipeline(heavy, [handlers.Transform(after=lambda r: b"<" + r + b">")])
+    try:
+        with running_server(backend, framing="length", handler=pipeline) as srv:
+            messages = [b"%05d" % i for i in range(200)]
+            with client.Client(port=srv.server_address[1], framing="length", timeout=10) as conn:
+                replies = conn.send_many(messages, in_flight=16)
+        assert replies == [b"<" + m[::-1] + b">" for m in messages]
+        assert pipeline.stats()["reverse_bytes"]["count"] == 200
+    finally:
+        heavy.close()
+
+def test_selector_waits_for_future_replies_with_select(monkeypatch):
+    """Подключение, которому нечего ждать от сокета, не роняет цикл на select()"""
+    from concurrent.futures import Future
+
+    def handler(data, conn):
+        future = Future()
+        threading.Timer(0.1, future.set_result, (data,)).start()
+        return future
+    # select и kqueue, в отличие от epoll, не принимают пустую маску событий
+    monkeypatch.setattr(server.selectors, "DefaultSelector", selectors.SelectSelector)
+    monkeypatch.setattr(server, "MAX_PENDING", 2)
+    with running_server("selector", framing="length", handler=handler) as srv:
+        port = srv.server_address[1]
+        # Клиент закрыл запись, пока ответ считается
+        with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+            sock.sendall(framing.make_framer("length").encode(b"half"))
+            sock.shutdown(socket.SHUT_WR)
+            reply = sock.recv(64)
+            assert reply == framing.make_framer("length").encode(b"half")
+            assert sock.recv(64) == b""
+        # Чтение приостановлено на MAX_PENDING ответах, а буфер отправки пуст
+        with client.Client(port=port, framing="length", timeout=5) as conn:
+            messages = [b"%d" % i for i in range(6)]
+            assert conn.send_many(messages) == messages
+        assert srv.metrics.snapshot()["read_pauses"] >= 1
+
+@pytest.mark.parametrize("backend", ["threads", "selector"])
+def test_backend_handler_error_closes_connection(backend):
+    """Ошибка обработчика закрывает только это подключение"""
+    def handler(data, conn):
+        if data == b"fail":
+            raise handlers.HandlerError("плохое сообщение")
+        return data
+    with running_server(backend, framing="length", handler=handler) as srv:
+        port = srv.server_address[1]
+        with client.Client(port=port, framing="length", timeout=5) as conn:
+            conn.send(b"fail")
+            with pytest.raises(ConnectionError):
+                conn.recv()
+        with client.Client(port=port, framing="length", timeout=5) as conn:
+            assert conn.request(b"ok") == b"ok"
+
+def test_async_handler():
+    """В режиме asyncio обработчик может быть корутиной"""
+    async def handler(data, conn):
+        await asyncio.sleep(0)
+        return b"%d:" % conn.id + data
+
+    with running_server("asyncio", framing="length", handler=handler) as srv:
+        with client.Client(port=srv.server_address[1], framing="length", timeout=5) as conn:
+            reply = conn.request(b"hi")
+    assert reply.endswith(b":hi")
+
+# Тест асинхронного сервера и клиента в одном цикле событий
+def test_echo_server_async_clients():
+    """EchoServer должен обслуживать много одновременных асинхронных клиентов"""
+    async def scenario():
+        echo = server.EchoServer(host="127.0.0.1", port=0, backlog=128)
+        await echo.start()
+        try:
+            port = echo.server_address[1]
+            messages = [f"Client {i}".encode("utf-8") for i in range(200)]
+            responses = await client.run_clients(messages, port=port, concurrency=50)
+            return messages, responses
+        finally:
+            await echo.close()
+
+    messages, responses = asyncio.run(scenario())
+    assert responses == messages
+
+# Тесты чтения без лишних копий
+def test_framer_zero_copy_and_buffer_pool():
+    """Без копирования сообщения - memoryview, а буфер возвращается в пул"""
+    pool = framing.BufferPool()
+    framer = framing.make_framer("length", pool=pool, copy=False)
+    stream = framer.encode(b"abc") + framer.encode(b"d" * 100000) + framer.encode(b"e")[:2]
+    messages = framer.feed(stream)
+    assert all(isinstance(m, memoryview) for m in messages)
+    assert [bytes(m) for m in messages] == [b"abc", b"d" * 100000]
+    # Пока есть недочитанное сообщение, буфер остается у разборщика
+    framer.release()
+    assert not pool._free
+    # Буфер вырос под большое сообщение, но старые memoryview не мешают читать дальше
+    assert [bytes(m) for m in framer.feed(framer.encode(b"e")[2:])] == [b"e"]
+    buf = framer._buf
+    framer.release()
+    assert framer._buf is None
+    assert bytes(messages[0]) == b"abc"
+    # Выросший буфер в пул не попадает, обычный - переиспользуется
+    assert buf not in pool._free
+    small = framing.make_framer("line", pool=pool)
+    assert small.feed(b"hi\n") == [b"hi"]
+    reused = small._buf
+    small.release()
+    assert pool.acquire() is reused
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_zero_copy(backend):
+    """В режиме zero_copy обработчик получает memoryview, ответы не искажаются"""
+    types = set()
+
+    def handler(data, conn):
+        types.add(type(data))
+        return bytes(data)[::-1] if data[:1] == b"r" else data
+
+    with running_server(backend, framing="length", handler=handler, zero_copy=True) as srv:
+        messages = [b"r%d" % i * (i % 7 + 1) for i in range(500)] + [b"x" * 200000]
+        with client.Client(port=srv.server_address[1], framing="length", timeout=5) as conn:
+            replies = conn.send_many(messages, in_flight=16)
+    assert replies == [m[::-1] if m[:1] == b"r" else m for m in messages]
+    assert types == {memoryview}
+
+def test_asyncio_zero_copy_does_not_queue_pooled_buffers(monkeypatch):
+    """Ответ не уходит в буфер транспорта как memoryview в буфере чтения из пула"""
+    queued = []
+    writelines = asyncio.StreamWriter.writelines
+
+    def record(self, data):
+        data = list(data)
+        queued.extend(type(item) for item in data)
+        return writelines(self, data)
+
+    monkeypatch.setattr(asyncio.StreamWriter, "writelines", record)
+    with running_server("asyncio", framing="length", handler=lambda data: data,
+                        zero_copy=True) as srv:
+        with client.Client(port=srv.server_address[1], framing="length", timeout=5) as conn:
+            messages = [b"m%d" % i for i in range(50)]
+            assert conn.send_many(messages, in_flight=16) == messages
+    assert queued and memoryview not in queued
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+@pytest.mark.parametrize("mode", ["length", "line"])
+def test_backend_file_response(backend, mode, tmp_path):
+    """FileResponse отправляется через sendfile как обычный ответ"""
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"0123456789" * 50000)
+
+    def handler(data, conn):
+        if data == b"file":
+            return handlers.FileResponse(path, offset=10, count=300000)
+        return data
+
+    with running_server(backend, framing=mode, handler=handler) as srv:
+        with client.Client(port=srv.server_address[1], framing=mode, timeout=5) as conn:
+            replies = conn.send_many([b"a", b"file", b"b", b"file"], in_flight=4)
+    expected = (b"0123456789" * 50000)[10:300010]
+    assert replies == [b"a", expected, b"b", expected]
+
+# Тесты метрик сервера
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_metrics_snapshot(backend):
+    """Счетчики подключений, сообщений и байт должны совпадать с трафиком"""
+    with running_server(backend, framing="length", timeout=0.3) as srv:
+        port = srv.server_address[1]
+        with client.Client(port=port, framing="length", timeout=5) as conn:
+            assert conn.send_many([b"abc", b"defgh"], in_flight=2) == [b"abc", b"defgh"]
+            assert srv.metrics.snapshot()["connections_active"] == 1
+        # Второй клиент молчит и закрывается по тайм-ауту
+        with socket.create_connection(("127.0.0.1", port)) as idle:
+            idle.settimeout(5)
+            assert idle.recv(1) == b""
+        wait_for(lambda: srv.metrics.snapshot()["connections_closed"] == 2)
+        snap = srv.metrics.snapshot()
+    assert snap["connections_accepted"] == 2
+    assert snap["connections_active"] == 0
+    assert snap["connections_timed_out"] == 1
+    assert snap["messages"] == 2
+    assert snap["bytes_in"] == snap["bytes_out"] == 8
+    assert snap["handler_latency"]["count"] == 2
+    assert snap["messages_per_sec"] > 0
+
+def test_metrics_endpoint_prometheus_format():
+    """Метрики должны отдаваться по HTTP в текстовом формате Prometheus"""
+    with running_server("selector", framing="length", metrics_port=0) as srv:
+        with client.Client(port=srv.server_address[1], framing="length", timeout=5) as conn:
+            conn.request(b"ping")
+        url = "http://%s:%d/metrics" % srv.metrics_server.server_address[:2]
+        with urllib.request.urlopen(url, timeout=5) as response:
+            content_type = response.headers["Content-Type"]
+            text = response.read().decode("utf-8")
+    assert content_type.startswith("text/plain; version=0.0.4")
+    assert "# TYPE server_messages_total counter" in text
+    assert "server_messages_total 1" in text
+    assert "server_received_bytes_total 4" in text
+    assert 'server_handler_latency_seconds_bucket{le="+Inf"} 1' in text
+    assert "server_handler_latency_seconds_count 1" in text
+    assert "server_accept_queue_limit 64" in text
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_stage_tracing(backend):
+    """С трассировкой каждое сообщение раскладывается на этапы в гистограммах"""
+    with running_server(backend, framing="length") as srv:
+        port = srv.server_address[1]
+        assert srv.metrics.snapshot()["stages"] is None
+        srv.reconfigure(trace=True)  # Действует для новых подключений
+        with client.Client(port=port, framing="length", timeout=5) as conn:
+            assert conn.send_many([b"a", b"b", b"c"], in_flight=3) == [b"a", b"b", b"c"]
+        # Сообщение, пришедшее двумя порциями, собирается почти всю паузу между ними
+        frame = framing.make_framer("length").encode(b"abcd")
+        with socket.create_connection(("127.0.0.1", port), timeout=5) as sock:
+            sock.sendall(frame[:6])
+            time.sleep(0.1)  # Запас: сервер отмечает порцию, когда проснется ее прочитать
+            sock.sendall(frame[6:])
+            assert sock.recv(64) == frame
+        wait_for(lambda: srv.metrics.snapshot()["stages"]["total"]["count"] == 4)
+        stages = srv.metrics.snapshot()["stages"]
+        text = srv.metrics.render()
+    assert stages["first_byte"]["count"] == 2
+    assert stages["frame"]["count"] == stages["handler"]["count"] == 4
+    assert stages["send"]["count"] == 4
+    assert stages["frame"]["sum"] >= 0.05
+    assert stages["total"]["sum"] >= stages["frame"]["sum"]
+    assert 'server_stage_seconds_count{stage="handler"} 4' in text
+    assert 'server_stage_seconds_bucket{stage="total",le="+Inf"} 4' in text
+
+def test_datagram_stage_tracing():
+    """В режиме UDP трассируются обработчик и отправка ответа"""
+    with running_server(server.DATAGRAM, trace=True) as srv:
+        with client.DatagramClient(port=srv.server_address[1], timeout=5) as conn:
+            assert conn.request(b"ping") == b"ping"
+        wait_for(lambda: srv.metrics.snapshot()["stages"]["total"]["count"] == 1)
+        stages = srv.metrics.snapshot()["stages"]
+    assert stages["handler"]["count"] == stages["send"]["count"] == 1
+    assert stages["first_byte"]["count"] == stages["frame"]["count"] == 0
+
+def test_profiler_writes_folded_stacks(tmp_path):
+    """Профиль - свернутые стеки всех потоков, одновременно идет один снимок"""
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            sum(range(1000))
+
+    worker = threading.Thread(target=busy_worker, name="busy", daemon=True)
+    worker.start()
+    profiler = profiling.Profiler(tmp_path, seconds=0.2, interval=0.005)
+    try:
+        path = profiler.start()
+        assert profiler.start() is None
+        profiler.join(timeout=5)
+    finally:
+        stop.set()
+        worker.join()
+    lines = open(path, encoding="utf-8").read().splitlines()
+    assert lines and all(re.fullmatch(r".+ \d+", line) for line in lines)
+    assert any(line.startswith("busy;") and "busy_worker (" in line for line in lines)
+    assert not any(line.startswith("profiler;") for line in lines)
+
+@pytest.mark.skipif(not hasattr(signal, "SIGUSR1"), reason="нет SIGUSR1")
+def test_server_dumps_profile_on_request(tmp_path):
+    """server.py --dump-profile PID снимает профиль работающего сервера без перезапуска"""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.Popen(
+        [sys.executable, "server.py", "--host", "127.0.0.1", "--port", "0",
+         "--profile-dir", str(tmp_path), "--profile-seconds", "0.2"],
+        cwd=cwd, stderr=subprocess.PIPE, text=True)
+    try:
+        for line in proc.stderr:
+            if "слушает порт" in line:
+                break
+        subprocess.run([sys.executable, "server.py", "--dump-profile", str(proc.pid)],
+                       cwd=cwd, check=True, timeout=20)
+        wait_for(lambda: any(tmp_path.glob("profile-*.folded")), timeout=10)
+        assert proc.poll() is None
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=20) == 0
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+def test_accept_queue_metric():
+    """Длина очереди accept видна по подключениям, которые сервер еще не принял"""
+    srv = server.create_server_socket("127.0.0.1", 0, backlog=8)
+    stats = metrics.ServerMetrics(backlog=8)
+    stats.listen_socket = srv
+    clients = [socket.create_connection(srv.getsockname()) for _ in range(3)]
+    try:
+        queue = stats.snapshot()["accept_queue"]
+        if metrics.accept_queue(srv) is None:
+            pytest.skip("ОС не сообщает длину очереди accept")
+        assert queue["length"] == 3
+        assert queue["limit"] == 8
+        assert queue["saturation"] == pytest.approx(3 / 8)
+    finally:
+        for sock in clients:
+            sock.close()
+        srv.close()
+
+def test_histogram_quantiles():
+    """Квантиль оценивается верхней границей корзины"""
+    hist = metrics.Histogram((0.1, 1.0))
+    for value in (0.05, 0.05, 0.5, 5.0):
+        hist.observe(value)
+    assert hist.cumulative() == [(0.1, 2), (1.0, 3), (float("inf"), 4)]
+    assert hist.quantile(0.5) == 0.1
+    assert hist.quantile(0.75) == 1.0
+    assert hist.quantile(1.0) == float("inf")
+
+# Тесты сжатия сообщений
+TEXT = "Съешь же ещё этих мягких французских булок, да выпей чаю. ".encode("utf-8") * 200
+
+@pytest.mark.parametrize("name", compression.ALGORITHMS)
+def test_codec_roundtrip_and_threshold(name):
+    """Короткие сообщения не сжимаются, длинные сжимаются и восстанавливаются"""
+    sender = compression.make_codec(name, min_size=100)
+    receiver = compression.make_codec(name, min_size=100)
+    short = sender.encode(b"hi")
+    assert short == compression.PLAIN + b"hi"
+    first = sender.encode(TEXT)
+    second = sender.encode(TEXT)
+    assert first[:1] == compression.COMPRESSED and len(first) < len(TEXT) // 10
+    if name == "zlib":
+        # Общий контекст: повтор предыдущего сообщения сжимается почти в ноль
+        assert len(second) < len(first)
+    assert [receiver.decode(m) for m in (short, first, second)] == [b"hi", TEXT, TEXT]
+
+def test_codec_rejects_bad_data():
+    """Испорченные данные и слишком большой результат распаковки - ошибка формата"""
+    codec = compression.make_codec("zlib", max_size=1000)
+    with pytest.raises(framing.FrameError):
+        codec.decode(b"\x07abc")
+    bomb = compression.make_codec("zlib").encode(b"\0" * 100000)
+    with pytest.raises(framing.FrameTooLarge):
+        codec.decode(bomb)
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+@pytest.mark.parametrize("name", compression.ALGORITHMS)
+def test_backend_negotiated_compression(backend, name):
+    """Клиент и сервер договариваются о сжатии и обмениваются сжатыми сообщениями"""
+    with running_server(backend, framing="length") as srv:
+        port = srv.server_address[1]
+        messages = [TEXT, b"short", TEXT + b"!", b""]
+        with client.Client(port=port, framing="length", timeout=5, compression=name) as conn:
+            assert conn.codec.name == name
+            assert conn.send_many(messages, in_flight=4) == messages
+            assert conn.request(TEXT) == TEXT
+        # Сжатый ответ на проводе заметно меньше исходного сообщения
+        with socket.create_connection(("127.0.0.1", port)) as sock:
+            sock.settimeout(5)
+            raw = framing.make_framer("length")
+            sock.sendall(raw.encode(compression.offer([name])))
+            codec = compression.make_codec(name)
+            sock.sendall(raw.encode(codec.encode(TEXT)))
+            frames = []
+            while len(frames) < 2:
+                frames.extend(raw.feed(sock.recv(framing.READ_SIZE)))
+        assert frames[0] == compression.ANSWER + name.encode("ascii")
+        assert len(frames[1]) < len(TEXT) // 10
+        assert codec.decode(frames[1]) == TEXT
+
+def test_compression_interoperability():
+    """Без предложения сжатия сервер работает как раньше; сервер может отказаться"""
+    with running_server("selector", framing="length", compression="none") as srv:
+        with client.Client(port=srv.server_address[1], framing="length", timeout=5,
+                           compression="zlib") as conn:
+            assert conn.codec is None
+            assert conn.request(TEXT) == TEXT
+
+    async def scenario(port):
+        async with client.AsyncClient(port=port, framing="length",
+                                      compression=("lzma", "zlib")) as conn:
+            assert conn.codec.name == "lzma"
+            return await conn.send_many([TEXT, b"x"], in_flight=2)
+
+    with running_server("asyncio", framing="length") as srv:
+        assert asyncio.run(scenario(srv.server_address[1])) == [TEXT, b"x"]
+    with pytest.raises(ValueError):
+        client.Client(framing="line", compression="zlib")
+
+    # Сервер в режиме raw ничего не знает о сжатии и возвращает предложение эхом
+    with running_server("threads") as srv:
+        with client.Client(port=srv.server_address[1], framing="length", timeout=5,
+                           compression="zlib") as conn:
+            assert conn.codec is None
+            assert conn.request(TEXT) == TEXT
+
+
+# Тесты кэша ответов
+def test_response_cache_lru_ttl_and_size(monkeypatch):
+    """Кэш вытесняет давно не использованные ответы и забывает устаревшие"""
+    calls = []
+
+    def upper(data):
+        calls.append(bytes(data))
+        return bytes(data).upper()
+
+    entry = 100 + handlers.CACHE_ENTRY_OVERHEAD
+    cache = handlers.ResponseCache(upper, max_bytes=2 * entry, ttl=10)
+    a, b, c = b"a" * 100, b"b" * 100, b"c" * 100
+    assert cache(a, None) == a.upper()
+    assert cache(memoryview(b), None) == b.upper()
+    assert cache(a, None) == a.upper()          # Попадание, "a" становится свежее "b"
+    assert cache(c, None) == c.upper()          # Вытесняет "b"
+    assert cache(b, None) == b.upper()
+    assert calls == [a, b, c, b]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 4, 2)
+    assert stats["entries"] == 2 and stats["bytes"] == 2 * entry
+
+    # По истечении ttl ответ считается заново
+    now = time.monotonic()
+    monkeypatch.setattr(handlers.time, "monotonic", lambda: now + 11)
+    assert cache(b, None) == b.upper()
+    assert cache.stats()["expirations"] == 1
+    assert calls[-1] == b
+
+    # Ответ больше всего кэша не сохраняется
+    assert cache(b"x" * 1000, None) == b"X" * 1000
+    assert cache.stats()["entries"] <= 2
+
+def test_response_cache_future_results():
+    """Ответы, посчитанные в другом потоке, тоже попадают в кэш"""
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(1) as pool:
+        cache = handlers.ResponseCache(lambda data, conn: pool.submit(bytes, data), 1 << 20)
+        assert cache(b"slow", None).result() == b"slow"
+        assert cache(b"slow", None) == b"slow"
+    assert cache.stats()["hits"] == 1
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_cacheable_handler(backend):
+    """Повторные сообщения обслуживаются из кэша без вызова обработчика"""
+    calls = []
+
+    @handlers.cacheable
+    def expensive(data):
+        calls.append(bytes(data))
+        return bytes(data)[::-1]
+
+    with running_server(backend, framing="length", handler=expensive,
+                        cache_bytes=1 << 20, zero_copy=True) as srv:
+        with client.Client(port=srv.server_address[1], framing="length", timeout=5) as conn:
+            replies = conn.send_many([b"abc", b"xyz", b"abc", b"abc"], in_flight=4)
+        snap = srv.metrics.snapshot()
+    assert replies == [b"cba", b"zyx", b"cba", b"cba"]
+    assert calls == [b"abc", b"xyz"]
+    assert snap["cache"]["hits"] == 2
+    assert snap["cache"]["misses"] == 2
+
+def test_cache_requires_cacheable_handler(caplog):
+    """Обработчик без пометки cacheable не кэшируется"""
+    with running_server("selector", cache_bytes=1 << 20) as srv:
+        assert not isinstance(srv.handler, handlers.ResponseCache)
+        assert srv.metrics.snapshot()["cache"] is None
+    assert "не помечен как cacheable" in caplog.text
+    pipeline = handlers.Pipeline(handlers.cacheable(lambda data: data), [handlers.Checksum()])
+    assert pipeline.cacheable
+
+# Тесты ограничения нагрузки
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_max_connections(backend):
+    """Подключения сверх лимита сразу получают ошибку и закрываются"""
+    with running_server(backend, framing="length", max_connections=2) as srv:
+        port = srv.server_address[1]
+        first = client.Client(port=port, framing="length", timeout=5)
+        second = client.Client(port=port, framing="length", timeout=5)
+        first.connect()
+        second.connect()
+        assert first.request(b"1") == b"1"
+        assert second.request(b"2") == b"2"
+        with client.Client(port=port, framing="length", timeout=5) as third:
+            assert third.recv() == framing.BUSY_MESSAGE
+            with pytest.raises(ConnectionError):
+                third.recv()
+        assert srv.metrics.snapshot()["connections_rejected"] == 1
+        # Освободившееся место снова доступно
+        first.close()
+        wait_for(lambda: srv.metrics.snapshot()["connections_active"] == 1)
+        assert request_with_retry(port, b"3") == b"3"
+        second.close()
+
+@pytest.mark.parametrize("backend", ["selector", "asyncio"])
+def test_backend_pauses_reading_slow_client(backend):
+    """Сервер перестает читать от клиента, который не забирает ответы"""
+    with running_server(backend, framing="length", high_water=64 * 1024,
+                        low_water=16 * 1024) as srv:
+        encoder = framing.make_framer("length")
+        message = b"z" * 32 * 1024
+        count = 256  # 8 МБ запросов - больше буферов сокетов
+        with socket.create_connection(srv.server_address) as sock:
+            sock.settimeout(10)
+            sender = threading.Thread(
+                target=sock.sendall, args=(encoder.encode(message) * count,), daemon=True)
+            sender.start()
+            wait_for(lambda: srv.metrics.snapshot()["read_pauses"] > 0)
+            # Клиент начинает читать - сервер досылает ответы и читает дальше
+            replies = []
+            while len(replies) < count:
+                replies.extend(encoder.feed(sock.recv(framing.READ_SIZE)))
+            sender.join(timeout=5)
+    assert replies == [message] * count
+
+# Тесты многопроцессного режима
+def request_with_retry(port, message, timeout=5):
+    """Запрос к серверу, который мог еще не открыть порт"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with client.Client(port=port, framing="length", timeout=5) as conn:
+                return conn.request(message)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+@pytest.mark.parametrize("reuse_port", [True, False])
+def test_supervisor_restarts_crashed_worker(reuse_port):
+    """Супервизор перезапускает упавший процесс и останавливает все по shutdown()"""
+    sup = server.Supervisor("selector", processes=2, host="127.0.0.1", port=0,
+                            reuse_port=reuse_port, framing="length", timeout=2.0)
+    thread = threading.Thread(target=sup.serve_forever, daemon=True)
+    thread.start()
+    try:
+        port = sup.server_address[1]
+        assert request_with_retry(port, b"hello") == b"hello"
+        wait_for(lambda: len(sup.workers) == 2)
+        crashed = sup.workers[0]
+        os.kill(crashed.pid, signal.SIGKILL)
+        wait_for(lambda: sup.workers[0] is not crashed and sup.workers[0].is_alive())
+        for i in range(20):
+            assert request_with_retry(port, b"msg %d" % i) == b"msg %d" % i
+        workers = list(sup.workers.values())
+    finally:
+        sup.shutdown()
+        thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert [w.exitcode for w in workers] == [0, 0], "Процессы должны завершиться штатно"
+
+def test_supervisor_workers_start_without_fork(monkeypatch):
+    """Обработчик из load_handler передается в процесс и при запуске через spawn"""
+    handler = handlers.load_handler("server:do_something")
+    assert server.MP_CONTEXT.get_start_method() == "fork"
+    monkeypatch.setattr(server, "MP_CONTEXT", server.multiprocessing.get_context("spawn"))
+    sup = server.Supervisor("selector", processes=1, host="127.0.0.1", port=0,
+                            reuse_port=False, handler=handler, framing="length",
+                            timeout=2.0)
+    thread = threading.Thread(target=sup.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert request_with_retry(sup.server_address[1], b"hello") == b"hello"
+        worker = sup.workers[0]
+    finally:
+        sup.shutdown()
+        thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert worker.exitcode == 0
+
+def test_as_handler_result_is_picklable(monkeypatch):
+    """Обертка над func(data) переносит пометки функции и переживает pickle"""
+    monkeypatch.setattr(do_something, "cacheable", True, raising=False)
+    wrapped = handlers.as_handler(do_something)
+    restored = pickle.loads(pickle.dumps(wrapped))
+    assert restored.__name__ == "do_something"
+    assert restored.cacheable
+    assert restored(b"hi", None) == do_something(b"hi")
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_server_stops_on_sigterm(processes):
+    """Сервер, запущенный из командной строки, штатно завершается по SIGTERM"""
+    proc = subprocess.Popen(
+        [sys.executable, "server.py", "--host", "127.0.0.1", "--port", "0",
+         "--backend", "selector", "--framing", "length", "--processes", str(processes)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stderr=subprocess.PIPE, text=True)
+    try:
+        port = None
+        for line in proc.stderr:
+            found = re.search(r"(?:слушает порт|на порту) (\d+)", line)
+            if found:
+                port = int(found.group(1))
+                break
+        assert port, "Сервер должен сообщить свой порт"
+        assert request_with_retry(port, b"ping") == b"ping"
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=10) == 0
+        assert "завершил работу" in proc.stderr.read()
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
+# Тесты тайм-аутов
+def test_timer_wheel():
+    """Колесо таймеров снимает истекшие таймеры и учитывает перевзвод и отмену"""
+    from timers import TimerWheel
+    wheel = TimerWheel(tick=0.1, slots=8, now=100.0)
+    wheel.schedule("a", 100.25, "idle")
+    wheel.schedule("b", 100.25, "read")
+    wheel.schedule("c", 100.55, "write")
+    wheel.schedule("a", 101.05, "idle")     # Позже: запись остается на месте
+    wheel.schedule("c", 100.15, "write")    # Раньше: запись перекладывается
+    wheel.schedule("d", 100.15)
+    wheel.cancel("d")
+    assert len(wheel) == 3
+    assert wheel.advance(100.2) == [("c", "write")]
+    assert wheel.advance(100.5) == [("b", "read")]
+    assert wheel.advance(100.9) == []
+    wheel.schedule("e", 102.0, "handshake")  # Дальше оборота колеса
+    assert wheel.advance(101.2) == [("a", "idle")]
+    assert wheel.advance(105.0) == [("e", "handshake")]
+    assert len(wheel) == 0 and wheel.next_tick() is None
+
+def closed_by_server(sock, timeout=5):
+    """Ждет, пока сервер закроет подключение; возвращает, сколько это заняло"""
+    begin = time.monotonic()
+    sock.settimeout(timeout)
+    try:
+        while sock.recv(65536):
+            pass
+    except ConnectionResetError:
+        pass
+    return time.monotonic() - begin
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_separate_timeouts(backend):
+    """Тайм-ауты первого сообщения, паузы в сообщении и простоя действуют раздельно"""
+    with running_server(backend, framing="length", timeout=5, handshake_timeout=0.3,
+                        read_timeout=0.3, idle_timeout=0) as srv:
+        port = srv.server_address[1]
+        with socket.create_connection(("127.0.0.1", port)) as silent:
+            assert closed_by_server(silent) < 2
+        with client.Client(port=port, framing="length", timeout=5) as conn:
+            assert conn.request(b"hello") == b"hello"
+            time.sleep(0.6)  # Простой между сообщениями не ограничен
+            assert conn.request(b"again") == b"again"
+            conn.sock.sendall(framing.HEADER.pack(10) + b"abc")  # Сообщение не дослано
+            assert closed_by_server(conn.sock) < 2
+        wait_for(lambda: srv.metrics.snapshot()["connections_active"] == 0)
+        snapshot = srv.metrics.snapshot()
+        assert snapshot["timeouts"] == {"handshake": 1, "read": 1, "idle": 0, "write": 0}
+        assert snapshot["connections_timed_out"] == 2
+        assert 'server_connection_timeouts_total{kind="read"} 1' in srv.metrics.render()
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_write_timeout(backend):
+    """Клиент, который не забирает ответы, отключается по write-тайм-ауту"""
+    big = b"x" * (4 * 1024 * 1024)
+    with running_server(backend, framing="length", timeout=5, write_timeout=0.3,
+                        handler=lambda data: big) as srv:
+        with socket.create_connection(srv.server_address[:2]) as sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+            sock.sendall(b"".join(framing.make_framer("length").encode(b"go") for _ in range(4)))
+            wait_for(lambda: srv.metrics.snapshot()["timeouts"]["write"] == 1)
+
+# Тесты плавной остановки и перечитывания настроек
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_drain_finishes_requests(backend):
+    """При остановке с drain сервер отвечает на начатые запросы и закрывает простаивающие подключения"""
+    started = threading.Event()
+
+    def slow(data):
+        if data == b"slow":
+            started.set()
+            time.sleep(0.3)
+        return data
+
+    srv = server.make_server(backend, host="127.0.0.1", port=0, workers=4, framing="length",
+                             handler=slow, timeout=5, drain_timeout=5)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    port = srv.server_address[1]
+    with client.Client(port=port, framing="length", timeout=5) as idle, \
+            client.Client(port=port, framing="length", timeout=5) as busy:
+        assert idle.request(b"hello") == b"hello"
+        busy.send(b"slow")
+        assert started.wait(5)
+        begin = time.monotonic()
+        srv.shutdown(drain=True)
+        assert busy.recv() == b"slow", "Начатый запрос должен получить ответ"
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+        assert time.monotonic() - begin < 2, "Сервер не должен ждать drain_timeout без нужды"
+        for conn in (idle, busy):
+            with pytest.raises(OSError):
+                conn.request(b"after")
+    with pytest.raises(OSError):
+        socket.create_connection(("127.0.0.1", port), timeout=1)
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_drain_deadline(backend):
+    """Подключение, которое не дослало сообщение, закрывается по истечении drain_timeout"""
+    with running_server(backend, framing="length", timeout=5, drain_timeout=0.3) as srv:
+        with socket.create_connection(srv.server_address[:2], timeout=5) as sock:
+            sock.sendall(framing.HEADER.pack(16) + b"abc")  # Начало сообщения
+            wait_for(lambda: srv.metrics.snapshot()["connections_active"] == 1)
+            # Начало, которое сервер не успел прочитать до остановки, не считается начатым сообщением
+            time.sleep(0.2)
+            begin = time.monotonic()
+            srv.shutdown(drain=True)
+            try:
+                data = sock.recv(1)
+            except ConnectionResetError:
+                data = b""
+            assert data == b""
+            assert 0.25 <= time.monotonic() - begin < 3
+
+@pytest.mark.parametrize("backend", server.BACKENDS)
+def test_backend_reconfigure_keeps_connections(backend, tmp_path):
+    """Новые обработчик и лимиты действуют без разрыва открытых подключений"""
+    with running_server(backend, framing="length") as srv:
+        port = srv.server_address[1]
+        with client.Client(port=port, framing="length", timeout=5) as conn:
+            assert conn.request(b"abc") == b"abc"
+            srv.reconfigure(handler=lambda data: bytes(data).upper(), timeout=10,
+                            max_connections=1)
+            assert conn.request(b"abc") == b"ABC"
+            with client.Client(port=port, framing="length", timeout=5) as other:
+                assert other.recv() == framing.BUSY_MESSAGE
+        with pytest.raises(ValueError):
+            srv.reconfigure(backlog=10)
+
+    config = tmp_path / "server.json"
+    config.write_text('{"timeout": 0, "max_connections": 10}')
+    assert server.read_config(config) == {"timeout": None, "max_connections": 10}
+    config.write_text('{"port": 1}')
+    with pytest.raises(ValueError):
+        server.read_config(config)
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_server_reloads_on_sighup(processes, tmp_path):
+    """По SIGHUP сервер перечитывает модуль обработчика и файл настроек"""
+    module = tmp_path / "reloadable.py"
+    module.write_text("def handle(data):\n    return b'v1:' + data\n")
+    config = tmp_path / "server.json"
+    config.write_text('{"timeout": 0}')
+    env = dict(os.environ, PYTHONPATH=str(tmp_path))
+    proc = subprocess.Popen(
+        [sys.executable, "server.py", "--host", "127.0.0.1", "--port", "0",
+         "--backend", "selector", "--framing", "length", "--processes", str(processes),
+         "--handler", "reloadable:handle", "--config", str(config)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stderr=subprocess.PIPE, text=True, env=env)
+    try:
+        port = None
+        for line in proc.stderr:
+            found = re.search(r"(?:слушает порт|на порту) (\d+)", line)
+            if found:
+                port = int(found.group(1))
+                break
+        assert port, "Сервер должен сообщить свой порт"
+        assert request_with_retry(port, b"ping") == b"v1:ping"
+        module.write_text("def handle(data):\n    return b'version2:' + data\n")
+        proc.send_signal(signal.SIGHUP)
+        wait_for(lambda: request_with_retry(port, b"ping") == b"version2:ping")
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=20) == 0
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+
 # Тест подключения клиента к серверу
 @patch('builtins.input', return_value='Test message')
 def test_client_connection(mock_input, mock_server_fixture):
@@ -196,7 +1431,7 @@ def test_client_connection(mock_input, mock_server_fixture):
     captured_output = io.StringIO()
     
     with redirect_stdout(captured_output):
-        start_client()
+        start_client(port=mock_server_fixture.port)
     
     output = captured_output.getvalue()
     
@@ -213,7 +1448,7 @@ def test_client_empty_message(mock_input, mock_server_fixture):
     captured_output = io.StringIO()
     
     with redirect_stdout(captured_output):
-        start_client()
+        start_client(port=mock_server_fixture.port)
     
     output = captured_output.getvalue()
     
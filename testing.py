@@ -0,0 +1,136 @@
+#вспомогательные средства для тестов:
+"""Серверы и клиенты для тестов без фиксированных портов и пауз.
+
+Все серверы слушают порт 0 (любой свободный), поэтому тесты можно
+запускать параллельно, в том числе через pytest-xdist. Готовность
+сервера ожидается по событию, а не паузой. handler_client() проверяет
+обработчик через socket.socketpair(), минуя сетевой стек.
+"""
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import client
+import server
+
+HOST = "127.0.0.1"
+START_TIMEOUT = 5  # Сколько ждать запуска сервера, секунд
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Условие не выполнилось вовремя"
+        time.sleep(0.01)
+
+
+@contextmanager
+def running_server(backend="threads", **kwargs):
+    """Запускает настоящий сервер из server.py в этом процессе на свободном порту."""
+    kwargs.setdefault("host", HOST)
+    kwargs.setdefault("timeout", 2.0)
+    kwargs.setdefault("workers", 4)
+    srv = server.make_server(backend, port=0, backlog=64, **kwargs)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    try:
+        assert srv.ready.wait(START_TIMEOUT), "Сервер не запустился"
+        yield srv
+    finally:
+        srv.shutdown()
+        thread.join(timeout=5)
+
+
+@contextmanager
+def handler_client(handler=server.do_something, framing="length", timeout=5,
+                   compression=None, **kwargs):
+    """Клиент, подключенный к обработчику через socket.socketpair().
+
+    Подключение обслуживает ThreadPoolServer в отдельном потоке так же,
+    как подключение из сети; kwargs - прочие настройки сервера.
+    """
+    srv = server.ThreadPoolServer(host=HOST, port=0, handler=handler, framing=framing,
+                                  timeout=timeout, **kwargs)
+    ours, theirs = socket.socketpair()
+    thread = threading.Thread(target=srv.serve_connection, args=(theirs, "socketpair"),
+                              daemon=True)
+    thread.start()
+    conn = client.Client(framing=framing, timeout=timeout, compression=compression)
+    try:
+        yield conn.connect(ours)
+    finally:
+        conn.close()
+        thread.join(timeout=5)
+        srv.server_close()
+
+
+class MockServer(threading.Thread):
+    """Мок-сервер для тестирования клиента: отвечает эхом на первую порцию данных"""
+
+    def __init__(self, host=HOST, port=0):
+        super().__init__(daemon=True)
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((host, port))
+        self.server_socket.listen(5)
+        self.host, self.port = self.server_socket.getsockname()[:2]
+        self.running = False
+        self.client_socket = None
+        self.ready = threading.Event()
+
+    def run(self):
+        self.running = True
+        self.server_socket.settimeout(1)
+        self.ready.set()
+
+        while self.running:
+            try:
+                self.client_socket, _ = self.server_socket.accept()
+                data = self.client_socket.recv(1024)
+                if data:
+                    # Эхо-ответ
+                    self.client_socket.sendall(data)
+                self.client_socket.close()
+            except socket.timeout:
+                continue
+            except Exception as e:
+                if self.running:
+                    print(f"Ошибка в мок-сервере: {e}")
+                break
+
+    def start(self):
+        super().start()
+        self.ready.wait(START_TIMEOUT)
+
+    def stop(self):
+        self.running = False
+        # Будим accept() пустым подключением, чтобы не ждать тайм-аута
+        try:
+            socket.create_connection((self.host, self.port), timeout=1).close()
+        except OSError:
+            pass
+        if self.client_socket:
+            self.client_socket.close()
+        self.server_socket.close()
+
+
+class MockClient(threading.Thread):
+    """Мок-клиент для тестирования сервера"""
+
+    def __init__(self, port, message="Test message", host=HOST):
+        super().__init__()
+        self.host = host
+        self.port = port
+        self.message = message
+        self.response = None
+        self.error = None
+
+    def run(self):
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.connect((self.host, self.port))
+                sock.sendall(self.message.encode('utf-8'))
+                self.response = sock.recv(1024).decode('utf-8')
+        except Exception as e:
+            self.error = str(e)
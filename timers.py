@@ -0,0 +1,102 @@
+#колесо таймеров для тайм-аутов подключений:
+"""Тайм-ауты множества подключений на одном колесе таймеров.
+
+Колесо - кольцо из slots ячеек по tick секунд; таймер лежит в ячейке,
+на которую приходится его срок. advance(now) обходит ячейки, время
+которых прошло, и возвращает истекшие таймеры. Перевзвод на более
+поздний срок (самый частый случай: от клиента пришли данные) только
+меняет срок в записи, а в нужную ячейку запись перекладывается, когда
+до нее дойдет очередь. Поэтому сотня тысяч подключений стоит одного
+словаря, а не отдельного таймера на каждый сокет.
+"""
+import threading
+import time
+
+# Виды тайм-аутов подключения
+TIMEOUTS = ("handshake", "read", "idle", "write")
+
+TICK = 0.1    # Точность срабатывания, секунд
+SLOTS = 512   # Ячеек в колесе (оборот - SLOTS * TICK секунд)
+
+
+class TimerWheel:
+    """Таймеры с ключами (например, подключениями); методы можно вызывать из любых потоков."""
+
+    def __init__(self, tick=TICK, slots=SLOTS, now=None):
+        self.tick = tick
+        self._slots = [set() for _ in range(slots)]
+        self._timers = {}  # ключ -> [срок, вид, номер тика ячейки, в которой лежит]
+        self._current = int((time.monotonic() if now is None else now) / tick)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._timers)
+
+    def schedule(self, key, deadline, kind=None):
+        """Взводит (или перевзводит) таймер key на момент deadline по time.monotonic()."""
+        slot = max(int(deadline / self.tick), self._current)
+        with self._lock:
+            timer = self._timers.get(key)
+            if timer is not None:
+                timer[0], timer[1] = deadline, kind
+                if slot >= timer[2]:
+                    return  # Запись переложим, когда дойдем до ее ячейки
+                self._slots[timer[2] % len(self._slots)].discard(key)
+                timer[2] = slot
+            else:
+                self._timers[key] = [deadline, kind, slot]
+            self._slots[slot % len(self._slots)].add(key)
+
+    def cancel(self, key):
+        with self._lock:
+            timer = self._timers.pop(key, None)
+            if timer is not None:
+                self._slots[timer[2] % len(self._slots)].discard(key)
+
+    def advance(self, now=None):
+        """Снимает истекшие к моменту now таймеры и возвращает их как [(ключ, вид)]."""
+        if now is None:
+            now = time.monotonic()
+        end = int(now / self.tick)
+        expired = []
+        with self._lock:
+            # После долгой паузы достаточно обойти каждую ячейку один раз
+            start = max(self._current, end - len(self._slots))
+            for tick in range(start, end):
+                cell = self._slots[tick % len(self._slots)]
+                for key in list(cell):
+                    timer = self._timers[key]
+                    if timer[0] <= now:
+                        cell.discard(key)
+                        del self._timers[key]
+                        expired.append((key, timer[1]))
+                    elif timer[2] <= tick:
+                        # Срок отодвинули: перекладываем в его ячейку
+                        cell.discard(key)
+                        timer[2] = max(int(timer[0] / self.tick), end)
+                        self._slots[timer[2] % len(self._slots)].add(key)
+            self._current = max(self._current, end)
+        return expired
+
+    def next_tick(self):
+        """Через сколько секунд вызвать advance() или None, если таймеров нет."""
+        if not self._timers:
+            return None
+        return max(0.0, (self._current + 1) * self.tick - time.monotonic())
+
+
+def deadline(timeouts, connected, last_activity, greeted, partial):
+    """Какой тайм-аут чтения ждет подключение: (вид, срок) или None.
+
+    timeouts - словарь вид -> секунды (None - без ограничения). До первого
+    сообщения действует handshake (от момента подключения), пока сообщение
+    не дослано - read, между сообщениями - idle (оба от последних данных).
+    """
+    if not greeted:
+        kind, anchor = "handshake", connected
+    elif partial:
+        kind, anchor = "read", last_activity
+    else:
+        kind, anchor = "idle", last_activity
+    timeout = timeouts[kind]
+    return None if timeout is None else (kind, anchor + timeout)
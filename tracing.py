@@ -0,0 +1,70 @@
+#трассировка этапов обработки сообщений:
+"""Время каждого этапа жизни сообщения на сервере (включается trace=True).
+
+Этапы (STAGES):
+
+- first_byte - от accept до первого байта подключения;
+- frame - от первого байта сообщения до получения его целиком;
+- handler - работа обработчика;
+- send - от ответа обработчика до его передачи в сокет;
+- total - от первого байта сообщения до отправки ответа.
+
+Отметки ставит цикл сервера через ConnectionTrace, а длительности
+складываются в гистограммы ServerMetrics по этапам. Так видно, где
+теряется пропускная способность: в приеме, сборке сообщений,
+обработчике или отправке.
+"""
+import time
+from collections import deque
+
+STAGES = ("first_byte", "frame", "handler", "send", "total")
+
+
+class ConnectionTrace:
+    """Отметки времени сообщений одного подключения.
+
+    Порядок вызовов: received() после каждой порции данных, framed() на
+    каждое собранное сообщение, handled() на каждый ответ обработчика (в
+    порядке сообщений), sent() когда ответы ушли в сокет и settled()
+    после разбора порции.
+    """
+
+    __slots__ = ("metrics", "accepted", "_chunk", "_partial_since", "_begins", "_waiting")
+
+    def __init__(self, metrics, accepted=None):
+        self.metrics = metrics
+        self.accepted = time.perf_counter() if accepted is None else accepted
+        self._chunk = None          # Когда пришла текущая порция данных
+        self._partial_since = None  # Когда пришел первый байт недособранного сообщения
+        self._begins = deque()      # Первые байты сообщений, ждущих ответа обработчика
+        self._waiting = []          # (первый байт, ответ готов) для ответов, ждущих отправки
+
+    def received(self, now):
+        if self.accepted is not None:
+            self.metrics.stage("first_byte", now - self.accepted)
+            self.accepted = None
+        self._chunk = now
+        if self._partial_since is None:
+            self._partial_since = now
+
+    def framed(self, now):
+        self.metrics.stage("frame", now - self._partial_since)
+        self._begins.append(self._partial_since)
+        self._partial_since = self._chunk  # Следующее сообщение начинается в этой же порции
+
+    def settled(self, pending):
+        """Порция разобрана; pending - сколько байт недособранного сообщения осталось."""
+        if not pending:
+            self._partial_since = None
+
+    def handled(self, latency):
+        self.metrics.stage("handler", latency)
+        begin = self._begins.popleft() if self._begins else None
+        self._waiting.append((begin, time.perf_counter()))
+
+    def sent(self, now):
+        for begin, done in self._waiting:
+            self.metrics.stage("send", now - done)
+            if begin is not None:
+                self.metrics.stage("total", now - begin)
+        self._waiting.clear()
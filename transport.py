@@ -0,0 +1,131 @@
+#адреса и сокеты: TCP по IPv4/IPv6 и Unix-сокеты:
+"""Разбор адресов и создание сокетов для сервера, клиента и нагрузочного теста.
+
+Адрес, как и раньше, задается парой host, port. Хост вида
+"unix:/path.sock" означает Unix-сокет (порт не используется): клиенты
+на той же машине обходят стек TCP и получают меньшую задержку и
+большую пропускную способность. Хост с двоеточием ("::", "::1",
+"[::1]") - адрес IPv6, остальные - IPv4 или имя.
+"""
+import asyncio
+import os
+import socket
+import stat
+
+UNIX_PREFIX = "unix:"
+MAX_DATAGRAM = 65507  # Наибольшая датаграмма UDP по IPv4, байт
+
+
+def unix_path(host):
+    """Путь Unix-сокета из адреса "unix:/path.sock" или None для сетевого адреса."""
+    if isinstance(host, str) and host.startswith(UNIX_PREFIX):
+        return host[len(UNIX_PREFIX):]
+    return None
+
+
+def resolve(host, port):
+    """Возвращает семейство сокета и адрес для bind()/connect()."""
+    path = unix_path(host)
+    if path is not None:
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix-сокеты в этой ОС не поддерживаются")
+        if not path:
+            raise ValueError("Не указан путь Unix-сокета")
+        return socket.AF_UNIX, path
+    host = host.strip("[]")
+    if ":" in host:
+        return socket.AF_INET6, (host, port)
+    return socket.AF_INET, (host, port)
+
+
+def is_inet(sock):
+    return sock.family in (socket.AF_INET, socket.AF_INET6)
+
+
+def describe(address):
+    """Адрес слушающего сокета для журнала: "порт 33333" или "unix:/path.sock"."""
+    if isinstance(address, tuple):
+        return f"порт {address[1]}"
+    return UNIX_PREFIX + (os.fsdecode(address) if address else "")
+
+
+def format_address(address):
+    """Адрес подключения в виде "127.0.0.1:33333", "[::1]:33333" или "unix:/path.sock"."""
+    if isinstance(address, tuple):
+        host, port = address[:2]
+        return f"[{host}]:{port}" if ":" in host else f"{host}:{port}"
+    return describe(address)
+
+
+def _remove_stale(path, type):
+    """Удаляет файл Unix-сокета, оставшийся от упавшего сервера."""
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        return  # Чужой файл не трогаем: bind() сообщит об ошибке
+    with socket.socket(socket.AF_UNIX, type) as probe:
+        try:
+            probe.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)  # Никто не слушает
+        except OSError:
+            pass
+        # Если подключиться удалось, сокет занят, и bind() сообщит об ошибке
+
+
+def remove_unix_socket(path):
+    """Удаляет файл Unix-сокета после остановки сервера."""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def create_listener(host, port, backlog, reuse_port=False, listen=True, type=socket.SOCK_STREAM):
+    """Создает слушающий сокет для адреса любого вида.
+
+    С reuse_port на тот же порт могут встать сокеты других процессов
+    (SO_REUSEPORT); для Unix-сокетов он не действует - процессы делят
+    один сокет. Сокет датаграмм (type=SOCK_DGRAM) только привязывается к адресу.
+    """
+    family, address = resolve(host, port)
+    sock = socket.socket(family, type)
+    try:
+        if family == socket.AF_UNIX:
+            _remove_stale(address, type)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(address)
+        if listen and type == socket.SOCK_STREAM:
+            sock.listen(backlog)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def connect(host, port, timeout=None):
+    """Подключается к серверу по адресу любого вида."""
+    family, address = resolve(host, port)
+    if family != socket.AF_UNIX:
+        return socket.create_connection(address, timeout)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(timeout)
+        sock.connect(address)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+async def open_connection(host, port, **kwargs):
+    """asyncio.open_connection() для адреса любого вида."""
+    family, address = resolve(host, port)
+    if family == socket.AF_UNIX:
+        return await asyncio.open_unix_connection(address, **kwargs)
+    return await asyncio.open_connection(*address, **kwargs)